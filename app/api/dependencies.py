@@ -3,20 +3,22 @@ Dependencies para la API de QueVendí
 Contiene funciones reutilizables para endpoints
 """
 
-from fastapi import Depends, HTTPException, status, Request
+import logging
+import hmac
+from fastapi import Depends, Header, HTTPException, status, Request
 from sqlalchemy.orm import Session
+from typing import Optional
+from app.core.config import settings
 from app.core.database import get_db
 from app.services.auth_service import AuthService
 from app.models.user import User
 
+logger = logging.getLogger(__name__)
 
-async def get_current_user(
-    request: Request,
-    db: Session = Depends(get_db)
-) -> User:
+
+def get_token_from_request(request: Request) -> Optional[str]:
     """
-    Obtener el usuario actual desde el token
-    Soporta tanto cookies como header Authorization
+    Token JWT del request: header Authorization primero, cookie después
     """
     token = None
     
@@ -24,45 +26,55 @@ async def get_current_user(
     auth_header = request.headers.get("Authorization")
     if auth_header and auth_header.startswith("Bearer "):
         token = auth_header.replace("Bearer ", "")
-        print(f"[Auth] Token desde header: {token[:20]}...")
     
     # 2. Si no está en header, intentar cookie (fallback)
     if not token:
         token = request.cookies.get("access_token")
         if token:
-            print(f"[Auth] Token desde cookie: {token[:20]}...")
             # Remover "Bearer " si existe
             if token.startswith("Bearer "):
                 token = token.replace("Bearer ", "")
     
-    # 3. Si no hay token en ningún lado
+    return token
+
+
+async def get_current_user(
+    request: Request,
+    db: Session = Depends(get_db)
+) -> User:
+    """
+    Obtener el usuario actual desde el token
+    Soporta tanto cookies como header Authorization
+    """
+    token = get_token_from_request(request)
+    
+    # Si no hay token en ningún lado
     if not token:
-        print("[Auth] ❌ No se encontró token")
+        logger.debug("[Auth] No se encontró token")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="No autenticado. Por favor inicia sesión.",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # 4. Verificar token
+    # Verificar token (sin tocar la BD si está en auth_cache)
     try:
         auth_service = AuthService(db)
         user = auth_service.get_current_user(token)
         
         if not user:
-            print(f"[Auth] ❌ Usuario no encontrado en DB para este token")
+            logger.debug("[Auth] Usuario no encontrado en DB para este token")
             raise HTTPException(status_code=401, detail="Token válido pero usuario no existe")
             
     except Exception as e:
         # ESTO ES LO IMPORTANTE: Imprime el error real en la consola de Railway
-        print(f"[Auth] 💥 Excepción al decodificar token: {str(e)}")
+        logger.warning("[Auth] Excepción al decodificar token: %s", str(e))
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Error de autenticación: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    print(f"[Auth] ✅ Usuario autenticado: {user.full_name}")
     return user
 
 
@@ -121,4 +133,24 @@ def check_permission(permission: str):
         
         return current_user
     
-    return permission_checker
\ No newline at end of file
+    return permission_checker
+
+def require_admin_token(
+    x_admin_token: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+) -> None:
+    """
+    Endpoints de operación (/admin, /metrics): exigen la cabecera
+    X-Admin-Token igual a settings.ADMIN_TOKEN. También se acepta
+    `Authorization: Bearer <token>`, que es lo que manda Prometheus.
+    Sin token configurado, 404.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token and authorization and authorization.startswith("Bearer "):
+        x_admin_token = authorization[len("Bearer "):]
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Acceso restringido"
+        )
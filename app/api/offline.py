@@ -13,20 +13,23 @@ Ya registrado en main.py:
     app.include_router(verification_router)
 """
 
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
 from fastapi.responses import HTMLResponse, JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
+import asyncio
 import logging
 
 # ── Imports QueVendi ──
-from app.core.database import get_db
-from app.models.product import Product
+from app.core import schema
+from app.core.database import get_async_db, get_db
 from app.models.sale import Sale
 from app.models.billing import Comprobante
 from app.api.dependencies import get_current_user
 from app.models.user import User
+from app.services import catalogo_sync
 
 logger = logging.getLogger(__name__)
 
@@ -60,22 +63,27 @@ async def health_check():
 
 @router.get("/products/catalog")
 async def get_product_catalog(
-    since: Optional[str] = Query(
+    request: Request,
+    since_seq: Optional[int] = Query(
+        None, ge=0,
+        description="`seq` de la última respuesta: sólo devuelve los cambios posteriores."
+    ),
+    since: Optional[str] = Query(  # noqa: ARG001 — clientes v1: reciben el completo
         None,
-        description="ISO timestamp. Si se envía, solo devuelve productos modificados después de esta fecha."
+        description="(v1, obsoleto) ISO timestamp. Se ignora: responde el catálogo completo."
     ),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Catálogo de productos filtrado por store_id del usuario.
-    - Sin `since`: catálogo completo (primera carga)
-    - Con `since`: solo cambios desde esa fecha (sync incremental)
+    Catálogo de productos filtrado por store_id del usuario (protocolo v2,
+    ver app.services.catalogo_sync).
+    Sesión async: cada terminal que reconecta pide el catálogo, y un
+    catálogo grande no debe frenar el event loop.
+    - Sin `since_seq`: catálogo completo (primera carga)
+    - Con `since_seq`: cambios y bajas desde esa versión (sync incremental)
+    - `If-None-Match` con el ETag de la respuesta anterior y sin cambios: 304
     """
-    import traceback
-
-    logger.info(f"[Catalog] Entrando. user type={type(current_user)} store_id={getattr(current_user, 'store_id', 'NO ATTR')}")
-
     store_id = current_user.store_id
 
     if not store_id:
@@ -84,81 +92,41 @@ async def get_product_catalog(
             detail="Usuario no asociado a una tienda"
         )
 
-    server_time = datetime.utcnow().isoformat()
-
-    try:
-        # Query base: solo productos de ESTA tienda
-        query = db.query(Product).filter(
-            Product.store_id == store_id
-        )
-
-        deleted_ids = []
-
-        if since:
-            try:
-                since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
-            except ValueError:
-                since_dt = datetime.utcnow() - timedelta(days=30)
-
-            # Solo productos modificados después de `since`
-            if hasattr(Product, 'updated_at'):
-                query = query.filter(Product.updated_at > since_dt)
-
-            # Soft delete si existe campo active
-            try:
-                deleted_query = db.query(Product.id).filter(
-                    Product.store_id == store_id,
-                    Product.active == False,
-                    Product.updated_at > since_dt
-                )
-                deleted_ids = [row.id for row in deleted_query.all()]
-            except Exception:
-                pass
-
-        products = query.all()
-
-        logger.info(f"[Catalog] Query OK: {len(products)} productos para store {store_id}")
-
-        # Serializar
-        product_list = []
-        for p in products:
-            try:
-                product_list.append({
-                    "id": p.id,
-                    "name": p.name,
-                    "barcode": getattr(p, 'barcode', None) or getattr(p, 'code', None),
-                    "sale_price": float(p.sale_price) if p.sale_price else 0,
-                    "purchase_price": float(getattr(p, 'purchase_price', 0) or 0),
-                    "stock": float(p.stock) if p.stock else 0,
-                    "unit": getattr(p, 'unit', 'unidad') or 'unidad',
-                    "category": getattr(p, 'category', None),
-                    "image_url": getattr(p, 'image_url', None),
-                    "allow_fractional": getattr(p, 'allow_fractional', False),
-                    "min_stock": getattr(p, 'min_stock_alert', 0) or 0,
-                    "active": getattr(p, 'active', True),
-                    "updated_at": p.updated_at.isoformat() if hasattr(p, 'updated_at') and p.updated_at else server_time
-                })
-            except Exception as pe:
-                logger.error(f"[Catalog] Error serializando producto {getattr(p, 'id', '?')}: {pe}")
-                logger.error(traceback.format_exc())
-
-        logger.info(f"[Catalog] Store {store_id}: {len(product_list)} productos serializados")
-
-        return {
-            "products": product_list,
-            "deleted_ids": deleted_ids,
-            "server_time": server_time,
+    if not await asyncio.to_thread(schema.asegurar, "catalogo_sync"):
+        raise HTTPException(status_code=503, detail="Catálogo no disponible, reintentar")
+
+    cursor = await db.run_sync(catalogo_sync.cursor_actual)
+
+    previo = catalogo_sync.cursor_en_etag(store_id, request.headers.get("if-none-match"))
+    if previo is not None and previo <= cursor and not await db.run_sync(
+        catalogo_sync.hay_cambios, store_id, previo
+    ):
+        return Response(status_code=304, headers={
+            "ETag": catalogo_sync.etag(store_id, previo),
+            "Cache-Control": "private, no-cache",
+        })
+
+    datos = await db.run_sync(catalogo_sync.cambios, store_id, since_seq, cursor)
+
+    logger.info(
+        f"[Catalog] Store {store_id}: {len(datos['products'])} productos, "
+        f"{len(datos['deleted_ids'])} bajas (seq {since_seq} → {cursor})"
+    )
+
+    return JSONResponse(
+        {
+            **datos,
+            "version": 2,
+            "seq": cursor,
+            "server_time": datetime.utcnow().isoformat(),
             "store_id": store_id,
-            "total": len(product_list),
-            "is_full_sync": since is None
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"[Catalog] ERROR store {store_id}: {e}")
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=str(e))
+            "total": len(datos["products"]),
+        },
+        headers={
+            "ETag": catalogo_sync.etag(store_id, cursor),
+            "Cache-Control": "private, no-cache",
+        },
+    )
 
 
 # ============================================
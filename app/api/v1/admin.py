@@ -0,0 +1,123 @@
+"""
+QueVendi — Endpoints de operación (infraestructura, no por tienda)
+==================================================================
+
+Protegidos con ADMIN_TOKEN (cabecera X-Admin-Token). Sin token
+configurado no responden.
+
+Rutas:
+  GET  /api/v1/admin/db-pool        → estado y telemetría de los pools + réplica
+  POST /api/v1/admin/db-pool/reset  → reinicia los histogramas
+  GET  /api/v1/admin/schema         → migraciones registradas y su estado
+  GET  /api/v1/admin/metricas       → latencia/DB por ruta, N+1 y consultas lentas
+  POST /api/v1/admin/metricas/reset → reinicia las métricas por ruta
+  GET  /metrics                     → lo mismo, en formato Prometheus
+  GET  /api/v1/admin/arranque       → tiempo de arranque y perfil de imports
+  GET  /api/v1/admin/jobs           → tareas periódicas y sus últimas ejecuciones
+  POST /api/v1/admin/jobs/{nombre}/ejecutar → correr una tarea ya
+  POST /api/v1/admin/agregados/reconstruir  → backfill de los agregados de ventas
+"""
+
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.api.dependencies import require_admin_token
+from app.core import arranque, db_pool, instrumentacion, jobs, schema
+from app.core.database import SessionLocal, estado_replica
+from app.services import agregados_ventas
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin_token)])
+
+# Sin prefijo: /metrics es donde Prometheus lo busca por defecto
+metrics_router = APIRouter(dependencies=[Depends(require_admin_token)])
+
+
+@router.get("/db-pool")
+async def estado_db_pool():
+    """
+    Por engine (sync / async): configuración, conexiones en uso ahora,
+    contadores (timeouts, pings, invalidadas) e histogramas de espera,
+    retención y ocupación al checkout, desde que arrancó el proceso.
+    Además, si hay réplica de lectura: si está al día y su atraso.
+    """
+    return {"pools": db_pool.estado(), "replica": estado_replica()}
+
+
+@router.post("/db-pool/reset")
+async def reset_db_pool():
+    """Empieza una ventana de medición nueva (p. ej. antes del almuerzo)."""
+    db_pool.reset()
+    return {"success": True}
+
+
+@router.get("/schema")
+async def estado_schema():
+    """Por módulo: aplicada / pendiente (perezosa) / error, con el hash del DDL."""
+    return schema.estado()
+
+
+@router.get("/metricas")
+async def estado_metricas():
+    """
+    Por ruta: histogramas de latencia, tiempo en base y consultas por
+    request, status y cuántos requests parecieron N+1. Además los últimos
+    N+1 y consultas lentas con su request id (para buscarlos en los logs).
+    """
+    return instrumentacion.estado()
+
+
+@router.get("/arranque")
+async def estado_arranque():
+    """
+    Cuánto tardó el proceso en quedar listo y, si arrancó con
+    QV_PERFIL_ARRANQUE=1, los módulos y paquetes que más pesaron.
+    """
+    return arranque.estado()
+
+
+@router.get("/jobs")
+def estado_jobs(limite: int = 10):
+    """Por tarea: programación y sus últimas `limite` ejecuciones (con errores)."""
+    return jobs.estado(limite)
+
+
+@router.post("/jobs/{nombre}/ejecutar")
+async def ejecutar_job(nombre: str):
+    """Encola la tarea aunque no le toque. Si ya corre en otro worker, se salta."""
+    try:
+        encolada = jobs.ejecutar_ahora(nombre)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Tarea '{nombre}' no registrada")
+    return {"success": encolada}
+
+
+@router.post("/agregados/reconstruir")
+def reconstruir_agregados(desde: date, hasta: date, store_id: Optional[int] = None):
+    """
+    Recalcula los agregados de ventas de [desde, hasta] desde las ventas
+    (al desplegar, o si algo quedó descuadrado). Un mes por transacción.
+    """
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="'hasta' es anterior a 'desde'")
+    db = SessionLocal()
+    try:
+        return agregados_ventas.reconstruir(db, desde, hasta, store_id)
+    finally:
+        db.close()
+
+
+@router.post("/metricas/reset")
+async def reset_metricas():
+    instrumentacion.reset()
+    return {"success": True}
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        instrumentacion.prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
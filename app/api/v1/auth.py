@@ -1,6 +1,7 @@
 """
 Endpoints de autenticación - Con registro completo y validación
 """
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
@@ -10,12 +11,15 @@ from typing import Optional
 
 from app.core.database import get_db
 from app.core.security import hash_password, verify_password, create_access_token
+from app.core.auth_cache import auth_cache
 from app.api.dependencies import get_current_user
 from app.models.store import Store
 from app.models.user import User
 from app.models.subscription import Subscription
 from app.services.validation_service import validation_service
 
+logger = logging.getLogger(__name__)
+
 
 router = APIRouter(prefix="/auth")
 
@@ -425,6 +429,7 @@ async def change_password(
     user.updated_at = datetime.now(timezone.utc)
     
     db.commit()
+    auth_cache.invalidar_usuario(user.id)
     
     return {"message": "Clave actualizada correctamente"}
 
@@ -457,8 +462,8 @@ async def recover_password(
     db.commit()
     
     # Enviar por WhatsApp (implementar según tu servicio)
-    # Por ahora solo logueamos
-    print(f"📱 Código de recuperación para {user.dni}: {code}")
+    # Por ahora solo logueamos, en DEBUG: el código no debe quedar en los logs de producción
+    logger.debug("[Auth] Código de recuperación para %s: %s", user.dni, code)
     
     # TODO: Integrar con WhatsApp API
     # from app.services.whatsapp_service import send_recovery_code
@@ -513,6 +518,7 @@ async def reset_password(
     user.updated_at = datetime.now(timezone.utc)
     
     db.commit()
+    auth_cache.invalidar_usuario(user.id)
     
     return {"message": "Clave restablecida correctamente"}
 
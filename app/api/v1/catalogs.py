@@ -6,6 +6,7 @@ from app.core.database import get_db
 from app.models.product import Product
 from app.models.user import User
 from app.api.dependencies import get_current_user
+from app.services import search_index
 
 router = APIRouter(prefix="/catalogs")
 
@@ -122,6 +123,7 @@ async def copy_catalog_to_store(
             inserted += 1
         
         db.commit()
+        search_index.invalidar_tienda(current_user.store_id)
         
         return {
             "success": True,
@@ -1,4 +1,5 @@
 # app/api/v1/endpoints/credits.py
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List
@@ -15,6 +16,8 @@ from app.schemas.credit import (
     FiadoCompleteCreate
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 @router.post("/registrar", response_model=CreditResponse, status_code=201)
@@ -26,7 +29,7 @@ def registrar_fiado_completo(
     """
     Registrar fiado completo: crear cliente (si no existe) y crédito en una sola operación
     """
-    print(f"[Fiados] Registrando fiado para: {fiado_in.customer_name}")
+    logger.debug("[Fiados] Registrando fiado para: %s", fiado_in.customer_name)
     
     # 1. Buscar o crear cliente
     customer = db.query(Customer).filter(
@@ -36,7 +39,7 @@ def registrar_fiado_completo(
     ).first()
     
     if not customer:
-        print(f"[Fiados] Creando nuevo cliente")
+        logger.debug("[Fiados] Creando nuevo cliente")
         customer = Customer(
             store_id=current_user.store_id,
             name=fiado_in.customer_name,
@@ -46,9 +49,9 @@ def registrar_fiado_completo(
         )
         db.add(customer)
         db.flush()  # Para obtener customer.id
-        print(f"[Fiados] Cliente creado: ID {customer.id}")
+        logger.debug("[Fiados] Cliente creado: ID %s", customer.id)
     else:
-        print(f"[Fiados] Cliente existente: ID {customer.id}")
+        logger.debug("[Fiados] Cliente existente: ID %s", customer.id)
     
     # 2. Calcular fecha de vencimiento
     due_date = date.today() + timedelta(days=fiado_in.credit_days)
@@ -72,7 +75,7 @@ def registrar_fiado_completo(
     db.commit()
     db.refresh(credit)
     
-    print(f"[Fiados] ✅ Crédito registrado: ID {credit.id}, Vence: {due_date}")
+    logger.info("[Fiados] Crédito registrado: ID %s, Vence: %s", credit.id, due_date)
     
     return credit
 
@@ -86,7 +89,7 @@ def create_credit(
     """
     Crear nuevo crédito (requiere customer_id existente)
     """
-    print(f"[Credits] Creando crédito para customer {credit_in.customer_id}")
+    logger.debug("[Credits] Creando crédito para customer %s", credit_in.customer_id)
     
     # Verificar que el cliente existe
     customer = db.query(Customer).filter(
@@ -118,7 +121,7 @@ def create_credit(
     db.commit()
     db.refresh(credit)
     
-    print(f"[Credits] ✅ Crédito creado: ID {credit.id}")
+    logger.info("[Credits] Crédito creado: ID %s", credit.id)
     return credit
 
 
@@ -135,7 +138,7 @@ def get_pending_credits(
         Credit.status.in_(['pending', 'partial'])
     ).order_by(Credit.due_date).all()
     
-    print(f"[Credits] Créditos pendientes: {len(credits)}")
+    logger.debug("[Credits] Créditos pendientes: %s", len(credits))
     return credits
 
 
@@ -163,7 +166,7 @@ def get_overdue_credits(
     
     db.commit()
     
-    print(f"[Credits] Créditos vencidos: {len(credits)}")
+    logger.debug("[Credits] Créditos vencidos: %s", len(credits))
     return credits
 
 
@@ -181,7 +184,7 @@ def get_customer_credits(
         Credit.customer_id == customer_id
     ).order_by(Credit.credit_date.desc()).all()
     
-    print(f"[Credits] Créditos del cliente {customer_id}: {len(credits)}")
+    logger.debug("[Credits] Créditos del cliente %s: %s", customer_id, len(credits))
     return credits
 
 
@@ -259,7 +262,7 @@ def add_payment(
     db.commit()
     db.refresh(credit)
     
-    print(f"[Credits] ✅ Pago registrado: S/. {payment_in.amount}, Restante: S/. {credit.remaining_amount}")
+    logger.info("[Credits] Pago registrado: S/. %s, Restante: S/. %s", payment_in.amount, credit.remaining_amount)
     
     return credit
 
@@ -285,7 +288,7 @@ def get_credit_payments(
         CreditPayment.credit_id == credit_id
     ).order_by(CreditPayment.payment_date.desc()).all()
     
-    print(f"[Credits] Pagos del crédito {credit_id}: {len(payments)}")
+    logger.debug("[Credits] Pagos del crédito %s: %s", credit_id, len(payments))
     return payments
 
 
@@ -314,5 +317,5 @@ def update_credit(
     db.commit()
     db.refresh(credit)
     
-    print(f"[Credits] ✅ Crédito actualizado: ID {credit_id}")
+    logger.info("[Credits] Crédito actualizado: ID %s", credit_id)
     return credit
\ No newline at end of file
@@ -1,4 +1,5 @@
 # app/api/v1/endpoints/customers.py
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List
@@ -8,6 +9,8 @@ from app.models.user import User
 from app.models.customer import Customer
 from app.schemas.customer import CustomerCreate, CustomerUpdate, CustomerResponse
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 @router.post("/", response_model=CustomerResponse, status_code=201)
@@ -19,7 +22,7 @@ def create_customer(
     """
     Crear nuevo cliente
     """
-    print(f"[Customers] Creando cliente: {customer_in.name}")
+    logger.debug("[Customers] Creando cliente: %s", customer_in.name)
     
     # Verificar si ya existe por nombre y teléfono
     existing = db.query(Customer).filter(
@@ -29,7 +32,7 @@ def create_customer(
     ).first()
     
     if existing:
-        print(f"[Customers] Cliente ya existe: ID {existing.id}")
+        logger.debug("[Customers] Cliente ya existe: ID %s", existing.id)
         return existing
     
     # Crear nuevo cliente
@@ -46,7 +49,7 @@ def create_customer(
     db.commit()
     db.refresh(customer)
     
-    print(f"[Customers] ✅ Cliente creado: ID {customer.id}")
+    logger.info("[Customers] Cliente creado: ID %s", customer.id)
     return customer
 
 
@@ -59,7 +62,7 @@ def search_customers(
     """
     Buscar clientes por nombre o teléfono
     """
-    print(f"[Customers] Buscando: '{q}'")
+    logger.debug("[Customers] Buscando: '%s'", q)
     
     customers = db.query(Customer).filter(
         Customer.store_id == current_user.store_id,
@@ -67,7 +70,7 @@ def search_customers(
         (Customer.name.ilike(f"%{q}%") | Customer.phone.ilike(f"%{q}%"))
     ).order_by(Customer.name).limit(20).all()
     
-    print(f"[Customers] Encontrados: {len(customers)}")
+    logger.debug("[Customers] Encontrados: %s", len(customers))
     return customers
 
 
@@ -111,7 +114,7 @@ def list_customers(
     
     customers = query.order_by(Customer.name).offset(skip).limit(limit).all()
     
-    print(f"[Customers] Lista: {len(customers)} clientes")
+    logger.debug("[Customers] Lista: %s clientes", len(customers))
     return customers
 
 
@@ -141,7 +144,7 @@ def update_customer(
     db.commit()
     db.refresh(customer)
     
-    print(f"[Customers] ✅ Cliente actualizado: ID {customer_id}")
+    logger.info("[Customers] Cliente actualizado: ID %s", customer_id)
     return customer
 
 
@@ -165,5 +168,5 @@ def delete_customer(
     customer.is_active = False
     db.commit()
     
-    print(f"[Customers] ✅ Cliente desactivado: ID {customer_id}")
+    logger.info("[Customers] Cliente desactivado: ID %s", customer_id)
     return {"message": "Cliente eliminado correctamente"}
\ No newline at end of file
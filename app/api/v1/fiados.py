@@ -3,6 +3,7 @@
 # Ruta: app/api/v1/fiados.py
 # ============================================
 
+import logging
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 from typing import Optional, List
@@ -10,9 +11,13 @@ from datetime import date, datetime
 from decimal import Decimal
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from app.core.database import get_db
+from app.core import jobs
+from app.core.database import SessionLocal, get_db
+from app.core.tiempo import hoy_peru
 from app.core.security import get_current_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/fiados")
 
 # ============================================
@@ -107,7 +112,7 @@ def registrar_fiado(
     except Exception as e:
         db.rollback()
         # Si la función SQL no existe, solo guardar en la venta
-        print(f"[Fiados] Función SQL no disponible: {e}")
+        logger.info("[Fiados] Función SQL no disponible: %s", e)
         db.commit()
         credit_id = None
     
@@ -282,4 +287,34 @@ def resumen_general(
         "monto_total": float(row[4]) if row[4] else 0,
         "total_pagado": float(row[5]) if row[5] else 0,
         "saldo_pendiente": float(row[6]) if row[6] else 0
-    }
\ No newline at end of file
+    }
+
+
+# ================================================================
+# TAREA PERIÓDICA
+# ================================================================
+
+def marcar_creditos_vencidos() -> dict:
+    """
+    Tarea horaria (app.core.jobs): marca los créditos vencidos de todas
+    las tiendas en un solo UPDATE, con la misma regla que aplica
+    GET /fiados/overdue al consultarse.
+    """
+    db = SessionLocal()
+    try:
+        marcados = db.execute(text("""
+            UPDATE credits SET
+                is_overdue = TRUE,
+                status = CASE WHEN status = 'pending' THEN 'overdue' ELSE status END,
+                updated_at = NOW()
+            WHERE status IN ('pending', 'partial')
+              AND due_date < :hoy
+              AND is_overdue IS NOT TRUE
+        """), {"hoy": hoy_peru()}).rowcount
+        db.commit()
+    finally:
+        db.close()
+    return {"marcados": marcados}
+
+
+jobs.registrar("fiados_vencidos", marcar_creditos_vencidos, cada_segundos=3600)
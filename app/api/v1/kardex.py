@@ -4,33 +4,42 @@ Endpoints para listar productos con valor de inventario, ver movimientos
 detallados por producto con saldo corriente, resumen por categoría, export CSV
 y cortes de inventario históricos (motor reconstruye saldo a cualquier fecha).
 """
-import csv
-import io
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from sqlalchemy import and_, func
 from sqlalchemy.orm import Session
 
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font, PatternFill
 
-from app.core.database import get_db
+from app.core import paginacion, schema
+from app.core.database import get_db, get_read_db
 from app.core.config import settings
 from app.api.dependencies import get_current_user
 from app.models.product import Product
 from app.models.inventory import InventoryMovement
 from app.models.sale import Sale
 from app.models.user import User
+from app.services import exportacion, kardex_snapshots
 from app.services.auth_service import AuthService
 
 
 router = APIRouter(prefix="/kardex", tags=["kardex"])
 
+# Último movimiento por producto y kardex de un producto (store, product,
+# fecha) y el historial de /movimientos (store, fecha desc, id desc).
+# CONCURRENTLY, por la tarea schema_indices: no frenan las ventas.
+schema.registrar_indice(
+    "idx_inventory_movements_store_prod_fecha",
+    "ON inventory_movements(store_id, product_id, occurred_at, id)",
+)
+schema.registrar_indice(
+    "idx_inventory_movements_store_fecha",
+    "ON inventory_movements(store_id, occurred_at DESC, id DESC)",
+)
+
 PERU_TZ = timezone(timedelta(hours=-5))
 
 
@@ -87,13 +96,20 @@ def _ventana_default():
 # ──────────────────────────────────────────────────────────────────────────
 @router.get("/productos")
 async def lista_productos_kardex(
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     categoria: Optional[str] = None,
     search: Optional[str] = None,
     con_movimientos: bool = False,
+    limit: int = Query(500, ge=1, le=1000),
+    after: Optional[str] = None,
 ):
-    """Lista productos del store con stock, valor y último movimiento."""
+    """
+    Lista productos del store con stock, valor y último movimiento, por
+    nombre. Si hay más de `limit`, el cursor de la página siguiente va
+    en el header X-Next-Cursor (pasarlo en `after`).
+    """
     store_id = current_user.store_id
     q = db.query(Product).filter(
         Product.store_id == store_id,
@@ -104,8 +120,27 @@ async def lista_productos_kardex(
     if search:
         like = f"%{search}%"
         q = q.filter(Product.name.ilike(like))
+    if con_movimientos:
+        q = q.filter(
+            db.query(InventoryMovement.id)
+            .filter(
+                InventoryMovement.store_id == store_id,
+                InventoryMovement.product_id == Product.id,
+            )
+            .exists()
+        )
 
-    productos: List[Product] = q.order_by(Product.name.asc()).limit(500).all()
+    orden = (Product.name, Product.id)
+    if after:
+        q = q.filter(paginacion.despues_de(
+            orden, paginacion.decodificar(after, "kardex_productos", 2), descendente=False,
+        ))
+    productos: List[Product] = q.order_by(*orden).limit(limit + 1).all()
+    next_cursor = paginacion.siguiente(
+        productos, limit, lambda p: (p.name, p.id), "kardex_productos",
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
 
     # Último movimiento por producto (en una sola query)
     ids = [p.id for p in productos]
@@ -116,15 +151,15 @@ async def lista_productos_kardex(
                 InventoryMovement.product_id,
                 func.max(InventoryMovement.occurred_at).label("ultimo"),
             )
-            .filter(InventoryMovement.product_id.in_(ids))
+            .filter(
+                InventoryMovement.store_id == store_id,
+                InventoryMovement.product_id.in_(ids),
+            )
             .group_by(InventoryMovement.product_id)
             .all()
         )
         ultimos = {r.product_id: r.ultimo for r in rows}
 
-    if con_movimientos:
-        productos = [p for p in productos if p.id in ultimos]
-
     out = []
     for p in productos:
         stock = _to_float(p.stock)
@@ -371,10 +406,16 @@ async def movimientos_kardex(
     product_id: Optional[int] = None,
     limit: int = Query(50, ge=1, le=500),
     offset: int = Query(0, ge=0),
+    after: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Movimientos del store paginados (limit=50)."""
+    """
+    Movimientos del store paginados (limit=50). Para avanzar, pasar el
+    `next_cursor` de la respuesta en `after`: el costo de cada página no
+    crece con la profundidad. `offset` queda por compatibilidad; `total`
+    sólo se calcula en la primera página.
+    """
     store_id = current_user.store_id
 
     fi = _parse_fecha(fecha_inicio)
@@ -396,8 +437,19 @@ async def movimientos_kardex(
     if product_id:
         q = q.filter(InventoryMovement.product_id == product_id)
 
-    total = q.count()
-    rows = q.order_by(InventoryMovement.occurred_at.desc(), InventoryMovement.id.desc()).limit(limit).offset(offset).all()
+    orden = (InventoryMovement.occurred_at, InventoryMovement.id)
+    total = None
+    if after:
+        q = q.filter(paginacion.despues_de(
+            orden, paginacion.decodificar(after, "movimientos", 2), descendente=True,
+        ))
+    else:
+        total = q.count()
+        q = q.offset(offset)
+    rows = q.order_by(*(c.desc() for c in orden)).limit(limit + 1).all()
+    next_cursor = paginacion.siguiente(
+        rows, limit, lambda r: (r[0].occurred_at, r[0].id), "movimientos",
+    )
 
     items = []
     for m, pname in rows:
@@ -424,6 +476,7 @@ async def movimientos_kardex(
         "limit": limit,
         "offset": offset,
         "total": total,
+        "next_cursor": next_cursor,
     }
 
 
@@ -436,7 +489,7 @@ async def export_kardex_csv(
     fecha_inicio: Optional[str] = None,
     fecha_fin: Optional[str] = None,
     token: Optional[str] = None,  # noqa: ARG001 — leído por get_current_user_or_token
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user_or_token),
 ):
     """CSV con el kardex (un producto o todos)."""
@@ -459,39 +512,38 @@ async def export_kardex_csv(
     if product_id and not products:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow([
+    encabezado = [
         "Fecha", "Doc.Tipo", "Doc.Numero", "Producto", "Detalle", "Usuario",
         "Entrada.Cant", "Entrada.CUnit", "Entrada.Total",
         "Salida.Cant",  "Salida.CUnit",  "Salida.Total",
         "Saldo.Cant",   "Saldo.CUnit",   "Saldo.Total",
-    ])
+    ]
+
+    # Saldo inicial = stock_before del primer movimiento del período (una
+    # sola consulta DISTINCT ON para todos los productos); sin movimientos
+    # en el período, el stock actual.
+    primeros_q = (
+        db.query(InventoryMovement.product_id, InventoryMovement.stock_before)
+        .filter(
+            InventoryMovement.store_id == store_id,
+            InventoryMovement.occurred_at >= fi,
+            InventoryMovement.occurred_at <= ff_inclusive,
+        )
+        .distinct(InventoryMovement.product_id)
+        .order_by(
+            InventoryMovement.product_id,
+            InventoryMovement.occurred_at.asc(),
+            InventoryMovement.id.asc(),
+        )
+    )
+    if product_id:
+        primeros_q = primeros_q.filter(InventoryMovement.product_id == product_id)
+    primeros = dict(primeros_q.all())
 
     # Estado por producto: (saldo_cant, saldo_valor, costo_prom)
     state: dict = {}
     for pid, p in products.items():
-        # Saldo inicial = stock_before del primer movimiento del período;
-        # si no hay movimiento previo en el período, queremos arrancar con
-        # el saldo previo. Tomamos el último movimiento ANTES del período
-        # como referencia de cantidad y, si no hay, asumimos 0 (consistente
-        # con el detalle de un único producto: el primer movimiento del
-        # período define el saldo inicial real).
-        first_mov = (
-            db.query(InventoryMovement)
-            .filter(
-                InventoryMovement.product_id == pid,
-                InventoryMovement.store_id == store_id,
-                InventoryMovement.occurred_at >= fi,
-                InventoryMovement.occurred_at <= ff_inclusive,
-            )
-            .order_by(InventoryMovement.occurred_at.asc(), InventoryMovement.id.asc())
-            .first()
-        )
-        if first_mov:
-            saldo_cant_0 = _to_float(first_mov.stock_before)
-        else:
-            saldo_cant_0 = _to_float(p.stock)
+        saldo_cant_0 = _to_float(primeros[pid]) if pid in primeros else _to_float(p.stock)
         costo_prom_0 = _to_float(p.cost_price)
         state[pid] = {
             "saldo_cant": saldo_cant_0,
@@ -510,60 +562,58 @@ async def export_kardex_csv(
     if product_id:
         movs_q = movs_q.filter(InventoryMovement.product_id == product_id)
 
-    movs = movs_q.order_by(InventoryMovement.occurred_at.asc(), InventoryMovement.id.asc()).all()
-
-    for m in movs:
-        p = products.get(m.product_id)
-        if not p:
-            continue
-        st = state.setdefault(m.product_id, {
-            "saldo_cant": 0.0, "saldo_valor": 0.0,
-            "costo_prom": _to_float(p.cost_price),
-        })
+    movs = (
+        movs_q.order_by(InventoryMovement.occurred_at.asc(), InventoryMovement.id.asc())
+        .yield_per(exportacion.FILAS_POR_TANDA)
+    )
 
-        qty = _to_float(m.quantity)
-        if qty > 0:
-            entrada_cunit = _to_float(m.cost_price) if m.cost_price is not None else st["costo_prom"]
-            entrada_total = qty * entrada_cunit
-            st["saldo_valor"] += entrada_total
-            st["saldo_cant"] = _to_float(m.stock_after)
-            if st["saldo_cant"] > 0:
-                st["costo_prom"] = st["saldo_valor"] / st["saldo_cant"]
-            ent_cant_s = f"{qty:.3f}"
-            ent_cu_s = f"{entrada_cunit:.4f}"
-            ent_tot_s = f"{entrada_total:.2f}"
-            sal_cant_s = sal_cu_s = sal_tot_s = ""
-        else:
-            salida_qty = -qty
-            salida_total = salida_qty * st["costo_prom"]
-            st["saldo_cant"] = _to_float(m.stock_after)
-            st["saldo_valor"] = st["saldo_cant"] * st["costo_prom"]
-            sal_cant_s = f"{salida_qty:.3f}"
-            sal_cu_s = f"{st['costo_prom']:.4f}"
-            sal_tot_s = f"{salida_total:.2f}"
-            ent_cant_s = ent_cu_s = ent_tot_s = ""
-
-        w.writerow([
-            m.occurred_at.strftime("%Y-%m-%d %H:%M") if m.occurred_at else "",
-            m.doc_tipo or "",
-            m.doc_numero or "",
-            p.name,
-            (m.glosa or m.notes or ""),
-            m.user_name or "",
-            ent_cant_s, ent_cu_s, ent_tot_s,
-            sal_cant_s, sal_cu_s, sal_tot_s,
-            f"{st['saldo_cant']:.3f}",
-            f"{st['costo_prom']:.4f}",
-            f"{st['saldo_cant'] * st['costo_prom']:.2f}",
-        ])
+    def _filas():
+        for m in movs:
+            p = products.get(m.product_id)
+            if not p:
+                continue
+            st = state[m.product_id]
+
+            qty = _to_float(m.quantity)
+            if qty > 0:
+                entrada_cunit = _to_float(m.cost_price) if m.cost_price is not None else st["costo_prom"]
+                entrada_total = qty * entrada_cunit
+                st["saldo_valor"] += entrada_total
+                st["saldo_cant"] = _to_float(m.stock_after)
+                if st["saldo_cant"] > 0:
+                    st["costo_prom"] = st["saldo_valor"] / st["saldo_cant"]
+                ent_cant_s = f"{qty:.3f}"
+                ent_cu_s = f"{entrada_cunit:.4f}"
+                ent_tot_s = f"{entrada_total:.2f}"
+                sal_cant_s = sal_cu_s = sal_tot_s = ""
+            else:
+                salida_qty = -qty
+                salida_total = salida_qty * st["costo_prom"]
+                st["saldo_cant"] = _to_float(m.stock_after)
+                st["saldo_valor"] = st["saldo_cant"] * st["costo_prom"]
+                sal_cant_s = f"{salida_qty:.3f}"
+                sal_cu_s = f"{st['costo_prom']:.4f}"
+                sal_tot_s = f"{salida_total:.2f}"
+                ent_cant_s = ent_cu_s = ent_tot_s = ""
+
+            yield [
+                m.occurred_at.strftime("%Y-%m-%d %H:%M") if m.occurred_at else "",
+                m.doc_tipo or "",
+                m.doc_numero or "",
+                p.name,
+                (m.glosa or m.notes or ""),
+                m.user_name or "",
+                ent_cant_s, ent_cu_s, ent_tot_s,
+                sal_cant_s, sal_cu_s, sal_tot_s,
+                f"{st['saldo_cant']:.3f}",
+                f"{st['costo_prom']:.4f}",
+                f"{st['saldo_cant'] * st['costo_prom']:.2f}",
+            ]
 
-    csv_bytes = buf.getvalue().encode("utf-8-sig")
     fname_id = f"_p{product_id}" if product_id else ""
     filename = f"kardex_store{store_id}{fname_id}_{fi.date()}_{ff.date()}.csv"
-    return StreamingResponse(
-        iter([csv_bytes]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    return exportacion.descarga(
+        exportacion.csv_stream(encabezado, _filas()), filename, exportacion.MEDIA_CSV,
     )
 
 
@@ -594,62 +644,52 @@ def _compute_corte(
     Reconstruye el inventario hasta `fecha` (o ahora si None).
     Devuelve productos con stock, costo unitario (promedio ponderado),
     valor total y agrupado por categoría.
+
+    Los movimientos de TODOS los productos salen de una sola consulta
+    ordenada por (producto, fecha, id) y leída por tandas (yield_per):
+    antes era una consulta por producto, 1.500 en una bodega grande. El
+    promedio ponderado depende del saldo anterior, así que el recorrido
+    sigue en Python, pero en una sola pasada.
+
+    El recorrido parte del último snapshot mensual anterior a `hasta`
+    (ver kardex_snapshots): sólo se leen los movimientos posteriores.
     """
     es_historico = bool(fecha)
     hasta = _parse_fecha_iso(fecha) or datetime.now(timezone.utc)
 
-    q = db.query(Product).filter(
+    filtros = [
         Product.store_id == store_id,
         Product.is_active == True,  # noqa: E712
-    )
+    ]
     if hasattr(Product, "deleted_at"):
-        q = q.filter(Product.deleted_at == None)  # noqa: E711
+        filtros.append(Product.deleted_at == None)  # noqa: E711
     if categoria:
-        q = q.filter(Product.category == categoria)
-    productos: List[Product] = q.all()
+        filtros.append(Product.category == categoria)
+    productos: List[Product] = db.query(Product).filter(*filtros).all()
+    costos = {p.id: _to_float(p.cost_price) for p in productos}
+
+    desde, saldos = kardex_snapshots.saldos_base(db, store_id, hasta, set(costos))
+    kardex_snapshots.recorrer(
+        kardex_snapshots.consulta_movimientos(db, store_id, desde, hasta, True, filtros),
+        saldos, costos,
+    )
 
     resultado = []
     total_valor = 0.0
 
     for p in productos:
-        movs: List[InventoryMovement] = (
-            db.query(InventoryMovement)
-            .filter(
-                InventoryMovement.store_id == store_id,
-                InventoryMovement.product_id == p.id,
-                InventoryMovement.occurred_at <= hasta,
-            )
-            .order_by(InventoryMovement.occurred_at.asc(), InventoryMovement.id.asc())
-            .all()
-        )
-
-        if not movs:
+        saldo = saldos.get(p.id)
+        if saldo is None:
             if es_historico:
                 # En histórico, sin movimientos = no existía el producto aún.
                 continue
             stock = _to_float(p.stock)
             costo = _to_float(p.cost_price)
+            num_movimientos = 0
         else:
-            stock = 0.0
-            saldo_valor = 0.0
-            costo_prom = _to_float(p.cost_price)
-
-            for m in movs:
-                qty = _to_float(m.quantity)
-                if qty > 0:
-                    entrada_unit = (
-                        _to_float(m.cost_price)
-                        if m.cost_price is not None else costo_prom
-                    )
-                    saldo_valor += qty * entrada_unit
-                    stock = _to_float(m.stock_after)
-                    if stock > 0:
-                        costo_prom = saldo_valor / stock
-                else:
-                    stock = _to_float(m.stock_after)
-                    saldo_valor = stock * costo_prom
-
-            costo = costo_prom
+            stock = saldo.stock
+            costo = saldo.costo_prom
+            num_movimientos = saldo.num_movimientos
 
         valor = round(stock * costo, 2)
         total_valor += valor
@@ -668,7 +708,7 @@ def _compute_corte(
             "costo_unitario": round(costo, 4),
             "valor_total": valor,
             "stock_bajo": stock_bajo,
-            "num_movimientos": len(movs),
+            "num_movimientos": num_movimientos,
         })
 
     resultado.sort(key=lambda x: (x["category"], x["name"]))
@@ -710,7 +750,7 @@ def _compute_corte(
 async def corte_inventario(
     fecha: Optional[str] = None,
     categoria: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     """Corte de inventario a una fecha/hora. Sin fecha = ahora."""
@@ -720,7 +760,11 @@ async def corte_inventario(
 # ──────────────────────────────────────────────────────────────────────────
 # GET /kardex/corte/export
 # ──────────────────────────────────────────────────────────────────────────
-def _build_corte_xlsx(corte: dict) -> io.BytesIO:
+def _corte_xlsx(corte: dict) -> Iterator[bytes]:
+    """
+    Corte en .xlsx (hojas "Corte de Inventario" y "Por Categoría"), en
+    modo write-only y entregado por partes (ver exportacion.xlsx_stream).
+    """
     productos = corte["productos"]
     por_categoria = corte["por_categoria"]
     total = corte["total_valor_inventario"]
@@ -732,75 +776,65 @@ def _build_corte_xlsx(corte: dict) -> io.BytesIO:
         fecha_corte_dt = datetime.now(timezone.utc)
     fecha_corte_str = fecha_corte_dt.strftime("%Y-%m-%d %H:%M")
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Corte de Inventario"
+    headers = ["N°", "Categoría", "Producto", "Unidad", "Stock", "Costo Unit.", "Valor Total"]
 
-    ws.merge_cells("A1:G1")
-    ws["A1"] = f"CORTE DE INVENTARIO — {fecha_corte_str}"
-    ws["A1"].font = Font(bold=True, size=14)
-    ws["A1"].alignment = Alignment(horizontal="center")
+    def _armar(wb):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Alignment, Font, PatternFill
+        from openpyxl.utils import get_column_letter
+
+        ws = wb.create_sheet("Corte de Inventario")
+
+        # En write-only el ancho va antes de la primera fila
+        anchos = [len(h) for h in headers]
+        for i, p in enumerate(productos, 1):
+            valores = (i, p["category"], p["name"], p["unit"],
+                       p["stock"], p["costo_unitario"], p["valor_total"])
+            for col, v in enumerate(valores):
+                anchos[col] = max(anchos[col], len(str(v)))
+        for col, ancho in enumerate(anchos, 1):
+            ws.column_dimensions[get_column_letter(col)].width = min(ancho + 4, 40)
+
+        def _celda(valor, **estilo):
+            cell = WriteOnlyCell(ws, value=valor)
+            for k, v in estilo.items():
+                setattr(cell, k, v)
+            return cell
+
+        # (write-only no combina celdas: el título va en A1/A2)
+        ws.append([_celda(f"CORTE DE INVENTARIO — {fecha_corte_str}", font=Font(bold=True, size=14))])
+        ws.append([f"Método: Promedio Ponderado | Total: S/ {total:.2f}"])
+        ws.append([])
+        ws.append([
+            _celda(h, font=Font(bold=True, color="FFFFFF"),
+                   fill=PatternFill("solid", fgColor="1E3A5F"),
+                   alignment=Alignment(horizontal="center"))
+            for h in headers
+        ])
 
-    ws.merge_cells("A2:G2")
-    ws["A2"] = f"Método: Promedio Ponderado | Total: S/ {total:.2f}"
-    ws["A2"].alignment = Alignment(horizontal="center")
+        cebra = PatternFill("solid", fgColor="F1F5F9")
+        for i, p in enumerate(productos, 1):
+            valores = [i, p["category"], p["name"], p["unit"],
+                       p["stock"], p["costo_unitario"], p["valor_total"]]
+            if i % 2 == 0:
+                ws.append([_celda(v, fill=cebra) for v in valores])
+            else:
+                ws.append(valores)
 
-    headers = ["N°", "Categoría", "Producto", "Unidad", "Stock", "Costo Unit.", "Valor Total"]
-    for i, h in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=i, value=h)
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill("solid", fgColor="1E3A5F")
-        cell.alignment = Alignment(horizontal="center")
-
-    for i, p in enumerate(productos, 1):
-        row = 4 + i
-        ws.cell(row=row, column=1, value=i)
-        ws.cell(row=row, column=2, value=p["category"])
-        ws.cell(row=row, column=3, value=p["name"])
-        ws.cell(row=row, column=4, value=p["unit"])
-        ws.cell(row=row, column=5, value=p["stock"])
-        ws.cell(row=row, column=6, value=p["costo_unitario"])
-        ws.cell(row=row, column=7, value=p["valor_total"])
-        if i % 2 == 0:
-            for col in range(1, 8):
-                ws.cell(row=row, column=col).fill = PatternFill("solid", fgColor="F1F5F9")
-
-    tot_row = 5 + len(productos)
-    ws.cell(tot_row, 1, "TOTAL")
-    ws.cell(tot_row, 7, total)
-    for col in range(1, 8):
-        ws.cell(tot_row, col).font = Font(bold=True)
-
-    ws2 = wb.create_sheet("Por Categoría")
-    ws2.append(["Categoría", "Productos", "Valor Total", "Stock Bajo"])
-    for cat in por_categoria:
-        ws2.append([
-            cat["categoria"],
-            cat["num_productos"],
-            cat["valor_total"],
-            cat["stock_bajo"],
-        ])
+        negrita = Font(bold=True)
+        ws.append([_celda(v, font=negrita) for v in ("TOTAL", None, None, None, None, None, total)])
 
-    for col in ws.columns:
-        try:
-            col_letter = col[0].column_letter
-        except AttributeError:
-            # MergedCell, saltar
-            continue
-        max_len = 0
-        for cell in col:
-            try:
-                v = cell.value
-            except AttributeError:
-                v = None
-            if v is not None:
-                max_len = max(max_len, len(str(v)))
-        ws.column_dimensions[col_letter].width = min(max_len + 4, 40)
-
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    return buf
+        ws2 = wb.create_sheet("Por Categoría")
+        ws2.append(["Categoría", "Productos", "Valor Total", "Stock Bajo"])
+        for cat in por_categoria:
+            ws2.append([
+                cat["categoria"],
+                cat["num_productos"],
+                cat["valor_total"],
+                cat["stock_bajo"],
+            ])
+
+    return exportacion.xlsx_stream(_armar)
 
 
 @router.get("/corte/export")
@@ -808,21 +842,16 @@ async def exportar_corte(
     fecha: Optional[str] = None,
     categoria: Optional[str] = None,
     token: Optional[str] = None,  # noqa: ARG001 — leído por get_current_user_or_token
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user_or_token),
 ):
     """Exporta el corte de inventario a Excel (.xlsx)."""
     corte = _compute_corte(db, current_user.store_id, fecha=fecha, categoria=categoria)
-    buf = _build_corte_xlsx(corte)
 
     fecha_dt = datetime.fromisoformat(corte["fecha_corte"])
     fecha_str = fecha_dt.strftime("%Y%m%d_%H%M")
     filename = f"corte_inventario_{fecha_str}.xlsx"
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-    )
+    return exportacion.descarga(_corte_xlsx(corte), filename, exportacion.MEDIA_XLSX)
 
 
 # ──────────────────────────────────────────────────────────────────────────
@@ -832,7 +861,7 @@ async def exportar_corte(
 # ──────────────────────────────────────────────────────────────────────────
 @router.get("/sugerencia-ia")
 async def sugerencia_inventario_ia(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     if not settings.OPENAI_API_KEY:
@@ -18,7 +18,7 @@ ENDPOINTS EXISTENTES (no tocar firmas - POS los usa):
   GET    /low-stock             → Stock bajo
 
 ENDPOINTS NUEVOS (Fase 2):
-  GET    /v2/list              → Lista con filtros + paginación (JSON)
+  GET    /v2/list              → Lista con filtros + paginación por cursor (JSON)
   GET    /v2/search            → Búsqueda V2 nombre+aliases (POS+voz)
   GET    /v2/stats             → Estadísticas inventario
   GET    /v2/categories        → Categorías con conteo
@@ -32,23 +32,27 @@ ENDPOINTS NUEVOS (Fase 2):
   POST   /v2/import              → Importar catálogo V2
   DELETE /v2/catalog/{nicho}     → Eliminar catálogo
 """
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
 from fastapi.responses import HTMLResponse, StreamingResponse, Response
 import io
 import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import func, or_, any_, desc
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime, timezone
 
-from app.core.database import get_db
+from app.core import paginacion, schema
+from app.core.database import get_async_db, get_db
 from app.api.dependencies import get_current_user
 from app.models.user import User
 from app.models.product import Product
 from app.models.store import Store
 from app.services.product_service import ProductService
 from app.services.catalog_service import CatalogService
+from app.services import search_index
 from app.services.upload_service import (
     upload_service,
     upload_product_image_gcs,
@@ -57,9 +61,33 @@ from app.services.upload_service import (
 )
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 router = APIRouter(prefix="/products")
 
+# Listados por tienda ordenados por nombre (kardex, /v2/list). `id` al
+# final: es el desempate del cursor y evita ir a la tabla para ordenar.
+# CONCURRENTLY, por la tarea schema_indices: no frenan las ventas.
+schema.registrar_indice(
+    "idx_products_store_activo_nombre",
+    "ON products(store_id, is_active, name, id)",
+)
+schema.registrar_indice(
+    "idx_products_store_nombre_vigentes",
+    "ON products(store_id, name, id) WHERE deleted_at IS NULL",
+)
+
+# /v2/list: columnas nullable ordenadas con un valor fijo en lugar de
+# NULL, para que el cursor pueda compararlas (NULL no es < ni > nada)
+_ORDEN_V2 = {
+    "name": (Product.name, None),
+    "sale_price": (Product.sale_price, None),
+    "stock": (Product.stock, 0),
+    "category": (Product.category, ""),
+    "created_at": (Product.created_at, datetime(1970, 1, 1, tzinfo=timezone.utc)),
+}
+
 
 # ══════════════════════════════════════════════
 # HELPERS DE AUTH
@@ -226,6 +254,7 @@ async def load_sample_products(
         loaded += 1
 
     db.commit()
+    search_index.invalidar_tienda(store_id)
     return {"success": True, "message": f"✅ {loaded} productos cargados", "loaded": loaded}
 
 
@@ -280,21 +309,19 @@ async def get_low_stock(
     ]
 
 
-# ══════════════════════════════════════════════════════════════
-# FIX: app/api/v1/products.py → reemplazar search_products completo
-# ══════════════════════════════════════════════════════════════
-# Cambio clave: unnest() → array_to_string()
-# unnest() es set-returning y NO puede ir en WHERE en PostgreSQL
-# array_to_string convierte ['coca','gaseosa'] → 'coca gaseosa'
-# y se busca con ILIKE normal, sin error.
-# ══════════════════════════════════════════════════════════════
-
 @router.post("/search")
 async def search_products(
     search: ProductSearch,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
+    """
+    Búsqueda POS (type-ahead: una llamada por tecla).
+
+    El ranking sale del índice en memoria de la tienda (search_index):
+    antes cada tecla era un ILIKE '%q%' sobre nombre y
+    array_to_string(aliases), que no puede usar índice.
+    """
     try:
         query_text = search.query.lower().strip()
         query_text = query_text.rstrip('.,;:!?¡¿')
@@ -302,53 +329,31 @@ async def search_products(
         if len(query_text) < 2:
             return []
 
-        # FIX: array_to_string en vez de unnest (unnest no va en WHERE)
-        aliases_str = func.lower(
-            func.coalesce(func.array_to_string(Product.aliases, ' '), '')
-        )
+        store_id = current_user.store_id
 
-        if len(query_text) <= 3:
-            products = db.query(Product).filter(
-                Product.store_id == current_user.store_id,
-                Product.is_active == True,
-                Product.deleted_at.is_(None),
-                or_(
-                    Product.name.ilike(f"{query_text} %"),
-                    Product.name.ilike(f"% {query_text} %"),
-                    Product.name.ilike(f"% {query_text}"),
-                    func.lower(Product.name) == query_text,
-                    aliases_str.ilike(f"{query_text}%"),
-                    aliases_str.ilike(f"% {query_text}%"),
-                )
-            ).limit(search.limit).all()
-        else:
-            products = db.query(Product).filter(
-                Product.store_id == current_user.store_id,
-                Product.is_active == True,
-                Product.deleted_at.is_(None),
-                or_(
-                    Product.name.ilike(f"%{query_text}%"),
-                    aliases_str.ilike(f"%{query_text}%"),
-                )
-            ).limit(search.limit).all()
-
-        result = [
-            {
-                "id": p.id,
-                "name": p.name,
-                "barcode": p.barcode or "",
-                "sale_price": float(p.sale_price),
-                "stock": p.stock,
-                "unit": getattr(p, 'unit', 'unidad')
-            }
-            for p in products
-        ]
-
-        print(f"[Search] Query: '{query_text}' → {len(result)} productos")
+        def _buscar(sync_db: Session) -> list:
+            products = search_index.buscar_productos(
+                sync_db, store_id, query_text, limit=search.limit
+            )
+            return [
+                {
+                    "id": p.id,
+                    "name": p.name,
+                    "barcode": p.barcode or "",
+                    "sale_price": float(p.sale_price),
+                    "stock": p.stock,
+                    "unit": getattr(p, 'unit', 'unidad')
+                }
+                for p in products
+            ]
+
+        result = await db.run_sync(_buscar)
+
+        logger.debug("[Search] Query: '%s' → %s productos", query_text, len(result))
         return result
 
     except Exception as e:
-        print(f"[Search] ERROR: {str(e)}")
+        logger.warning("[Search] ERROR: %s", str(e))
         raise HTTPException(500, detail=str(e))
 
 
@@ -367,6 +372,7 @@ async def deactivate_all_products(
     ).update({"is_active": False, "deleted_at": datetime.now(timezone.utc)})
 
     db.commit()
+    search_index.invalidar_tienda(current_user.store_id)
     return {"success": True, "message": f"{updated} productos desactivados"}
 
 
@@ -385,6 +391,7 @@ async def reset_catalog(
         store.onboarding_completed = False
 
     db.commit()
+    search_index.invalidar_tienda(current_user.store_id)
     return {"success": True, "message": "Catálogo restablecido. Puedes elegir uno nuevo."}
 
 
@@ -460,8 +467,9 @@ async def create_product(
     db.add(new_product)
     db.commit()
     db.refresh(new_product)
+    search_index.actualizar_producto(new_product)
 
-    print(f"[Products] ✅ Producto creado: {new_product.name} (ID: {new_product.id})")
+    logger.info("[Products] Producto creado: %s (ID: %s)", new_product.name, new_product.id)
 
     return {
         "id": new_product.id,
@@ -489,6 +497,7 @@ async def delete_product(
     product.is_active = False
     product.deleted_at = datetime.now(timezone.utc)
     db.commit()
+    search_index.quitar_producto(current_user.store_id, product_id)
 
     return {"success": True, "message": "Producto eliminado correctamente"}
 
@@ -511,6 +520,7 @@ async def restore_product(
     product.is_active = True
     product.deleted_at = None
     db.commit()
+    search_index.actualizar_producto(product)
 
     return {"success": True, "message": "Producto restaurado correctamente"}
 
@@ -678,6 +688,7 @@ async def get_product(
 async def list_products_v2(
     page: int = Query(1, ge=1),
     per_page: int = Query(50, ge=1, le=200),
+    after: Optional[str] = None,
     category: Optional[str] = None,
     stock_status: Optional[str] = Query(None, pattern="^(normal|low|out)$"),
     is_active: Optional[bool] = None,
@@ -688,7 +699,14 @@ async def list_products_v2(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Lista productos V2 con filtros, paginación y ordenamiento."""
+    """
+    Lista productos V2 con filtros, paginación y ordenamiento.
+
+    Para la página siguiente pasar `pagination.next_cursor` en `after`
+    (con los mismos filtros y orden); `page` sigue funcionando pero se
+    vuelve lento en páginas altas. Con `after`, `total` y `pages` van
+    en null: el conteo sólo se hace en la primera página.
+    """
     query = db.query(Product).filter(
         Product.store_id == current_user.store_id,
         Product.deleted_at.is_(None)
@@ -723,16 +741,29 @@ async def list_products_v2(
             )
         )
 
-    total = query.count()
-
-    sort_column = getattr(Product, sort_by, Product.name)
-    if sort_dir == "desc":
-        query = query.order_by(desc(sort_column))
+    columna, si_nulo = _ORDEN_V2[sort_by]
+    expr = columna if si_nulo is None else func.coalesce(columna, si_nulo)
+    orden = (expr, Product.id)
+    clave = f"v2:{sort_by}:{sort_dir}"
+    descendente = sort_dir == "desc"
+
+    total = None
+    if after:
+        query = query.filter(paginacion.despues_de(
+            orden, paginacion.decodificar(after, clave, 2), descendente,
+        ))
     else:
-        query = query.order_by(sort_column)
+        total = query.count()
+        query = query.offset((page - 1) * per_page)
 
-    offset = (page - 1) * per_page
-    products = query.offset(offset).limit(per_page).all()
+    query = query.order_by(*(desc(c) if descendente else c for c in orden))
+    products = query.limit(per_page + 1).all()
+
+    def _valores(p: Product):
+        v = getattr(p, sort_by)
+        return (si_nulo if v is None else v, p.id)
+
+    next_cursor = paginacion.siguiente(products, per_page, _valores, clave)
 
     return {
         "products": [p.to_dict() for p in products],
@@ -740,7 +771,8 @@ async def list_products_v2(
             "page": page,
             "per_page": per_page,
             "total": total,
-            "pages": (total + per_page - 1) // per_page
+            "pages": (total + per_page - 1) // per_page if total is not None else None,
+            "next_cursor": next_cursor,
         }
     }
 
@@ -752,21 +784,25 @@ async def search_products_v2(
     category: Optional[str] = None,
     in_stock: bool = False,
     for_pos: bool = False,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Búsqueda V2 por nombre + aliases (para POS mejorado y voz).
     Si for_pos=true retorna formato ligero.
     """
-    results = CatalogService.search_products(
-        db, current_user.store_id, q,
-        limit=limit, category=category, only_in_stock=in_stock
-    )
+    store_id = current_user.store_id
+
+    def _buscar(sync_db: Session) -> list:
+        results = CatalogService.search_products(
+            sync_db, store_id, q,
+            limit=limit, category=category, only_in_stock=in_stock
+        )
+        if for_pos:
+            return [p.to_pos_dict() for p in results]
+        return [p.to_dict() for p in results]
 
-    if for_pos:
-        return {"products": [p.to_pos_dict() for p in results]}
-    return {"products": [p.to_dict() for p in results]}
+    return {"products": await db.run_sync(_buscar)}
 
 
 @router.get("/v2/low-stock")
@@ -914,6 +950,7 @@ async def create_product_v2(
     db.add(product)
     db.commit()
     db.refresh(product)
+    search_index.actualizar_producto(product)
 
     return {"product": product.to_dict(), "message": "Producto creado"}
 
@@ -995,6 +1032,7 @@ async def update_product_v2(
     product.updated_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(product)
+    search_index.actualizar_producto(product)
 
     return {"product": product.to_dict(), "message": "Producto actualizado"}
 
@@ -1123,6 +1161,7 @@ async def toggle_product_v2(
     product.is_active = not product.is_active
     product.updated_at = datetime.now(timezone.utc)
     db.commit()
+    search_index.actualizar_producto(product)
 
     status = "activado" if product.is_active else "desactivado"
     return {
@@ -1,21 +1,29 @@
 """
 Endpoints de reportes para QueVendí PRO
+
+Las métricas del día salen de los agregados por hora/producto
+(app.services.agregados_ventas), no de sumar las ventas en cada carga.
 """
-import csv
-import io
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, cast, Date
+from sqlalchemy import cast, Date
 from datetime import datetime, date, timedelta, timezone, time
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.core.tiempo import PERU_TZ, dia_operativo_peru, hoy_peru
 from app.models.sale import Sale, SaleItem
 from app.models.product import Product
+from app.services import agregados_ventas, exportacion
 from app.api.dependencies import get_current_user
 from app.models.user import User
 from app.services.auth_service import AuthService
 
+logger = logging.getLogger(__name__)
+
+# Rango máximo de /export-csv (días)
+MAX_DIAS_EXPORT = 366
+
 def _peru_window(d: date):
     """
     Retorna (inicio, fin_exclusivo) del día d en zona Perú.
@@ -47,7 +55,7 @@ async def get_user_export(
             if user:
                 return user
         except Exception as e:
-            print(f"[Auth export] token query inválido: {e}")
+            logger.info("[Auth export] token query inválido: %s", e)
     return await get_current_user(request, db)
 
 
@@ -59,50 +67,22 @@ router = APIRouter(prefix="/reports")
 # ──────────────────────────────────────────────────────────────────────────
 @router.get("/stats/today")
 async def get_today_stats(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Métricas del día (JSON) para tarjetas del dashboard de reportes."""
     today_peru = hoy_peru()
-    today_start, today_end = _peru_window(today_peru)
-    yesterday_start, yesterday_end = _peru_window(today_peru - timedelta(days=1))
+    yesterday = today_peru - timedelta(days=1)
 
-    today_sales = db.query(Sale).filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= today_start,
-        Sale.created_at < today_end,
-    ).all()
-
-    yesterday_sales = db.query(Sale).filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= yesterday_start,
-        Sale.created_at < yesterday_end,
-    ).all()
-
-    today_total = float(sum((s.total or 0) for s in today_sales))
-    today_count = len(today_sales)
-    yesterday_total = float(sum((s.total or 0) for s in yesterday_sales))
+    totales = agregados_ventas.totales_por_dia(db, current_user.store_id, yesterday, today_peru)
+    today_total, today_count = totales.get(today_peru, (0.0, 0))
+    yesterday_total, _ = totales.get(yesterday, (0.0, 0))
 
     average = (today_total / today_count) if today_count > 0 else 0.0
     delta_ventas = ((today_total - yesterday_total) / yesterday_total * 100) if yesterday_total > 0 else 0.0
 
     # Ganancia estimada del día: SUM((unit_price - cost_price) * quantity)
-    ganancia_row = db.query(
-        func.coalesce(
-            func.sum(
-                (SaleItem.unit_price - func.coalesce(Product.cost_price, 0)) * SaleItem.quantity
-            ),
-            0,
-        )
-    ).join(Sale, Sale.id == SaleItem.sale_id) \
-     .join(Product, Product.id == SaleItem.product_id) \
-     .filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= today_start,
-        Sale.created_at < today_end,
-     ).scalar()
-
-    ganancia_estimada = float(ganancia_row or 0)
+    ganancia_estimada = agregados_ventas.margen(db, current_user.store_id, today_peru)
 
     return {
         "total": today_total,
@@ -118,28 +98,16 @@ async def get_today_stats(
 # ──────────────────────────────────────────────────────────────────────────
 @router.get("/top-products", response_class=HTMLResponse)
 async def get_top_products_html(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Top 10 productos más vendidos del día en HTML."""
     today_peru = hoy_peru()
-    today_start, today_end = _peru_window(today_peru)
-
-    top_products = db.query(
-        Product.id,
-        Product.name,
-        Product.unit,
-        func.round(func.sum(SaleItem.quantity), 2).label('total_quantity'),
-        func.sum(SaleItem.subtotal).label('total_revenue')
-    ).join(SaleItem, SaleItem.product_id == Product.id) \
-     .join(Sale, Sale.id == SaleItem.sale_id) \
-     .filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= today_start,
-        Sale.created_at < today_end,
-     ).group_by(Product.id, Product.name, Product.unit) \
-     .order_by(desc('total_quantity')) \
-     .limit(10).all()
+    top_products = [
+        (r.product_id, r.name, r.unit, r.cantidad, r.ingresos)
+        for r in agregados_ventas.por_producto(db, current_user.store_id, today_peru, today_peru,
+                                               orden="cantidad", limite=10)
+    ]
 
     if not top_products:
         return HTMLResponse(content="""
@@ -176,25 +144,11 @@ async def get_top_products_html(
 # ──────────────────────────────────────────────────────────────────────────
 @router.get("/hourly-sales")
 async def get_hourly_sales(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Ventas por hora del día (Perú) para gráfico Chart.js."""
-    today_peru = hoy_peru()
-    today_start, today_end = _peru_window(today_peru)
-
-    hour_peru = func.extract('hour', Sale.created_at - timedelta(hours=5))
-
-    hourly_data = db.query(
-        hour_peru.label('hour'),
-        func.sum(Sale.total).label('total')
-    ).filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= today_start,
-        Sale.created_at < today_end,
-    ).group_by(hour_peru).order_by(hour_peru).all()
-
-    hours_dict = {int(h): float(t or 0) for h, t in hourly_data}
+    hours_dict = agregados_ventas.por_hora(db, current_user.store_id, hoy_peru())
     current_hour = datetime.now(PERU_TZ).hour
 
     return [
@@ -208,21 +162,14 @@ async def get_hourly_sales(
 # ──────────────────────────────────────────────────────────────────────────
 @router.get("/payment-methods")
 async def get_payment_methods(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Ventas por método de pago para gráfico donut."""
-    today_peru = hoy_peru()
-    today_start, today_end = _peru_window(today_peru)
-
-    payment_data = db.query(
-        Sale.payment_method,
-        func.sum(Sale.total).label('total')
-    ).filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= today_start,
-        Sale.created_at < today_end,
-    ).group_by(Sale.payment_method).all()
+    payment_data = [
+        (method, total)
+        for method, _, total in agregados_ventas.por_metodo(db, current_user.store_id, hoy_peru())
+    ]
 
     name_map = {'efectivo': 'Efectivo', 'yape': 'Yape', 'plin': 'Plin', 'tarjeta': 'Tarjeta'}
     return [
@@ -236,31 +183,21 @@ async def get_payment_methods(
 # ──────────────────────────────────────────────────────────────────────────
 @router.get("/sales-by-category")
 async def get_sales_by_category(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Ventas del día agrupadas por categoría con margen estimado."""
     today_peru = hoy_peru()
-    inicio, fin = _peru_window(today_peru)
-
-    rows = db.query(
-        Product.category,
-        func.coalesce(func.sum(SaleItem.subtotal), 0).label('total_ventas'),
-        func.coalesce(func.round(func.sum(SaleItem.quantity), 2), 0).label('num_items'),
-        func.coalesce(
-            func.sum(
-                (SaleItem.unit_price - func.coalesce(Product.cost_price, 0)) * SaleItem.quantity
-            ),
-            0,
-        ).label('margen_est'),
-    ).join(SaleItem, SaleItem.product_id == Product.id) \
-     .join(Sale, Sale.id == SaleItem.sale_id) \
-     .filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= inicio,
-        Sale.created_at < fin,
-     ).group_by(Product.category) \
-     .order_by(desc('total_ventas')).all()
+    categorias: dict = {}
+    for r in agregados_ventas.por_producto(db, current_user.store_id, today_peru, today_peru):
+        c = categorias.setdefault(r.category, [0.0, 0.0, 0.0])
+        c[0] += float(r.ingresos or 0)
+        c[1] += float(r.cantidad or 0)
+        c[2] += float(r.margen or 0)
+    rows = sorted(
+        ((cat, total, items, margen) for cat, (total, items, margen) in categorias.items()),
+        key=lambda x: -x[1],
+    )
 
     return [
         {
@@ -283,80 +220,35 @@ async def get_cierre_caja(
 ):
     """Resumen completo de cierre de caja del día."""
     today_peru = hoy_peru()
-    inicio, fin = _peru_window(today_peru)
+    store_id = current_user.store_id
 
-    sales = db.query(Sale).filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= inicio,
-        Sale.created_at < fin,
-    ).all()
-
-    total = float(sum((s.total or 0) for s in sales))
-    num_ventas = len(sales)
+    metodo_rows = agregados_ventas.por_metodo(db, store_id, today_peru)
+    total = sum(t for _, _, t in metodo_rows)
+    num_ventas = sum(n for _, n, _ in metodo_rows)
     ticket_promedio = (total / num_ventas) if num_ventas > 0 else 0.0
 
     # Desglose por método de pago
-    metodo_rows = db.query(
-        Sale.payment_method,
-        func.count(Sale.id).label('count'),
-        func.coalesce(func.sum(Sale.total), 0).label('total'),
-    ).filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= inicio,
-        Sale.created_at < fin,
-    ).group_by(Sale.payment_method).all()
-
     name_map = {'efectivo': 'Efectivo', 'yape': 'Yape', 'plin': 'Plin', 'tarjeta': 'Tarjeta'}
     por_metodo = [
         {
             "method": name_map.get(method, method or 'Otro'),
-            "count": int(count or 0),
-            "total": float(mtotal or 0),
+            "count": count,
+            "total": mtotal,
         }
         for method, count, mtotal in metodo_rows
     ]
 
     # Hora pico
-    hour_peru = func.extract('hour', Sale.created_at - timedelta(hours=5))
-    hora_row = db.query(
-        hour_peru.label('hour'),
-        func.sum(Sale.total).label('total'),
-    ).filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= inicio,
-        Sale.created_at < fin,
-    ).group_by(hour_peru).order_by(desc('total')).first()
-    hora_pico = int(hora_row[0]) if hora_row and hora_row[0] is not None else None
+    horas = agregados_ventas.por_hora(db, store_id, today_peru)
+    hora_pico = max(horas, key=horas.get) if horas else None
 
     # Producto más vendido
-    top_row = db.query(
-        Product.name,
-        func.round(func.sum(SaleItem.quantity), 2).label('qty'),
-    ).join(SaleItem, SaleItem.product_id == Product.id) \
-     .join(Sale, Sale.id == SaleItem.sale_id) \
-     .filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= inicio,
-        Sale.created_at < fin,
-     ).group_by(Product.id, Product.name) \
-     .order_by(desc('qty')).first()
-    producto_top = top_row[0] if top_row else None
+    top = agregados_ventas.por_producto(db, store_id, today_peru, today_peru,
+                                       orden="cantidad", limite=1)
+    producto_top = top[0].name if top else None
 
     # Ganancia estimada
-    ganancia = db.query(
-        func.coalesce(
-            func.sum(
-                (SaleItem.unit_price - func.coalesce(Product.cost_price, 0)) * SaleItem.quantity
-            ),
-            0,
-        )
-    ).join(Sale, Sale.id == SaleItem.sale_id) \
-     .join(Product, Product.id == SaleItem.product_id) \
-     .filter(
-        Sale.store_id == current_user.store_id,
-        Sale.created_at >= inicio,
-        Sale.created_at < fin,
-     ).scalar()
+    ganancia = agregados_ventas.margen(db, store_id, today_peru)
 
     return {
         "total": total,
@@ -403,19 +295,37 @@ async def get_low_stock(
 @router.get("/export-csv")
 async def export_sales_csv(
     fecha: str = None,
-    db: Session = Depends(get_db),
+    desde: str = None,
+    hasta: str = None,
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_user_export),
 ):
-    """Exporta ventas del día como CSV. Acepta token vía ?token= para descarga directa."""
-    if fecha:
+    """
+    Exporta ventas como CSV: del día (`fecha`, por defecto hoy) o de un
+    rango `desde`–`hasta` (inclusive, hasta MAX_DIAS_EXPORT días). Se
+    envía en streaming: la memoria no crece con el rango. Acepta token
+    vía ?token= para descarga directa.
+    """
+    def _parse(valor: str) -> date:
         try:
-            target = datetime.strptime(fecha, "%Y-%m-%d").date()
+            return datetime.strptime(valor, "%Y-%m-%d").date()
         except ValueError:
             raise HTTPException(status_code=400, detail="Formato de fecha inválido (use YYYY-MM-DD)")
+
+    if desde or hasta:
+        d_desde = _parse(desde or hasta)
+        d_hasta = _parse(hasta or desde)
+        if d_hasta < d_desde:
+            raise HTTPException(status_code=400, detail="'hasta' es anterior a 'desde'")
+        if (d_hasta - d_desde).days >= MAX_DIAS_EXPORT:
+            raise HTTPException(status_code=400, detail=f"Rango máximo: {MAX_DIAS_EXPORT} días")
+        filename = f"ventas-{d_desde.isoformat()}_{d_hasta.isoformat()}.csv"
     else:
-        target = hoy_peru()
+        d_desde = d_hasta = _parse(fecha) if fecha else hoy_peru()
+        filename = f"ventas-{d_desde.isoformat()}.csv"
 
-    inicio, fin = _peru_window(target)
+    inicio, _ = _peru_window(d_desde)
+    _, fin = _peru_window(d_hasta)
 
     rows = db.query(
         Sale.created_at,
@@ -431,43 +341,37 @@ async def export_sales_csv(
         Sale.store_id == current_user.store_id,
         Sale.created_at >= inicio,
         Sale.created_at < fin,
-     ).order_by(Sale.created_at.asc()).all()
+     ).order_by(Sale.created_at.asc(), Sale.id.asc()) \
+     .yield_per(exportacion.FILAS_POR_TANDA)
+
+    name_map = {'efectivo': 'Efectivo', 'yape': 'Yape', 'plin': 'Plin', 'tarjeta': 'Tarjeta'}
 
-    buffer = io.StringIO()
-    buffer.write('﻿')  # BOM para Excel
-    writer = csv.writer(buffer, delimiter=';')
-    writer.writerow([
+    def _filas():
+        for created, method, prod, cat, qty, price, sub in rows:
+            # Convertir UTC → Perú para presentación
+            if created and created.tzinfo is None:
+                created_peru = created.replace(tzinfo=timezone.utc).astimezone(PERU_TZ)
+            elif created:
+                created_peru = created.astimezone(PERU_TZ)
+            else:
+                created_peru = None
+
+            yield [
+                created_peru.strftime("%Y-%m-%d") if created_peru else "",
+                created_peru.strftime("%H:%M:%S") if created_peru else "",
+                prod or "",
+                cat or "",
+                f"{float(qty or 0):.3f}",
+                f"{float(price or 0):.2f}",
+                f"{float(sub or 0):.2f}",
+                name_map.get(method, method or ""),
+            ]
+
+    encabezado = [
         "fecha", "hora", "producto", "categoria",
         "cantidad", "precio_unit", "subtotal", "metodo_pago",
-    ])
-
-    name_map = {'efectivo': 'Efectivo', 'yape': 'Yape', 'plin': 'Plin', 'tarjeta': 'Tarjeta'}
-    for created, method, prod, cat, qty, price, sub in rows:
-        # Convertir UTC → Perú para presentación
-        if created and created.tzinfo is None:
-            created_peru = created.replace(tzinfo=timezone.utc).astimezone(PERU_TZ)
-        elif created:
-            created_peru = created.astimezone(PERU_TZ)
-        else:
-            created_peru = None
-
-        fecha_str = created_peru.strftime("%Y-%m-%d") if created_peru else ""
-        hora_str = created_peru.strftime("%H:%M:%S") if created_peru else ""
-        writer.writerow([
-            fecha_str,
-            hora_str,
-            prod or "",
-            cat or "",
-            f"{float(qty or 0):.3f}",
-            f"{float(price or 0):.2f}",
-            f"{float(sub or 0):.2f}",
-            name_map.get(method, method or ""),
-        ])
-
-    buffer.seek(0)
-    filename = f"ventas-{target.isoformat()}.csv"
-    return StreamingResponse(
-        iter([buffer.getvalue()]),
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    ]
+    return exportacion.descarga(
+        exportacion.csv_stream(encabezado, _filas(), delimiter=";"),
+        filename, exportacion.MEDIA_CSV,
     )
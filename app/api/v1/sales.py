@@ -1,21 +1,28 @@
 """
 Endpoints de ventas para QueVendí
 """
+import logging
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db
 from app.schemas.sale import SaleCreate, SaleResponse
+from app.services import agregados_ventas
 from app.services.sale_service import SaleService
-from app.services.voice_service import VoiceService
+from app.services.stock_service import StockInsuficienteError
+from app.services.voice_service import (
+    MatchResult, PendingAmbiguity, VoiceService, ambiguity_cache,
+)
 from app.services.product_service import ProductService
 from app.api.dependencies import get_current_user
 from app.core.tiempo import dia_operativo_peru, hoy_peru
 from app.models.user import User
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, select
 from typing import List
 from datetime import datetime, date, timezone
 from pydantic import BaseModel
 
+from app.models.product import Product
 from app.models.sale import Sale
 from fastapi.responses import HTMLResponse
 
@@ -23,12 +30,29 @@ from fastapi import Header
 from typing import Optional as Opt
 from datetime import datetime as dt
 
+logger = logging.getLogger(__name__)
+
 
 router = APIRouter(prefix="/sales")
 
 class VoiceCommandRequest(BaseModel):
     """Comando de voz"""
     text: str
+    session_id: Opt[str] = None
+
+
+def _ambiguous_options(match: MatchResult, extra=()) -> list:
+    """Opciones de un match ambiguo para el modal del frontend"""
+    return [
+        {
+            "id": p.id,
+            "name": p.name,
+            "price": p.sale_price,
+            **{k: getattr(p, k, default) for k, default in extra},
+        }
+        for p in match.options
+    ]
+
 
 @router.post("/voice/parse")
 async def parse_voice_command(
@@ -39,8 +63,34 @@ async def parse_voice_command(
     """
     Parsear comando de voz y procesar acción
     Soporta: ventas, agregar, cambiar, cancelar, confirmar, quitar
+    
+    Si un producto es ambiguo, el comando queda pendiente en la sesión
+    (ambiguity_cache) y un "el segundo" / "opción 3" lo completa con la
+    opción elegida, sin volver a puntuar el catálogo.
     """
-    parsed = VoiceService.parse_command(command.text)
+    session_key = (current_user.store_id, current_user.id, command.session_id or "")
+    
+    pending = None
+    choice = VoiceService.parse_selection(command.text)
+    if choice is not None:
+        pending = ambiguity_cache.pop(session_key)
+    
+    if pending is not None:
+        key = pending.next_key()
+        ids = pending.options.pop(key)
+        if not -len(ids) <= choice < len(ids):
+            pending.options = {key: ids, **pending.options}
+            ambiguity_cache.put(session_key, pending)
+            raise HTTPException(400, detail=f"Solo hay {len(ids)} opciones")
+        pending.resolved[key] = ids[choice]
+        parsed = pending.parsed
+        resolved = pending.resolved
+        cached_options = pending.options
+    else:
+        ambiguity_cache.discard(session_key)
+        parsed = VoiceService.parse_command(command.text)
+        resolved = {}
+        cached_options = {}
     
     if not parsed:
         raise HTTPException(
@@ -48,6 +98,36 @@ async def parse_voice_command(
             detail="No se pudo entender el comando"
         )
     
+    # Catálogo cargado sólo si alguna consulta necesita puntuarse
+    store_products = []
+    
+    def find(key: str, query: str) -> MatchResult:
+        """Producto para la consulta `key` (elegido, pendiente o fuzzy)"""
+        if key in resolved or key in cached_options:
+            ids = [resolved[key]] if key in resolved else cached_options[key]
+            by_id = {
+                p.id: p for p in db.query(Product).filter(
+                    Product.id.in_(ids),
+                    Product.store_id == current_user.store_id
+                ).all()
+            }
+            ranked = [(by_id[i], 100.0) for i in ids if i in by_id]
+            if key in resolved:
+                return MatchResult(query=query, product=ranked[0][0] if ranked else None, ranked=ranked)
+            return MatchResult(query=query, ranked=ranked, ambiguous=len(ranked) > 1,
+                               product=ranked[0][0] if len(ranked) == 1 else None)
+        if not store_products:
+            store_products.extend(ProductService(db).get_products_by_store(current_user.store_id))
+        return VoiceService.find_product_fuzzy(query, store_products)
+    
+    def remember(pending_parsed: dict, options: dict) -> None:
+        """Dejar el comando pendiente hasta que el usuario elija"""
+        ambiguity_cache.put(session_key, PendingAmbiguity(
+            parsed=pending_parsed,
+            options={k: [p.id for p in m.options] for k, m in options.items()},
+            resolved=dict(resolved),
+        ))
+    
     # Comandos simples
     if parsed['type'] in ['cancel', 'confirm']:
         return {
@@ -64,26 +144,16 @@ async def parse_voice_command(
     
     # 🆕 AGREGAR: Venta por precio objetivo
     if parsed['type'] == 'sale_by_price':
-        product_service = ProductService(db)
-        products = product_service.get_products_by_store(current_user.store_id)
-        
-        VoiceService._last_ambiguous_options = []
-        product = VoiceService.find_product_fuzzy(parsed['product_query'], products)
+        match = find('product_query', parsed['product_query'])
+        product = match.product
         
-        if product is None and VoiceService._last_ambiguous_options:
+        if match.ambiguous:
+            remember(parsed, {'product_query': match})
             return {
                 "type": "ambiguous_sale_by_price",
                 "product_query": parsed['product_query'],
                 "target_amount": parsed['target_amount'],
-                "options": [
-                    {
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.sale_price,
-                        "unit": getattr(p, 'unit', 'kg')
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ],
+                "options": _ambiguous_options(match, extra=[('unit', 'kg')]),
                 "message": f"¿Cuál {parsed['product_query']}?"
             }
         
@@ -113,27 +183,16 @@ async def parse_voice_command(
     # COMANDO: REMOVE (quitar producto)
     # ========================================
     if parsed['type'] == 'remove':
-        product_service = ProductService(db)
-        products = product_service.get_products_by_store(current_user.store_id)
-        
-        # Limpiar opciones ambiguas previas
-        VoiceService._last_ambiguous_options = []
-        
-        product = VoiceService.find_product_fuzzy(parsed['product_query'], products)
+        match = find('product_query', parsed['product_query'])
+        product = match.product
         
         # Verificar ambigüedad
-        if product is None and VoiceService._last_ambiguous_options:
+        if match.ambiguous:
+            remember(parsed, {'product_query': match})
             return {
                 "type": "ambiguous_remove",
                 "product_query": parsed['product_query'],
-                "options": [
-                    {
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.sale_price
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ],
+                "options": _ambiguous_options(match),
                 "message": f"¿Cuál {parsed['product_query']} quieres eliminar?"
             }
         
@@ -163,46 +222,32 @@ async def parse_voice_command(
                 detail="Solo el dueño puede cambiar precios. Contacta al administrador."
             )
         
-        product_service = ProductService(db)
-        products = product_service.get_products_by_store(current_user.store_id)
-        
-        # 1. Limpiar opciones ambiguas ANTES de buscar
-        VoiceService._last_ambiguous_options = []
-        
-        # 2. Buscar producto UNA SOLA VEZ
-        product = VoiceService.find_product_fuzzy(parsed['product_query'], products)
+        # 1. Buscar producto UNA SOLA VEZ
+        match = find('product_query', parsed['product_query'])
+        product = match.product
         
-        # 3. Logs DESPUÉS de buscar
-        print(f"[API] Producto encontrado: {product.name if product else 'None'}")
-        print(f"[API] Opciones ambiguas: {len(VoiceService._last_ambiguous_options)}")
-        if VoiceService._last_ambiguous_options:
-            print(f"[API] Nombres: {[p.name for p in VoiceService._last_ambiguous_options]}")
+        logger.debug("[API] Producto encontrado: %s", product.name if product else 'None')
+        logger.debug("[API] Opciones ambiguas: %s", len(match.options))
         
-        # 4. Verificar ambigüedad
-        if product is None and VoiceService._last_ambiguous_options:
+        # 2. Verificar ambigüedad
+        if match.ambiguous:
+            remember(parsed, {'product_query': match})
             return {
                 "type": "ambiguous_price",
                 "product_query": parsed['product_query'],
                 "new_price": parsed['new_price'],
-                "options": [
-                    {
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.sale_price
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ],
+                "options": _ambiguous_options(match),
                 "message": f"¿A cuál {parsed['product_query']} cambiar el precio?"
             }
         
-        # 5. Si no encontró nada
+        # 3. Si no encontró nada
         if not product:
             raise HTTPException(
                 status_code=404,
                 detail=f"No se encontró: {parsed['product_query']}"
             )
         
-        # 6. Retornar resultado
+        # 4. Retornar resultado
         return {
             "type": "change_price",
             "product": {
@@ -217,26 +262,17 @@ async def parse_voice_command(
     # COMANDO: CHANGE_PRODUCT (cambiar X por Y)
     # ========================================
     if parsed['type'] == 'change_product':
-        product_service = ProductService(db)
-        products = product_service.get_products_by_store(current_user.store_id)
-        
         # Buscar producto viejo
-        VoiceService._last_ambiguous_options = []
-        old_product = VoiceService.find_product_fuzzy(parsed['old_product'], products)
+        old_match = find('old_product', parsed['old_product'])
+        old_product = old_match.product
         
-        if old_product is None and VoiceService._last_ambiguous_options:
+        if old_match.ambiguous:
+            remember(parsed, {'old_product': old_match})
             return {
                 "type": "ambiguous_change_old",
                 "old_product_query": parsed['old_product'],
                 "new_product_query": parsed['new_product'],
-                "options": [
-                    {
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.sale_price
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ],
+                "options": _ambiguous_options(old_match),
                 "message": f"¿Cuál {parsed['old_product']} quieres cambiar?"
             }
         
@@ -244,10 +280,12 @@ async def parse_voice_command(
             raise HTTPException(404, detail=f"No se encontró: {parsed['old_product']}")
         
         # Buscar producto nuevo
-        VoiceService._last_ambiguous_options = []
-        new_product = VoiceService.find_product_fuzzy(parsed['new_product'], products)
+        new_match = find('new_product', parsed['new_product'])
+        new_product = new_match.product
         
-        if new_product is None and VoiceService._last_ambiguous_options:
+        if new_match.ambiguous:
+            resolved['old_product'] = old_product.id
+            remember(parsed, {'new_product': new_match})
             return {
                 "type": "ambiguous_change_new",
                 "old_product": {
@@ -255,14 +293,7 @@ async def parse_voice_command(
                     "name": old_product.name
                 },
                 "new_product_query": parsed['new_product'],
-                "options": [
-                    {
-                        "id": p.id,
-                        "name": p.name,
-                        "price": p.sale_price
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ],
+                "options": _ambiguous_options(new_match),
                 "message": f"¿Por cuál {parsed['new_product']} cambiar?"
             }
         
@@ -285,53 +316,29 @@ async def parse_voice_command(
     # ========================================
     # COMANDO: SALE / ADD (venta o agregar)
     # ========================================
-    product_service = ProductService(db)
-    products = product_service.get_products_by_store(current_user.store_id)
-
-    # ⬇️⬇️⬇️ AGREGAR ESTE LOG ⬇️⬇️⬇️
-    print(f"[API] Productos disponibles en tienda: {len(products)}")
-    # ⬆️⬆️⬆️ FIN LOG ⬆️⬆️⬆️
-    
     cart_items = []
     not_found = []
-    ambiguous_items = []  # ✅ NUEVO: Lista de items ambiguos
+    ambiguous_items = []  # Items ambiguos
+    ambiguous_matches = []  # (item, match) para dejar pendiente
     
-    for item in parsed['items']:
-        # ⬇️⬇️⬇️ AGREGAR ESTE LOG ⬇️⬇️⬇️
-        print(f"[API] 🔍 Buscando: '{item['product_query']}'")
-        # ⬆️⬆️⬆️ FIN LOG ⬆️⬆️⬆️
-
-        # Limpiar opciones ambiguas previas antes de cada búsqueda
-        VoiceService._last_ambiguous_options = []
+    for i, item in enumerate(parsed['items']):
+        logger.debug("[API] Buscando: '%s'", item['product_query'])
+        
+        match = find(f"items.{i}", item['product_query'])
+        product = match.product
         
-        # ⬇️⬇️⬇️ AGREGAR ESTE LOG ⬇️⬇️⬇️
-        print(f"[API] 📞 Llamando a find_product_fuzzy()...")
-        # ⬆️⬆️⬆️ FIN LOG ⬆️⬆️⬆️
-
-        product = VoiceService.find_product_fuzzy(item['product_query'], products)
-
-         # ⬇️⬇️⬇️ AGREGAR ESTE LOG ⬇️⬇️⬇️
-        print(f"[API] ✅ Retornó: {product.name if product else 'None'}")
-        print(f"[API] 📋 Opciones ambiguas: {len(VoiceService._last_ambiguous_options)}")
-        if VoiceService._last_ambiguous_options:
-            print(f"[API] 📋 Nombres: {[p.name for p in VoiceService._last_ambiguous_options]}")
-        # ⬆️⬆️⬆️ FIN LOG ⬆️⬆️⬆️
+        logger.debug("[API] Retornó: %s", product.name if product else 'None')
+        if match.ambiguous:
+            logger.debug("[API] Opciones ambiguas: %s", [p.name for p in match.options])
         
-        # ✅ NUEVO: Verificar si hay ambigüedad
-        if product is None and VoiceService._last_ambiguous_options:
+        # Verificar si hay ambigüedad
+        if match.ambiguous:
             ambiguous_items.append({
                 'query': item['product_query'],
                 'quantity': item['quantity'],
-                'options': [
-                    {
-                        'id': p.id,
-                        'name': p.name,
-                        'price': p.sale_price,
-                        'stock': p.stock
-                    }
-                    for p in VoiceService._last_ambiguous_options
-                ]
+                'options': _ambiguous_options(match, extra=[('stock', None)])
             })
+            ambiguous_matches.append((item, match))
             continue
         
         if not product:
@@ -361,8 +368,14 @@ async def parse_voice_command(
             "subtotal": subtotal
         })
     
-    # ✅ NUEVO: Si hay items ambiguos, devolver para que el usuario elija
+    # Si hay items ambiguos, devolver para que el usuario elija
     if ambiguous_items:
+        # Sólo quedan pendientes los ambiguos: los encontrados ya van al carrito
+        resolved.clear()
+        remember(
+            {**parsed, 'items': [item for item, _ in ambiguous_matches]},
+            {f"items.{j}": match for j, (_, match) in enumerate(ambiguous_matches)},
+        )
         return {
             "type": "ambiguous",
             "ambiguous_items": ambiguous_items,
@@ -392,7 +405,7 @@ async def parse_voice_command(
 @router.post("", response_model=SaleResponse)
 async def create_sale(
     sale_data: SaleCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user),
     # Headers opcionales para ventas offline
     x_offline_sale: Opt[str] = Header(None),
@@ -400,46 +413,64 @@ async def create_sale(
     x_created_at: Opt[str] = Header(None),
     x_local_id: Opt[str] = Header(None),
 ):
-    """Crear venta (normal u offline sincronizada)"""
-    
+    """
+    Crear venta (normal u offline sincronizada).
+
+    Sesión async: SaleService corre entero dentro de `run_sync`, así una
+    caja esperando su commit no frena al resto de requests del worker.
+    """
+    user_id, store_id = current_user.id, current_user.store_id
+
     # ── Detectar duplicados offline ──
     if x_verification_code:
-        existing = db.query(Sale).filter(
-            Sale.verification_code == x_verification_code
-        ).first()
-        if existing:
+        existing_id = (await db.execute(
+            select(Sale.id).where(Sale.verification_code == x_verification_code)
+        )).scalar()
+        if existing_id:
             # Ya se sincronizó antes → retornar la existente (idempotente)
-            sale_service = SaleService(db)
             from fastapi.responses import JSONResponse
             return JSONResponse(
                 status_code=409,
                 content={
                     "detail": "Venta ya sincronizada",
-                    "sale_id": existing.id,
+                    "sale_id": existing_id,
                     "verification_code": x_verification_code
                 }
             )
     
     # ── Crear venta normal ──
-    sale_service = SaleService(db)
-    sale = sale_service.create_sale(sale_data, current_user.id, current_user.store_id)
-    
-    # ── Si es venta offline, guardar campos extra ──
-    if x_offline_sale == "true" and x_verification_code:
-        sale.is_offline = True
-        sale.verification_code = x_verification_code
-        
-        if x_created_at:
-            try:
-                sale.offline_created_at = dt.fromisoformat(x_created_at.replace('Z', '+00:00'))
-            except (ValueError, AttributeError):
-                sale.offline_created_at = None
-        
-        db.commit()
-        db.refresh(sale)
-        print(f"[Sales] ✅ Venta offline sincronizada: ID {sale.id}, code={x_verification_code}")
-    
-    return sale_service.to_response(sale)
+    # Una venta offline ya ocurrió en el mostrador: se aplica aunque deje
+    # stock negativo. Sólo las ventas en vivo respetan la política.
+    es_offline = x_offline_sale == "true"
+
+    def _registrar(sync_db: Session) -> dict:
+        sale_service = SaleService(sync_db)
+        sale = sale_service.create_sale(
+            sale_data, user_id, store_id,
+            permitir_negativo=True if es_offline else None,
+        )
+
+        # ── Si es venta offline, guardar campos extra ──
+        if es_offline and x_verification_code:
+            sale.is_offline = True
+            sale.verification_code = x_verification_code
+
+            if x_created_at:
+                try:
+                    sale.offline_created_at = dt.fromisoformat(x_created_at.replace('Z', '+00:00'))
+                except (ValueError, AttributeError):
+                    sale.offline_created_at = None
+
+            sync_db.commit()
+            sync_db.refresh(sale)
+            logger.info("[Sales] Venta offline sincronizada: ID %s, code=%s", sale.id, x_verification_code)
+
+        return sale_service.to_response(sale)
+
+    try:
+        return await db.run_sync(_registrar)
+    except StockInsuficienteError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
 
 # ════════════════════════════════════════════════
@@ -496,7 +527,7 @@ async def agregar_pago_venta(
         raise HTTPException(422, str(e))
     except Exception as e:
         db.rollback()
-        print(f"[Sales] Error agregando pago: {e}")
+        logger.warning("[Sales] Error agregando pago: %s", e)
         raise HTTPException(500, "No se pudo registrar el pago")
 
     return {"success": True, "pago": pago,
@@ -740,7 +771,7 @@ async def get_today_summary(
             "date": today.isoformat()
         }
     except Exception as e:
-        print(f"[Sales Summary] ERROR: {str(e)}")
+        logger.warning("[Sales Summary] ERROR: %s", str(e))
         return {"count": 0, "total": 0.0, "date": today.isoformat()}
     
 
@@ -770,6 +801,7 @@ async def void_sale(
     sale.status = "cancelled"
     sale.cancelled_at = datetime.now(timezone.utc)
     sale.cancelled_by = current_user.id
+    agregados_ventas.aplicar_venta(db, sale.id, -1)
     db.commit()
 
     return {"message": "Venta anulada", "sale_id": sale_id}
\ No newline at end of file
@@ -22,6 +22,7 @@ from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Optional
+from app.core import schema
 from app.core.database import get_db
 from app.models.store import Store
 from app.models.user import User
@@ -123,13 +124,11 @@ CREATE TABLE IF NOT EXISTS registro_intentos (
 );
 """
 
+schema.registrar("stores_registro", MIGRATION_SQL)
+
+
 def _ensure_tables(db: Session):
-    try:
-        db.execute(text(MIGRATION_SQL))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.warning(f"[StoreRegister] Migración: {e}")
+    schema.asegurar("stores_registro")
 
 # ════════════════════════════════════════════════
 # ENDPOINTS
@@ -6,14 +6,15 @@ de vencimiento por último dígito del RUC y gastos operativos.
 import logging
 from datetime import date, datetime
 from decimal import Decimal
-from typing import Optional, List
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
 from sqlalchemy import extract, func, text
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core import jobs
+from app.core.database import get_db, get_read_db
 from app.api.dependencies import get_current_user
 from app.models.user import User
 from app.models.store import Store
@@ -38,6 +39,24 @@ LIMITE_RUS_CAT2 = Decimal("8000")    # S/ por mes
 # ──────────────────────────────────────────────────────────────────────────
 # Helpers de configuración tributaria (store_config se maneja por SQL crudo)
 # ──────────────────────────────────────────────────────────────────────────
+def _config_desde_fila(m) -> dict:
+    if m is None:
+        return {
+            "regimen_tributario": "RUS",
+            "categoria_rus": "1",
+            "fecha_inicio_actividades": None,
+            "ultimo_digito_ruc": None,
+            "ruc": None,
+        }
+    return {
+        "regimen_tributario": m.get("regimen_tributario") or "RUS",
+        "categoria_rus": m.get("categoria_rus") or "1",
+        "fecha_inicio_actividades": m.get("fecha_inicio_actividades"),
+        "ultimo_digito_ruc": m.get("ultimo_digito_ruc"),
+        "ruc": m.get("ruc"),
+    }
+
+
 def _get_config_tributaria(db: Session, store_id: int) -> dict:
     """Lee solo los campos tributarios de store_config."""
     row = db.execute(text("""
@@ -46,23 +65,19 @@ def _get_config_tributaria(db: Session, store_id: int) -> dict:
           FROM store_config
          WHERE store_id = :sid
     """), {"sid": store_id}).fetchone()
+    return _config_desde_fila(row._mapping if row else None)
 
-    if row:
-        m = row._mapping
-        return {
-            "regimen_tributario": m.get("regimen_tributario") or "RUS",
-            "categoria_rus": m.get("categoria_rus") or "1",
-            "fecha_inicio_actividades": m.get("fecha_inicio_actividades"),
-            "ultimo_digito_ruc": m.get("ultimo_digito_ruc"),
-            "ruc": m.get("ruc"),
-        }
-    return {
-        "regimen_tributario": "RUS",
-        "categoria_rus": "1",
-        "fecha_inicio_actividades": None,
-        "ultimo_digito_ruc": None,
-        "ruc": None,
-    }
+
+def _get_configs_tributarias(db: Session, store_ids: List[int]) -> Dict[int, dict]:
+    """Como `_get_config_tributaria`, para varias tiendas en una consulta."""
+    rows = db.execute(text("""
+        SELECT store_id, regimen_tributario, categoria_rus,
+               fecha_inicio_actividades, ultimo_digito_ruc, ruc
+          FROM store_config
+         WHERE store_id = ANY(:sids)
+    """), {"sids": list(store_ids)}).mappings().all()
+    por_store = {r["store_id"]: r for r in rows}
+    return {sid: _config_desde_fila(por_store.get(sid)) for sid in store_ids}
 
 
 def _resolver_ultimo_digito(config: dict, store: Optional[Store]) -> int:
@@ -136,37 +151,89 @@ def alerta_limite_rus(categoria: str, ventas: float) -> Optional[str]:
     return None
 
 
+# ──────────────────────────────────────────────────────────────────────────
+# Totales mensuales por tienda (una consulta por tabla, no por mes/tienda)
+# ──────────────────────────────────────────────────────────────────────────
+Periodo = Tuple[int, int]               # (anio, mes)
+
+
+def _meses_hacia_atras(mes: int, anio: int, cantidad: int) -> List[Periodo]:
+    """[(anio, mes), ...] desde el indicado hacia atrás, `cantidad` meses."""
+    periodos = []
+    for _ in range(cantidad):
+        periodos.append((anio, mes))
+        mes, anio = (12, anio - 1) if mes == 1 else (mes - 1, anio)
+    return periodos
+
+
+def _sumas_por_mes(db: Session, store_col, fecha_col, monto_col, filtros: list,
+                   store_ids: List[int], desde: date, hasta: date) -> Dict[tuple, float]:
+    """{(store_id, anio, mes): suma} con un solo GROUP BY date_trunc('month')."""
+    mes_col = func.date_trunc("month", fecha_col)
+    rows = (
+        db.query(store_col, mes_col, func.sum(monto_col))
+        .filter(
+            store_col.in_(store_ids),
+            fecha_col >= desde,
+            fecha_col < hasta,
+            *filtros,
+        )
+        .group_by(store_col, mes_col)
+        .all()
+    )
+    return {(sid, m.year, m.month): float(total or 0) for sid, m, total in rows}
+
+
+def _totales_mensuales(db: Session, store_ids: Iterable[int],
+                       periodos: List[Periodo]) -> Dict[tuple, Tuple[float, float, float]]:
+    """
+    Ventas, compras y gastos de cada (store_id, anio, mes) pedido: tres
+    consultas en total, cubran uno o 24 meses, una tienda o todas. El
+    filtro es por rango de fechas (usa los índices) y no por
+    extract(month/year), que obligaba a recorrer todas las filas.
+    """
+    store_ids = list(store_ids)
+    if not store_ids or not periodos:
+        return {}
+    anio_min, mes_min = min(periodos)
+    anio_max, mes_max = max(periodos)
+    desde = date(anio_min, mes_min, 1)
+    hasta = date(anio_max + 1, 1, 1) if mes_max == 12 else date(anio_max, mes_max + 1, 1)
+
+    ventas = _sumas_por_mes(db, Sale.store_id, Sale.sale_date, Sale.total,
+                            [Sale.status != "cancelled"], store_ids, desde, hasta)
+    compras = _sumas_por_mes(db, Purchase.store_id, Purchase.fecha_emision, Purchase.total,
+                             [Purchase.estado != "anulado"], store_ids, desde, hasta)
+    gastos = _sumas_por_mes(db, GastoOperativo.store_id, GastoOperativo.fecha,
+                            GastoOperativo.monto, [], store_ids, desde, hasta)
+
+    return {
+        (sid, anio, mes): (
+            ventas.get((sid, anio, mes), 0.0),
+            compras.get((sid, anio, mes), 0.0),
+            gastos.get((sid, anio, mes), 0.0),
+        )
+        for sid in store_ids
+        for anio, mes in periodos
+    }
+
+
 # ──────────────────────────────────────────────────────────────────────────
 # Cálculo del resumen de un período
 # ──────────────────────────────────────────────────────────────────────────
 def _calcular_resumen(db: Session, store_id: int, mes: int, anio: int,
                       config: dict, store: Optional[Store]) -> dict:
-    regimen = config["regimen_tributario"]
-    categoria = config.get("categoria_rus") or "1"
+    ventas_f, compras_f, gastos_f = _totales_mensuales(db, [store_id], [(anio, mes)])[
+        (store_id, anio, mes)
+    ]
+    return _armar_resumen(mes, anio, config, store, ventas_f, compras_f, gastos_f)
 
-    ventas_mes = db.query(func.coalesce(func.sum(Sale.total), 0)).filter(
-        Sale.store_id == store_id,
-        Sale.status != "cancelled",
-        extract("month", Sale.sale_date) == mes,
-        extract("year", Sale.sale_date) == anio,
-    ).scalar() or 0
-
-    compras_mes = db.query(func.coalesce(func.sum(Purchase.total), 0)).filter(
-        Purchase.store_id == store_id,
-        Purchase.estado != "anulado",
-        extract("month", Purchase.fecha_emision) == mes,
-        extract("year", Purchase.fecha_emision) == anio,
-    ).scalar() or 0
-
-    gastos_mes = db.query(func.coalesce(func.sum(GastoOperativo.monto), 0)).filter(
-        GastoOperativo.store_id == store_id,
-        extract("month", GastoOperativo.fecha) == mes,
-        extract("year", GastoOperativo.fecha) == anio,
-    ).scalar() or 0
 
-    ventas_f = float(ventas_mes)
-    compras_f = float(compras_mes)
-    gastos_f = float(gastos_mes)
+def _armar_resumen(mes: int, anio: int, config: dict, store: Optional[Store],
+                   ventas_f: float, compras_f: float, gastos_f: float) -> dict:
+    """El resumen a partir de los totales ya calculados (sin tocar la base)."""
+    regimen = config["regimen_tributario"]
+    categoria = config.get("categoria_rus") or "1"
     total_gastos = compras_f + gastos_f
     utilidad = ventas_f - total_gastos
 
@@ -222,7 +289,7 @@ class TributarioConfigIn(BaseModel):
 async def resumen_tributario(
     mes: Optional[int] = Query(None, ge=1, le=12),
     anio: Optional[int] = Query(None, ge=2000, le=2100),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     today = date.today()
@@ -242,17 +309,19 @@ async def resumen_tributario(
 @router.get("/tributario/historial")
 async def historial_tributario(
     meses: int = Query(6, ge=1, le=24),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user),
 ):
     config = _get_config_tributaria(db, current_user.store_id)
     store = db.query(Store).filter(Store.id == current_user.store_id).first()
 
     today = date.today()
+    periodos = _meses_hacia_atras(today.month, today.year, meses)
+    totales = _totales_mensuales(db, [current_user.store_id], periodos)
+
     items: List[dict] = []
-    mes, anio = today.month, today.year
-    for _ in range(meses):
-        r = _calcular_resumen(db, current_user.store_id, mes, anio, config, store)
+    for anio, mes in periodos:
+        r = _armar_resumen(mes, anio, config, store, *totales[(current_user.store_id, anio, mes)])
         items.append({
             "periodo": r["periodo"],
             "mes": mes,
@@ -262,11 +331,6 @@ async def historial_tributario(
             "fecha_vencimiento": r["fecha_vencimiento"],
             "estado": "vencido" if r["dias_restantes"] < 0 else "pendiente",
         })
-        # mes anterior
-        if mes == 1:
-            mes, anio = 12, anio - 1
-        else:
-            mes -= 1
 
     return {"historial": items}
 
@@ -514,8 +578,14 @@ async def notificar_vencimiento(
 # ──────────────────────────────────────────────────────────────────────────
 # Job diario: recorre todos los stores activos y notifica a sus owners
 # ──────────────────────────────────────────────────────────────────────────
-async def enviar_alertas_vencimiento() -> dict:
-    """Llamado por la tarea de fondo en main.py (lifespan)."""
+def enviar_alertas_vencimiento() -> dict:
+    """
+    Tarea diaria (app.core.jobs): corre en un thread, con su propia sesión.
+
+    El vencimiento sólo depende del RUC, así que primero se descartan las
+    tiendas fuera de la ventana de 5 días y los totales del mes se sacan
+    de una vez para las que quedan (no una tanda de consultas por tienda).
+    """
     from app.core.database import SessionLocal
     db = SessionLocal()
     enviados = 0
@@ -523,20 +593,31 @@ async def enviar_alertas_vencimiento() -> dict:
     try:
         today = date.today()
         stores = db.query(Store).filter(Store.is_active == True).all()  # noqa: E712
+        configs = _get_configs_tributarias(db, [s.id for s in stores])
+
+        por_vencer = []
         for store in stores:
+            ultimo_digito = _resolver_ultimo_digito(configs[store.id], store)
+            dias = (calcular_vencimiento(today.month, today.year, ultimo_digito) - today).days
+            if 0 <= dias <= 5:
+                por_vencer.append(store)
+
+        ids = [s.id for s in por_vencer]
+        totales = _totales_mensuales(db, ids, [(today.year, today.month)])
+        owners: Dict[int, List[int]] = {}
+        for uid, sid in db.query(User.id, User.store_id).filter(
+            User.store_id.in_(ids),
+            User.role.in_(("owner", "admin")),
+            User.is_active == True,  # noqa: E712
+        ).all():
+            owners.setdefault(sid, []).append(uid)
+
+        for store in por_vencer:
             try:
-                config = _get_config_tributaria(db, store.id)
-                r = _calcular_resumen(db, store.id, today.month, today.year, config, store)
-                if r["dias_restantes"] > 5 or r["dias_restantes"] < 0:
-                    continue
+                r = _armar_resumen(today.month, today.year, configs[store.id], store,
+                                   *totales[(store.id, today.year, today.month)])
                 # Notificar a owners de la tienda
-                owner_ids = [
-                    u.id for u in db.query(User).filter(
-                        User.store_id == store.id,
-                        User.role.in_(("owner", "admin")),
-                        User.is_active == True,  # noqa: E712
-                    ).all()
-                ]
+                owner_ids = owners.get(store.id, [])
                 titulo = "⚠️ Vence tu pago SUNAT"
                 cuerpo = (f"Tienes S/ {r['impuesto_estimado']:.2f} por pagar. "
                           f"Vence el {r['fecha_vencimiento']}. "
@@ -549,3 +630,7 @@ async def enviar_alertas_vencimiento() -> dict:
         db.close()
     logger.info(f"[Tributario] Cron diario: {revisados} stores revisados, {enviados} push enviadas")
     return {"revisados": revisados, "enviadas": enviados}
+
+
+# 8:00 de Lima: las alertas llegan al abrir la tienda
+jobs.registrar("tributario_alertas", enviar_alertas_vencimiento, hora_lima=8)
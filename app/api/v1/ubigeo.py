@@ -3,12 +3,15 @@
 Endpoints para búsqueda de ubicaciones (UBIGEO Perú)
 """
 
+import logging
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
 from app.core.database import get_db
 
+logger = logging.getLogger(__name__)
+
 
 router = APIRouter(prefix="/ubigeo")
 
@@ -76,7 +79,7 @@ async def search_ubigeo(
         }
         
     except Exception as e:
-        print(f"[Ubigeo] Error: {e}")
+        logger.warning("[Ubigeo] Error: %s", e)
         return {
             "query": q,
             "count": 0,
@@ -23,10 +23,12 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from pydantic import BaseModel
 from typing import Optional
+from app.core import schema
 from app.core.database import get_db
 from app.models.user import User
 from app.models.store import Store
 from app.api.dependencies import get_current_user
+from app.core.auth_cache import auth_cache
 from app.services.upload_service import upload_service
 from app.core.security import hash_password
 import logging
@@ -66,13 +68,11 @@ ALTER TABLE users ADD COLUMN IF NOT EXISTS block_size INTEGER DEFAULT 100;
 ALTER TABLE users ADD COLUMN IF NOT EXISTS tipo VARCHAR(20) DEFAULT 'cajero';
 """
 
+schema.registrar("users", MIGRATION_SQL)
+
+
 def _ensure_columns(db: Session):
-    try:
-        db.execute(text(MIGRATION_SQL))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.warning(f"[Users] Migración: {e}")
+    schema.asegurar("users")
 
 # ════════════════════════════════════════════════
 # ENDPOINTS EXISTENTES
@@ -93,6 +93,7 @@ async def upload_avatar(
         )
         current_user.avatar_url = result['url']
         db.commit()
+        auth_cache.invalidar_usuario(current_user.id)
         db.refresh(current_user)
         return {
             'message': 'Avatar actualizado exitosamente',
@@ -152,6 +153,7 @@ async def delete_avatar(
     upload_service.delete_file(filepath)
     current_user.avatar_url = None
     db.commit()
+    auth_cache.invalidar_usuario(current_user.id)
     return {'message': 'Avatar eliminado exitosamente'}
 
 
@@ -321,6 +323,7 @@ async def editar_usuario(
         db.execute(text(f"UPDATE users SET {set_clauses} WHERE id = :id"), updates)
 
     db.commit()
+    auth_cache.invalidar_usuario(user_id)
     logger.info(f"[Users] Usuario {user_id} actualizado por {current_user.full_name}")
 
     return {"success": True, "message": f"Usuario {user.full_name} actualizado"}
@@ -351,6 +354,7 @@ async def desactivar_usuario(
 
     user.is_active = False
     db.commit()
+    auth_cache.invalidar_usuario(user_id)
     logger.info(f"[Users] Usuario {user_id} desactivado por {current_user.full_name}")
 
     return {"success": True, "message": f"Usuario {user.full_name} desactivado"}
@@ -5,6 +5,7 @@ Endpoints para sistema de voz:
 - STT (Speech-to-Text) con OpenAI Whisper
 - Chatbot para mapa de delitos
 """
+import logging
 import os
 import io
 import time
@@ -19,9 +20,10 @@ from typing import Optional, List
 from app.core.database import get_db
 from app.api.dependencies import get_current_user
 from app.models.user import User
-import openai
-
 from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
 # Forzar recarga del .env (override=True ignora variables de sistema)
@@ -36,29 +38,29 @@ try:
     #openai.api_key = os.getenv("OPENAI_API_KEY")
     #OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     if OPENAI_API_KEY:
-        print(f"[Voice] ✅ OPENAI_API_KEY cargada: {OPENAI_API_KEY[:8]}...{OPENAI_API_KEY[-4:]}")
+        logger.info("[Voice] OPENAI_API_KEY cargada desde settings")
     else:
-        print("[Voice] ⚠️ OPENAI_API_KEY no configurada en settings")
+        logger.warning("[Voice] OPENAI_API_KEY no configurada en settings")
 except ImportError:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     if OPENAI_API_KEY:
-        print(f"[Voice] ✅ OPENAI_API_KEY desde env: {OPENAI_API_KEY[:8]}...{OPENAI_API_KEY[-4:]}")
+        logger.info("[Voice] OPENAI_API_KEY cargada desde env")
     else:
-        print("[Voice] ⚠️ OPENAI_API_KEY no encontrada")
+        logger.warning("[Voice] OPENAI_API_KEY no encontrada")
 
 # TTS Service (tu servicio existente)
 try:
     from app.services.tts_service import tts_service
 except ImportError:
     tts_service = None
-    print("[Voice] AVISO: tts_service no disponible")
+    logger.warning("[Voice] AVISO: tts_service no disponible")
 
 # httpx para llamadas a OpenAI
 try:
     import httpx
 except ImportError:
     httpx = None
-    print("[Voice] AVISO: Instalar httpx con: pip install httpx")
+    logger.warning("[Voice] AVISO: Instalar httpx con: pip install httpx")
 
 
 router = APIRouter(prefix="/voice")
@@ -251,7 +253,7 @@ async def transcribe_audio(
         
         if response.status_code != 200:
             error_detail = response.text
-            print(f"[Whisper] Error {response.status_code}: {error_detail}")
+            logger.warning("[Whisper] Error %s: %s", response.status_code, error_detail)
             raise HTTPException(
                 status_code=response.status_code,
                 detail=f"Error de OpenAI Whisper: {error_detail[:200]}"
@@ -275,7 +277,7 @@ async def transcribe_audio(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Whisper] Error: {e}")
+        logger.warning("[Whisper] Error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -404,7 +406,7 @@ def find_product_in_db(db: Session, search_term: str, store_id: Optional[int] =
     try:
         from app.models.product import Product
     except ImportError:
-        print("[Voice] No se pudo importar modelo Product")
+        logger.info("[Voice] No se pudo importar modelo Product")
         return None
     
     # 🔥 REGLAS MEJORADAS PARA PALABRAS CORTAS
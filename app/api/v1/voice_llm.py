@@ -3,6 +3,7 @@ Voice LLM Parser - Parseo de comandos de voz con LLM
 Soporta: Claude, OpenAI, Gemini
 CORREGIDO: Lógica de búsqueda unificada con VoiceService
 """
+import logging
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
@@ -10,15 +11,21 @@ from pydantic import BaseModel
 from typing import List, Literal, Optional
 import time
 import re
+from collections import Counter
 import unicodedata
-from difflib import SequenceMatcher
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.api.dependencies import get_current_user
 from app.models.user import User
 from app.models.product import Product
 from app.models.voice_log import VoiceCommandLog
-from app.services.llm_service import LLMService
+from app.services.llm_service import LLMResult, LLMService, LLMUnavailableError
+from app.services.voice_cache import API_CACHE, CacheHit, cache_key, voice_cache
+from app.services.voice_grammar import ParseLocal, parse_local
+from app.services import voice_matcher
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/voice")
 
@@ -196,7 +203,106 @@ class VoiceParseResponse(BaseModel):
     timing: Optional[TimingMetrics] = None
     cost_usd: float
     transcript_corregido: Optional[str] = None
+    tier: str = "llm"  # quién respondió: 'local' | 'cache' | 'llm'
+
 
+def _log_voice_command(db: Session, current_user: User, request: VoiceParseRequest,
+                       transcript: str, api_used: str, tier: Optional[str] = None,
+                       llm: Optional[LLMResult] = None, hit: Optional[CacheHit] = None,
+                       local: Optional[ParseLocal] = None, key: Optional[str] = None,
+                       parsed_result: Optional[dict] = None, error_message: Optional[str] = None,
+                       **fields) -> None:
+    """Registrar el comando en VoiceCommandLog con el nivel que respondió y sus métricas"""
+    parsed_result = dict(parsed_result or {})
+    if tier is not None:
+        parsed_result["tier"] = tier
+    if local is not None:
+        parsed_result["local"] = {"confianza": local.confianza, "motivo": local.motivo}
+    if key is not None:
+        # Fuente del nivel persistente de voice_cache
+        parsed_result["cache_key"] = key
+    if hit is not None:
+        parsed_result["cache"] = {
+            "nivel": hit.nivel,
+            "provider": hit.provider,
+            "ms_ahorrados": hit.ms_ahorrados,
+            "usd_ahorrados": hit.usd_ahorrados,
+        }
+    if llm is not None:
+        parsed_result["llm"] = {
+            "requested": request.api,
+            "provider": llm.provider,
+            "latency_ms": llm.latency_ms,
+            "hedged": llm.hedged,
+        }
+        if llm.errors:
+            error_message = "; ".join(llm.errors)
+    try:
+        db.add(VoiceCommandLog(
+            store_id=current_user.store_id,
+            user_id=current_user.id,
+            transcript=transcript,
+            api_used=api_used,
+            parsed_result=parsed_result,
+            cost_usd=llm.cost_usd if llm else 0.0,
+            error_message=error_message,
+            session_id=request.session_id[:50] if request.session_id else None,
+            **fields,
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+
+
+def _candidatos_items(items_list: list, all_store_products: list, store_id: int) -> list:
+    """
+    [(search_term, cantidad, unidad, candidatos)] por item, con los
+    candidatos (score > 0.5) ordenados por score y nombre.
+    """
+    pendientes = []
+    for item in items_list:
+        if isinstance(item, str):
+            search_term = item
+            cantidad = 1.0
+            unidad = None
+        else:
+            search_term = str(item.get("nombre", item.get("name", "")))
+            cantidad = float(item.get("cantidad", item.get("quantity", 1.0)) or 1.0)
+            unidad = item.get("unidad", item.get("unit"))
+            
+        search_term = normalize_text(search_term.strip())
+        if not search_term or len(search_term) < 2: continue
+        
+        # Generar variantes de búsqueda (singular/plural)
+        queries = {search_term}
+        if search_term.endswith('s'): queries.add(search_term.rstrip('s'))
+        else: queries.add(search_term + 's')
+        pendientes.append((search_term, cantidad, unidad, queries))
+    
+    # Scoring de todos los items contra nombres y aliases en una pasada
+    # (ver voice_matcher); el alias cuenta igual que el nombre.
+    rankings = voice_matcher.emparejar(
+        all_store_products,
+        [queries for _, _, _, queries in pendientes],
+        lambda q, opcion, es_alias, similitud: calcular_score_avanzado(opcion, q),
+        store_id=store_id,
+    )
+    
+    resultado = []
+    for (search_term, cantidad, unidad, queries), ranking in zip(pendientes, rankings):
+        # Solo considerar si tiene un mínimo de sentido (>0.5)
+        scored_candidates = [
+            {'product': product, 'score': score}
+            for product, score in ranking if score > 0.5
+        ]
+        # Ordenar por score descendente (Mejor match primero)
+        scored_candidates.sort(key=lambda x: (-x['score'], x['product'].name))
+        resultado.append((search_term, cantidad, unidad, scored_candidates))
+    return resultado
+
+
+# Qué nivel respondió cada comando en este proceso (ver /voice/llm-stats)
+_tiers = Counter()
 
 # ============================================
 # ENDPOINT PRINCIPAL
@@ -216,98 +322,82 @@ async def parse_voice_with_llm(
     transcript_corregido = corregir_transcript(transcript_original)
     preprocess_ms = int((time.time() - preprocess_start) * 1000)
     
-    print(f"\n[Voice LLM] ═══════════════════════════════════════════")
-    print(f"[Voice LLM] Transcript: '{transcript_original}' -> '{transcript_corregido}'")
+    logger.debug("[Voice LLM] Transcript: '%s' -> '%s'", transcript_original, transcript_corregido)
     
-    # 2. LLM
-    llm_start = time.time()
-    try:
-        if request.api == "claude":
-            parsed_result, llm_latency, cost = await LLMService.parse_with_claude(transcript_corregido)
-        elif request.api == "openai":
-            parsed_result, llm_latency, cost = await LLMService.parse_with_openai(transcript_corregido)
+    # Catálogo activo de la tienda (lo usan la gramática local y el matching)
+    db_start = time.time()
+    all_store_products = db.query(Product).filter(
+        Product.store_id == current_user.store_id,
+        Product.is_active == True
+    ).all()
+    load_ms = int((time.time() - db_start) * 1000)
+    
+    # 2. Nivel local: gramática determinística, sin salir del proceso.
+    # Sólo responde si confía en el parseo Y cada item tiene candidatos.
+    tier = None
+    candidatos = None
+    llm = hit = key = None
+    local = parse_local(transcript_corregido)
+    if local.confianza >= settings.VOICE_LOCAL_CONFIANZA_MINIMA:
+        candidatos = _candidatos_items(local.items, all_store_products, current_user.store_id)
+        con_match = {search_term for search_term, _, _, c in candidatos if c}
+        sin_match = [item["nombre"] for item in local.items
+                     if normalize_text(item["nombre"]) not in con_match]
+        if not sin_match:
+            tier = "local"
+            parsed_result, cost, llm_ms, api_used = local.items, 0.0, 0, "local"
+            logger.debug("[Voice LLM] Gramática local (confianza %.2f)", local.confianza)
+        else:
+            local.motivo = f"sin candidatos: {sin_match}"
+            candidatos = None
+    
+    if tier is None:
+        # 3. Caché de respuestas (mismo texto corregido → mismo parseo)
+        key = cache_key(transcript_corregido)
+        hit = voice_cache.get(db, key)
+        
+        if hit is not None:
+            tier = "cache"
+            logger.debug("[Voice LLM] Caché (%s): ahorra %s ms / $%.6f", hit.nivel, hit.ms_ahorrados, hit.usd_ahorrados)
+            parsed_result, cost, llm_ms, api_used = hit.products, 0.0, hit.lookup_ms, API_CACHE
         else:
-            parsed_result, llm_latency, cost = await LLMService.parse_with_gemini(transcript_corregido)
-        llm_ms = int((time.time() - llm_start) * 1000)
-    except Exception as e:
-        print(f"[Voice LLM] ❌ Error en LLM: {str(e)}")
-        raise HTTPException(500, detail=f"Error en API {request.api}: {str(e)}")
+            # 4. LLM (async, con timeout, hedging y fallback entre proveedores)
+            tier = "llm"
+            try:
+                llm = await LLMService.parse(transcript_corregido, request.api)
+            except LLMUnavailableError as e:
+                logger.warning("[Voice LLM] Error en LLM: %s", str(e))
+                _log_voice_command(db, current_user, request, transcript_original,
+                                   api_used=request.api, tier=tier, local=local,
+                                   error_message=str(e), latency_ms=int((time.time() - total_start) * 1000))
+                raise HTTPException(503, detail=f"Error en API {request.api}: {str(e)}")
+            voice_cache.put(key, llm)
+            parsed_result, cost, llm_ms, api_used = llm.products, llm.cost_usd, llm.latency_ms, llm.provider
+            if llm.provider != request.api:
+                logger.info("[Voice LLM] Respondió %s (pedido: %s, errores: %s)", llm.provider, request.api, llm.errors)
+    _tiers[tier] += 1
     
-    # 3. Extraer items
+    # Extraer items
     items_list = parsed_result.get('productos', []) if isinstance(parsed_result, dict) else parsed_result if isinstance(parsed_result, list) else []
-    print(f"[Voice LLM] Items detectados: {len(items_list)}")
+    logger.debug("[Voice LLM] Items detectados: %s (nivel: %s)", len(items_list), tier)
     
-    # 4. Búsqueda en BD (OPTIMIZADA)
-    db_start = time.time()
+    # 5. Búsqueda en catálogo (la del nivel local ya está hecha)
+    match_start = time.time()
     matched_products = []
     products_with_variants = []
     not_found = []
     
-    # Cargar TODOS los productos activos de la tienda en memoria
-    all_store_products = db.query(Product).filter(
-        Product.store_id == current_user.store_id,
-        Product.is_active == True
-    ).all()
+    if candidatos is None:
+        candidatos = _candidatos_items(items_list, all_store_products, current_user.store_id)
     
-    for item in items_list:
-        if isinstance(item, str):
-            search_term = item
-            cantidad = 1.0
-            unidad = None
-        else:
-            search_term = str(item.get("nombre", item.get("name", "")))
-            cantidad = float(item.get("cantidad", item.get("quantity", 1.0)) or 1.0)
-            unidad = item.get("unidad", item.get("unit"))
-            
-        search_term = normalize_text(search_term.strip())
-        if not search_term or len(search_term) < 2: continue
-        
-        # Generar variantes de búsqueda (singular/plural)
-        queries = {search_term}
-        if search_term.endswith('s'): queries.add(search_term.rstrip('s'))
-        else: queries.add(search_term + 's')
-        
-        scored_candidates = []
-        
-        # Scoring contra todos los productos en memoria
-        for product in all_store_products:
-            best_p_score = 0
-            
-            for q in queries:
-                # 1. Score por Nombre Principal
-                score = calcular_score_avanzado(product.name, q)
-                
-                # 2. Score por ALIASES (¡Aquí está la lógica!)
-                if hasattr(product, 'aliases') and product.aliases:
-                    # Manejar si es string ("pan, yema") o lista ["pan", "yema"]
-                    aliases_list = []
-                    if isinstance(product.aliases, list):
-                        aliases_list = product.aliases
-                    elif isinstance(product.aliases, str):
-                        aliases_list = product.aliases.split(',')
-                    
-                    for alias in aliases_list:
-                        if alias and alias.strip():
-                            alias_score = calcular_score_avanzado(alias.strip(), q)
-                            # Si el alias hace match, cuenta igual que el nombre
-                            score = max(score, alias_score)
-                
-                best_p_score = max(best_p_score, score)
-            
-            # Solo considerar si tiene un mínimo de sentido (>0.5)
-            if best_p_score > 0.5:
-                scored_candidates.append({'product': product, 'score': best_p_score})
-        
-        # Ordenar por score descendente (Mejor match primero)
-        scored_candidates.sort(key=lambda x: (-x['score'], x['product'].name))
-        
+    for search_term, cantidad, unidad, scored_candidates in candidatos:
         # -----------------------------------------------------------
         # LÓGICA DE DECISIÓN: ¿AUTOMÁTICO O VARIANTES?
         # -----------------------------------------------------------
         is_clear_match = False
         
         if not scored_candidates:
-            print(f"[Voice LLM] ❌ No encontrado: '{search_term}'")
+            logger.debug("[Voice LLM] No encontrado: '%s'", search_term)
             not_found.append(search_term)
             continue
             
@@ -339,7 +429,7 @@ async def parse_voice_with_llm(
         if is_clear_match:
             # ✅ AUTOMÁTICO
             best = top_candidate['product']
-            print(f"[Voice LLM] ✅ Match claro: '{search_term}' -> {best.name} (Score: {top_score:.2f})")
+            logger.debug("[Voice LLM] Match claro: '%s' -> %s (Score: %.2f)", search_term, best.name, top_score)
             matched_products.append(ProductMatch(
                 search_term=search_term,
                 quantity=cantidad,
@@ -352,7 +442,7 @@ async def parse_voice_with_llm(
             ))
         else:
             # 🔀 AMBIGUO (MODAL)
-            print(f"[Voice LLM] ⚠️ Ambiguo: '{search_term}' (Top: {top_score:.2f}, 2nd: {scored_candidates[1]['score'] if len(scored_candidates)>1 else 0:.2f})")
+            logger.debug("[Voice LLM] Ambiguo: '%s' (Top: %.2f, 2nd: %.2f)", search_term, top_score, scored_candidates[1]['score'] if len(scored_candidates)>1 else 0)
             variants = [
                 ProductOption(
                     product_id=c['product'].id,
@@ -370,34 +460,43 @@ async def parse_voice_with_llm(
                 variants=variants
             ))
 
-    db_ms = int((time.time() - db_start) * 1000)
+    db_ms = load_ms + int((time.time() - match_start) * 1000)
     total_ms = int((time.time() - total_start) * 1000)
     
-    # 5. Logging
-    try:
-        log_entry = VoiceCommandLog(
-            store_id=current_user.store_id,
-            user_id=current_user.id,
-            transcript=transcript_original,
-            api_used=request.api,
-            parsed_result={"items": items_list},
-            products_found=len(matched_products) + len(products_with_variants),
-            success=len(matched_products) > 0,
-            latency_ms=total_ms,
-            cost_usd=cost
-        )
-        db.add(log_entry)
-        db.commit()
-    except Exception: pass
+    # 6. Logging
+    _log_voice_command(
+        db, current_user, request, transcript_original,
+        api_used=api_used, tier=tier, llm=llm, hit=hit,
+        local=local, key=key,
+        parsed_result={"items": items_list},
+        products_found=len(matched_products) + len(products_with_variants),
+        success=len(matched_products) > 0,
+        latency_ms=total_ms,
+    )
     
     return VoiceParseResponse(
         success=len(matched_products) > 0 or len(products_with_variants) > 0,
         products=matched_products,
         products_with_variants=products_with_variants,
         not_found=not_found,
-        api_used=request.api,
+        api_used=api_used,
         latency_ms=total_ms,
         timing=TimingMetrics(total_ms=total_ms, llm_ms=llm_ms, db_search_ms=db_ms, preprocessing_ms=preprocess_ms),
         cost_usd=cost,
-        transcript_corregido=transcript_corregido
-    )
\ No newline at end of file
+        transcript_corregido=transcript_corregido,
+        tier=tier
+    )
+
+
+@router.get("/llm-stats")
+async def llm_stats(current_user: User = Depends(get_current_user)):
+    """
+    Métricas de este proceso: comandos por nivel (local/cache/llm);
+    llamadas, errores, timeouts, costo y latencia p50/p95 por proveedor;
+    hit rate, ms y USD ahorrados por la caché
+    """
+    return {
+        "tiers": dict(_tiers),
+        "providers": LLMService.stats(),
+        "cache": voice_cache.stats(),
+    }
@@ -0,0 +1,169 @@
+"""
+QueVendi — Tiempo de arranque
+=============================
+
+Perfil de importaciones
+-----------------------
+Con `QV_PERFIL_ARRANQUE=1` en el entorno, `main.py` instala antes de
+cualquier otro import un finder que mide cuánto tarda en ejecutarse cada
+módulo (tiempo propio, sin contar lo que él a su vez importa). Al
+terminar el arranque se loguea el top de módulos y el total por paquete
+raíz, y queda en GET /api/v1/admin/arranque.
+
+Es lo mismo que `python -X importtime`, pero sin cambiar el comando de
+arranque de Railway. Los módulos importados en ese modo tienen un
+loader envuelto: usarlo para diagnosticar, no dejarlo prendido.
+
+No usa settings ni nada de `app`: tiene que poder importarse primero.
+
+Precalentado
+------------
+Los SDK pesados (anthropic, openai, google.*, y rapidfuzz, que arrastra
+pandas) ya no se importan al arrancar sino en el primer uso.
+`precalentar()` los importa en un thread después de que el servidor ya
+acepta requests, para que el primer comando de voz tampoco los pague.
+"""
+
+import importlib
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Módulos diferidos que conviene tener listos antes del primer uso
+SDKS_DIFERIDOS = (
+    "openai",
+    "anthropic",
+    "google.generativeai",
+    "google.cloud.texttospeech",
+    "rapidfuzz.process",
+)
+
+_inicio = time.perf_counter()
+_listo_ms: Optional[float] = None
+_perfil: Optional["PerfilImportaciones"] = None
+
+
+class _LoaderMedido:
+    """Envuelve un loader para medir su exec_module."""
+
+    def __init__(self, loader, perfil: "PerfilImportaciones", nombre: str):
+        self._loader = loader
+        self._perfil = perfil
+        self._nombre = nombre
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._perfil._entrar()
+        t0 = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._perfil._salir(self._nombre, time.perf_counter() - t0)
+
+    def __getattr__(self, nombre):
+        return getattr(self._loader, nombre)
+
+
+class PerfilImportaciones(importlib.abc.MetaPathFinder):
+    """Finder que no encuentra nada propio: mide lo que encuentran los demás."""
+
+    def __init__(self):
+        self.propio_ms: Dict[str, float] = {}
+        self.total_ms: Dict[str, float] = {}
+        self._local = threading.local()
+
+    def _pila(self) -> List[float]:
+        if not hasattr(self._local, "pila"):
+            self._local.pila = []
+        return self._local.pila
+
+    def _entrar(self) -> None:
+        self._pila().append(0.0)        # tiempo de los hijos
+
+    def _salir(self, nombre: str, segundos: float) -> None:
+        pila = self._pila()
+        hijos = pila.pop()
+        self.total_ms[nombre] = segundos * 1000
+        self.propio_ms[nombre] = (segundos - hijos) * 1000
+        if pila:
+            pila[-1] += segundos
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _LoaderMedido(spec.loader, self, fullname)
+                return spec
+        return None
+
+    def por_paquete(self) -> Dict[str, float]:
+        paquetes: Dict[str, float] = defaultdict(float)
+        for nombre, ms in self.propio_ms.items():
+            paquetes[nombre.split(".")[0]] += ms
+        return dict(paquetes)
+
+
+def activar_si_corresponde() -> None:
+    """Instalar el perfil si QV_PERFIL_ARRANQUE está prendido."""
+    global _perfil
+    if _perfil is None and os.getenv("QV_PERFIL_ARRANQUE", "").lower() in ("1", "true", "si"):
+        _perfil = PerfilImportaciones()
+        sys.meta_path.insert(0, _perfil)
+
+
+def marcar_listo(top: int = 25) -> None:
+    """Llamar al final del startup: loguea el tiempo total y el perfil."""
+    global _listo_ms
+    _listo_ms = (time.perf_counter() - _inicio) * 1000
+    logger.info(f"[Arranque] Listo en {_listo_ms:.0f} ms desde el primer import de la app")
+    if _perfil is None:
+        return
+
+    sys.meta_path[:] = [f for f in sys.meta_path if f is not _perfil]
+    modulos = sorted(_perfil.propio_ms.items(), key=lambda x: -x[1])[:top]
+    paquetes = sorted(_perfil.por_paquete().items(), key=lambda x: -x[1])[:top]
+    logger.info(
+        "[Arranque] Módulos más lentos (ms propios):\n%s",
+        "\n".join(f"  {ms:8.1f}  {nombre}" for nombre, ms in modulos),
+    )
+    logger.info(
+        "[Arranque] Por paquete (ms):\n%s",
+        "\n".join(f"  {ms:8.1f}  {nombre}" for nombre, ms in paquetes),
+    )
+
+
+def precalentar() -> None:
+    """Importar los SDK diferidos (bloqueante: correr en un thread)."""
+    for nombre in SDKS_DIFERIDOS:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(nombre)
+        except Exception as e:
+            logger.info(f"[Arranque] {nombre} no disponible: {e}")
+            continue
+        logger.debug("[Arranque] %s precalentado en %.0f ms", nombre, (time.perf_counter() - t0) * 1000)
+
+
+def estado(top: int = 50) -> Dict:
+    resultado: Dict = {"listo_ms": round(_listo_ms, 1) if _listo_ms is not None else None,
+                       "perfil": None}
+    if _perfil is not None:
+        resultado["perfil"] = {
+            "modulos_ms": {n: round(ms, 1) for n, ms in
+                           sorted(_perfil.propio_ms.items(), key=lambda x: -x[1])[:top]},
+            "paquetes_ms": {n: round(ms, 1) for n, ms in
+                            sorted(_perfil.por_paquete().items(), key=lambda x: -x[1])[:top]},
+        }
+    return resultado
@@ -0,0 +1,137 @@
+"""
+QueVendi — Caché de tokens verificados
+======================================
+
+Cada request autenticado decodificaba el JWT y hacía un SELECT a `users`
+antes de llegar al endpoint. El mismo token se repite cientos de veces
+por hora (el POS consulta productos, ventas y caja sin parar), así que
+aquí se guarda, por token, una foto de las columnas del usuario:
+
+    sha256(token) → (columnas de User, store_id del token, expira)
+
+La entrada vence a los AUTH_CACHE_TTL_SEGUNDOS o cuando vence el token,
+lo que ocurra primero. Un hit no toca la base: la foto se adjunta a la
+sesión del request con `merge(load=False)`, así que el endpoint recibe
+un User persistente de verdad (puede modificarlo y hacer commit, y las
+relaciones se cargan en diferido como siempre).
+
+INVALIDACIÓN
+------------
+Los endpoints que desactivan o editan un usuario llaman a
+`auth_cache.invalidar_usuario(user_id)` después del commit. Eso limpia
+este proceso; en los demás workers la foto vieja dura a lo sumo el TTL.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.config import settings
+from app.models.user import User
+
+_COLUMNAS = [attr.key for attr in sa_inspect(User).column_attrs]
+
+
+@dataclass
+class _Entrada:
+    user_id: int
+    columnas: Dict[str, Any]
+    token_store_id: Optional[int]
+    expira: float               # time.monotonic()
+
+
+def _clave(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class AuthCache:
+    """LRU acotado token → usuario, con índice por usuario para invalidar."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[str, _Entrada]" = OrderedDict()
+        self._por_usuario: Dict[int, Set[str]] = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidaciones": 0}
+
+    def get(self, token: str) -> Optional[_Entrada]:
+        clave = _clave(token)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.expira <= time.monotonic():
+                self._quitar(clave)
+                entrada = None
+            if entrada is None:
+                self._stats["misses"] += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._stats["hits"] += 1
+            return entrada
+
+    def put(self, token: str, user: User, payload: dict) -> None:
+        """Guardar el usuario recién leído de la base para este token."""
+        ttl = settings.AUTH_CACHE_TTL_SEGUNDOS
+        exp = payload.get("exp")
+        if exp is not None:
+            ttl = min(ttl, float(exp) - time.time())
+        if ttl <= 0:
+            return
+
+        entrada = _Entrada(
+            user_id=user.id,
+            columnas={k: getattr(user, k) for k in _COLUMNAS},
+            token_store_id=payload.get("store_id"),
+            expira=time.monotonic() + ttl,
+        )
+        clave = _clave(token)
+        with self._lock:
+            self._quitar(clave)
+            self._entradas[clave] = entrada
+            self._por_usuario.setdefault(entrada.user_id, set()).add(clave)
+            while len(self._entradas) > settings.AUTH_CACHE_MAX_ENTRADAS:
+                self._quitar(next(iter(self._entradas)))
+
+    def _quitar(self, clave: str) -> None:
+        entrada = self._entradas.pop(clave, None)
+        if entrada is None:
+            return
+        claves = self._por_usuario.get(entrada.user_id)
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self._por_usuario[entrada.user_id]
+
+    def invalidar_usuario(self, user_id: int) -> None:
+        """Olvidar todos los tokens de un usuario (desactivado, editado, nueva clave)."""
+        with self._lock:
+            for clave in list(self._por_usuario.get(user_id, ())):
+                self._quitar(clave)
+            self._stats["invalidaciones"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["entradas"] = len(self._entradas)
+        consultas = s["hits"] + s["misses"]
+        s["hit_rate"] = round(s["hits"] / consultas, 4) if consultas else 0.0
+        return s
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._por_usuario.clear()
+
+
+def adjuntar(db: Session, entrada: _Entrada) -> User:
+    """User persistente en `db` a partir de la foto, sin SELECT."""
+    user = User(**entrada.columnas)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+auth_cache = AuthCache()
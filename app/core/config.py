@@ -14,9 +14,45 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = "development"
     DEBUG: bool = False
     APP_NAME: str = "QUEVENDI"
+    # Logging (ver app.core.logs): nivel general, niveles por módulo
+    # ("app.services.voice_service=DEBUG,sqlalchemy.engine=INFO") y
+    # salida JSON (False = texto legible, para desarrollo local)
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = ""
+    LOG_JSON: bool = True
+    # Instrumentación (ver app.core.instrumentacion): consultas que se
+    # loguean como lentas y desde cuántas repeticiones de la misma
+    # sentencia en un request se marca como N+1. 0 desactiva cada una.
+    SLOW_QUERY_MS: int = 500
+    N_MAS_UNO_UMBRAL: int = 10
+    # Importar los SDK de LLM/TTS en segundo plano apenas arranca el
+    # servidor (ver app.core.arranque). False = recién en el primer uso.
+    PRECALENTAR_SDKS: bool = True
+    # Tareas periódicas (ver app.core.jobs): cada cuánto se revisa qué
+    # toca y cuántas corren a la vez por proceso. False = este proceso
+    # no ejecuta tareas (p. ej. réplicas sólo para requests).
+    JOBS_HABILITADOS: bool = True
+    JOBS_WORKERS: int = 2
+    JOBS_TICK_SEGUNDOS: int = 60
     
     # Database
     DATABASE_URL: str
+    # Pool de conexiones, por worker y por engine (ver db_pool). Con
+    # N workers el total contra Postgres es N × (size + overflow) × 2.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_ASYNC_POOL_SIZE: int = 5
+    DB_ASYNC_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 300
+    # Ping sólo a conexiones que estuvieron más de N s sin usarse
+    # (reemplaza pool_pre_ping en cada checkout). -1 desactiva el ping.
+    DB_PING_INACTIVA_SEGUNDOS: int = 30
+    # Réplica de lectura opcional para reportes/kardex/contador (get_read_db).
+    # Si se atrasa más de DB_REPLICA_MAX_LAG_SEGUNDOS se lee de la primaria.
+    DATABASE_REPLICA_URL: Optional[str] = None
+    DB_REPLICA_MAX_LAG_SEGUNDOS: float = 30
+    DB_REPLICA_CHEQUEO_SEGUNDOS: float = 10
     
     # Security
     SECRET_KEY: str
@@ -24,6 +60,13 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 10080  # 7 días
+    # Caché de tokens verificados (ver auth_cache): cuánto puede tardar otro
+    # worker en enterarse de que un usuario fue desactivado o editado
+    AUTH_CACHE_TTL_SEGUNDOS: int = 60
+    AUTH_CACHE_MAX_ENTRADAS: int = 10000
+    
+    # Token para /api/v1/admin/* (cabecera X-Admin-Token). Vacío = deshabilitado
+    ADMIN_TOKEN: str = ""
     
     # External APIs
     APIS_NET_PE_TOKEN: str = ""
@@ -52,6 +95,32 @@ class Settings(BaseSettings):
     
     # Subscription Plans (días de trial)
     FREEMIUM_TRIAL_DAYS: int = 30
+
+    # Inventario: rechazar ventas que dejen stock negativo (ver stock_service)
+    STOCK_BLOQUEAR_NEGATIVO: bool = False
+
+    # Búsqueda: desde cuántos productos activos una tienda busca en Postgres
+    # (pg_trgm/full-text) en vez del índice en memoria. 0 = nunca.
+    SEARCH_PG_UMBRAL_PRODUCTOS: int = 3000
+
+    # Voz con LLM (ver llm_service): timeout por proveedor, a los cuántos
+    # ms sin respuesta se lanza en paralelo el siguiente proveedor
+    # (0 = sin hedging) y orden de respaldo.
+    LLM_TIMEOUT_CLAUDE_MS: int = 6000
+    LLM_TIMEOUT_OPENAI_MS: int = 5000
+    LLM_TIMEOUT_GEMINI_MS: int = 5000
+    LLM_HEDGE_MS: int = 1500
+    LLM_FALLBACK: str = "openai,claude,gemini"
+
+    # Caché de respuestas del LLM de voz (ver voice_cache). El nivel
+    # persistente busca parseos previos en voice_commands_log.
+    VOICE_CACHE_TTL_HORAS: int = 72
+    VOICE_CACHE_MAX_ENTRADAS: int = 5000
+    VOICE_CACHE_PERSISTENTE: bool = True
+
+    # Confianza mínima de la gramática local (voice_grammar) para resolver
+    # un comando de voz sin LLM. 1.1 = siempre LLM.
+    VOICE_LOCAL_CONFIANZA_MINIMA: float = 0.8
     
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -1,42 +1,149 @@
 # app/core/database.py
-from sqlalchemy import create_engine
+import logging
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.core import db_pool, instrumentacion
+
+logger = logging.getLogger(__name__)
 
 # ========================================
 # CONFIGURACIÓN DE BASE DE DATOS
 # ========================================
-database_url = settings.DATABASE_URL
+def _url_psycopg2(url: str) -> str:
+    # Normalizar URL para psycopg2
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
 
-# Normalizar URL para psycopg2
-if database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
+    # Forzar uso de psycopg2
+    if "postgresql://" in url and "+psycopg2" not in url:
+        url = url.replace("postgresql://", "postgresql+psycopg2://", 1)
+    return url
 
-# Forzar uso de psycopg2
-if "postgresql://" in database_url and "+psycopg2" not in database_url:
-    database_url = database_url.replace("postgresql://", "postgresql+psycopg2://", 1)
 
-print("🔌 Conectando a base de datos...")
-print(f"📡 URL (sanitizada): {database_url.split('@')[0]}@***")
+database_url = _url_psycopg2(settings.DATABASE_URL)
+
+logger.info(
+    "[DB] Conectando a base de datos: %s",
+    make_url(database_url).render_as_string(hide_password=True),
+)
 
 # ========================================
 # CREAR ENGINE
 # ========================================
+# Tamaño, liveness y telemetría del pool: ver db_pool
 engine = create_engine(
     database_url,
-    pool_size=5,
-    max_overflow=10,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    pool_timeout=30,
+    **db_pool.opciones_pool("sync"),
     connect_args={"connect_timeout": 10},
     echo=False
 )
+db_pool.instrumentar(engine, "sync")
+instrumentacion.instrumentar(engine, "sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# ========================================
+# RÉPLICA DE LECTURA (opcional)
+# ========================================
+# Reportes, kardex, contador y tributario leen mucho y toleran unos
+# segundos de atraso: con DATABASE_REPLICA_URL van a la réplica (ver
+# get_read_db) y dejan el pool de la primaria para el POS.
+replica_engine = None
+ReplicaSessionLocal = None
+if settings.DATABASE_REPLICA_URL:
+    replica_engine = create_engine(
+        _url_psycopg2(settings.DATABASE_REPLICA_URL),
+        **db_pool.opciones_pool("replica"),
+        connect_args={"connect_timeout": 5},
+        echo=False
+    )
+    db_pool.instrumentar(replica_engine, "replica")
+    instrumentacion.instrumentar(replica_engine, "replica")
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    logger.info("[DB] Réplica de lectura configurada")
+
+# Atraso de la réplica en segundos. 0 si ya aplicó todo lo que recibió
+# (una primaria sin escrituras no cuenta como atraso).
+_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+_replica_estado = {"al_dia": False, "lag_s": None, "revisado_en": float("-inf")}
+
+
+def _replica_al_dia() -> bool:
+    """
+    ¿La réplica responde y su atraso es <= DB_REPLICA_MAX_LAG_SEGUNDOS?
+    Se revisa a lo sumo cada DB_REPLICA_CHEQUEO_SEGUNDOS.
+    """
+    ahora = time.monotonic()
+    if ahora - _replica_estado["revisado_en"] < settings.DB_REPLICA_CHEQUEO_SEGUNDOS:
+        return _replica_estado["al_dia"]
+    _replica_estado["revisado_en"] = ahora
+    try:
+        with replica_engine.connect() as conn:
+            lag = float(conn.execute(_LAG_SQL).scalar() or 0)
+    except Exception as e:
+        if _replica_estado["al_dia"]:
+            logger.warning(f"[DB] Réplica no disponible, lecturas a la primaria: {e}")
+        _replica_estado.update(al_dia=False, lag_s=None)
+        return False
+
+    al_dia = lag <= settings.DB_REPLICA_MAX_LAG_SEGUNDOS
+    if al_dia != _replica_estado["al_dia"]:
+        logger.info(f"[DB] Réplica {'al día' if al_dia else 'atrasada'} (lag {lag:.1f}s)")
+    _replica_estado.update(al_dia=al_dia, lag_s=lag)
+    return al_dia
+
+
+def estado_replica() -> dict:
+    return {
+        "configurada": replica_engine is not None,
+        "al_dia": _replica_estado["al_dia"],
+        "lag_s": _replica_estado["lag_s"],
+    }
+
+# ========================================
+# ENGINE ASYNC (asyncpg)
+# ========================================
+# Mismo Postgres, driver asyncpg: las consultas de los endpoints async
+# se esperan con `await` en vez de bloquear el event loop. asyncpg no
+# entiende `sslmode` en la URL; su equivalente es `ssl`.
+def _async_url(url: str):
+    u = make_url(url).set(drivername="postgresql+asyncpg")
+    query = dict(u.query)
+    sslmode = query.pop("sslmode", None)
+    if sslmode:
+        query["ssl"] = sslmode
+    return u.set(query=query)
+
+
+async_engine = create_async_engine(
+    _async_url(database_url),
+    **db_pool.opciones_pool("async", asincrono=True),
+    connect_args={"timeout": 10},
+    echo=False
+)
+db_pool.instrumentar(async_engine.sync_engine, "async")
+instrumentacion.instrumentar(async_engine.sync_engine, "async")
+
+# expire_on_commit=False: en async no hay carga implícita después del
+# commit (leer un atributo expirado fuera de `await` falla).
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 # ========================================
 # DEPENDENCY PARA FASTAPI
 # ========================================
@@ -45,4 +152,38 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_read_db():
+    """
+    Sesión para lecturas pesadas que toleran unos segundos de atraso.
+
+    Réplica si hay una configurada y al día; si no, la primaria (igual
+    que get_db). El POS y todo lo que lee lo que acaba de escribir
+    (read-your-writes) sigue en get_db.
+    """
+    factory = SessionLocal
+    if ReplicaSessionLocal is not None and _replica_al_dia():
+        factory = ReplicaSessionLocal
+    db = factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """
+    Sesión async para los endpoints de mucho tráfico.
+
+    El código de servicios que recibe una `Session` síncrona se reutiliza
+    tal cual con `await db.run_sync(fn, ...)`: corre sobre la misma
+    conexión asyncpg sin bloquear el event loop. Lo que `fn` devuelva
+    debe estar ya serializado (nada de relaciones lazy fuera de run_sync).
+
+    Ojo: asyncpg no ejecuta varias sentencias en un solo execute, así que
+    las migraciones (app.core.schema) van por el engine síncrono.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,186 @@
+"""
+QueVendi — Pool de conexiones: tamaño, liveness y telemetría
+============================================================
+
+Tamaño
+------
+Por worker y por engine, desde settings (DB_POOL_SIZE / DB_MAX_OVERFLOW
+para el engine síncrono, DB_ASYNC_* para el de asyncpg). Con N workers
+de uvicorn el total contra Postgres es N × (size + overflow) por engine.
+
+Liveness por inactividad
+------------------------
+`pool_pre_ping=True` hacía un SELECT 1 en CADA checkout: un round trip
+extra por request. Aquí sólo se hace ping si la conexión estuvo más de
+DB_PING_INACTIVA_SEGUNDOS sin usarse (en hora punta casi nunca, que es
+cuando importa). Si el ping falla se lanza DisconnectionError y el pool
+descarta esa conexión y entrega otra.
+
+Telemetría
+----------
+Por engine: histogramas de espera por una conexión (incluye abrirla si
+hubo que crear una), tiempo que cada request la retiene, conexiones en
+uso y overflow al momento de cada checkout; más contadores de
+timeouts, pings, conexiones nuevas e invalidadas. Se ven en
+GET /api/v1/admin/db-pool.
+"""
+
+import logging
+import time
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+from app.core.metricas import LIMITES_MS, Histograma
+
+logger = logging.getLogger(__name__)
+
+LIMITES_CONEXIONES = (0, 1, 2, 3, 5, 8, 10, 15, 20, 30, 50)
+
+
+class TelemetriaPool:
+    """Métricas de un engine (sobreviven a `engine.dispose()`)."""
+
+    def __init__(self, nombre: str, pool_size: int, max_overflow: int):
+        self.nombre = nombre
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.engine = None
+        self.espera_ms = Histograma(LIMITES_MS)
+        self.retencion_ms = Histograma(LIMITES_MS)
+        self.en_uso = Histograma(LIMITES_CONEXIONES)
+        self.overflow = Histograma(LIMITES_CONEXIONES)
+        self.contadores = {
+            "timeouts": 0,
+            "conexiones_nuevas": 0,
+            "invalidadas": 0,
+            "pings": 0,
+            "pings_fallidos": 0,
+        }
+
+    def snapshot(self) -> Dict:
+        pool = self.engine.pool if self.engine is not None else None
+        return {
+            "config": {
+                "pool_size": self.pool_size,
+                "max_overflow": self.max_overflow,
+                "pool_timeout_s": settings.DB_POOL_TIMEOUT,
+                "pool_recycle_s": settings.DB_POOL_RECYCLE,
+                "ping_inactiva_s": settings.DB_PING_INACTIVA_SEGUNDOS,
+            },
+            "ahora": {
+                "en_uso": pool.checkedout(),
+                "libres": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            } if pool is not None else None,
+            "contadores": dict(self.contadores),
+            "espera_ms": self.espera_ms.snapshot(),
+            "retencion_ms": self.retencion_ms.snapshot(),
+            "en_uso_al_checkout": self.en_uso.snapshot(),
+            "overflow_al_checkout": self.overflow.snapshot(),
+        }
+
+
+class _EsperaMedida:
+    """Mide cuánto espera cada checkout (y cuenta los pool_timeout)."""
+
+    telemetria: TelemetriaPool
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super()._do_get()
+        except sa_exc.TimeoutError:
+            self.telemetria.contadores["timeouts"] += 1
+            logger.warning(
+                f"[DBPool] {self.telemetria.nombre}: pool_timeout "
+                f"({self.checkedout()} en uso, overflow {self.overflow()})"
+            )
+            raise
+        self.telemetria.espera_ms.observar((time.perf_counter() - inicio) * 1000)
+        return conexion
+
+
+_telemetrias: Dict[str, TelemetriaPool] = {}
+
+
+def opciones_pool(nombre: str, asincrono: bool = False) -> Dict:
+    """kwargs de create_engine / create_async_engine para este engine."""
+    if asincrono:
+        pool_size, max_overflow = settings.DB_ASYNC_POOL_SIZE, settings.DB_ASYNC_MAX_OVERFLOW
+        base = AsyncAdaptedQueuePool
+    else:
+        pool_size, max_overflow = settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+        base = QueuePool
+
+    telemetria = TelemetriaPool(nombre, pool_size, max_overflow)
+    _telemetrias[nombre] = telemetria
+    clase = type(f"{base.__name__}Medido", (_EsperaMedida, base), {"telemetria": telemetria})
+
+    return {
+        "poolclass": clase,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": False,
+    }
+
+
+def instrumentar(engine, nombre: str) -> None:
+    """Eventos de liveness y telemetría. `engine` síncrono (o `.sync_engine`)."""
+    telemetria = _telemetrias[nombre]
+    telemetria.engine = engine
+    inactiva_max = settings.DB_PING_INACTIVA_SEGUNDOS
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, record):
+        telemetria.contadores["conexiones_nuevas"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, record, proxy):
+        ahora = time.monotonic()
+        devuelta = record.info.get("devuelta_en")
+        if inactiva_max >= 0 and devuelta is not None and ahora - devuelta > inactiva_max:
+            telemetria.contadores["pings"] += 1
+            try:
+                engine.dialect.do_ping(dbapi_connection)
+            except Exception as e:
+                telemetria.contadores["pings_fallidos"] += 1
+                logger.info(f"[DBPool] {nombre}: conexión inactiva caída, se reemplaza ({e})")
+                raise sa_exc.DisconnectionError() from e
+
+        record.info["checkout_en"] = ahora
+        pool = engine.pool
+        telemetria.en_uso.observar(pool.checkedout())
+        telemetria.overflow.observar(max(pool.overflow(), 0))
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, record):
+        ahora = time.monotonic()
+        inicio = record.info.pop("checkout_en", None)
+        if inicio is not None:
+            telemetria.retencion_ms.observar((ahora - inicio) * 1000)
+        record.info["devuelta_en"] = ahora
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidate(dbapi_connection, record, exception):
+        telemetria.contadores["invalidadas"] += 1
+        record.info.pop("devuelta_en", None)
+
+
+def estado() -> Dict:
+    """Snapshot de todos los engines instrumentados."""
+    return {nombre: t.snapshot() for nombre, t in _telemetrias.items()}
+
+
+def reset() -> None:
+    """Vuelve a cero histogramas y contadores (no toca las conexiones)."""
+    for t in _telemetrias.values():
+        for h in (t.espera_ms, t.retencion_ms, t.en_uso, t.overflow):
+            h.reset()
+        for k in t.contadores:
+            t.contadores[k] = 0
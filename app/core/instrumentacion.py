@@ -0,0 +1,300 @@
+"""
+QueVendi — Latencia por ruta, tiempo en base y detección de N+1
+===============================================================
+
+Por request
+-----------
+`TimingMiddleware` abre una medición (ContextVar) y los eventos
+`before/after_cursor_execute` de los engines le suman cada consulta:
+cuántas, cuánto tiempo en la base y cuántas veces se repitió la misma
+sentencia. El ContextVar llega igual a los endpoints `def` (threadpool)
+y a los `run_sync` de asyncpg (SQLAlchemy copia el contexto al greenlet).
+
+Al terminar, por ruta (la plantilla, `GET /api/v1/products/{id}`, no la
+URL concreta):
+
+  latencia_ms   histograma del request completo
+  db_ms         histograma del tiempo en la base
+  queries       histograma de consultas por request
+  status        conteo 2xx / 3xx / 4xx / 5xx
+  n_mas_uno     requests donde una misma sentencia se repitió
+                N_MAS_UNO_UMBRAL veces o más (el patrón del create_sale
+                viejo: un SELECT por item)
+
+La respuesta lleva `Server-Timing: db;dur=..;desc="N queries"`, visible
+en las devtools del navegador.
+
+Consultas lentas
+----------------
+Toda consulta que tarde SLOW_QUERY_MS o más se loguea (WARNING, con el
+request id) y se guarda en una lista corta para /admin.
+
+Exposición
+----------
+GET /metrics en formato texto de Prometheus (con ADMIN_TOKEN), y el
+detalle JSON en GET /api/v1/admin/metricas.
+"""
+
+import logging
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.logs import request_id_var
+from app.core.metricas import LIMITES_MS, Histograma
+
+logger = logging.getLogger(__name__)
+
+LIMITES_QUERIES = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+MAX_RUTAS = 500             # tope de series: rutas sin plantilla van a "sin_ruta"
+MAX_EVENTOS = 50            # últimos N+1 y consultas lentas guardados
+
+
+@dataclass
+class _Medicion:
+    queries: int = 0
+    db_ms: float = 0.0
+    sentencias: Counter = field(default_factory=Counter)
+
+
+_medicion_var: ContextVar[Optional[_Medicion]] = ContextVar("medicion_request", default=None)
+
+
+class _RutaStats:
+    def __init__(self):
+        self.latencia_ms = Histograma(LIMITES_MS)
+        self.db_ms = Histograma(LIMITES_MS)
+        self.queries = Histograma(LIMITES_QUERIES)
+        self.status: Counter = Counter()
+        self.n_mas_uno = 0
+
+    def snapshot(self) -> Dict:
+        return {
+            "latencia_ms": self.latencia_ms.snapshot(),
+            "db_ms": self.db_ms.snapshot(),
+            "queries": self.queries.snapshot(),
+            "status": dict(self.status),
+            "n_mas_uno": self.n_mas_uno,
+        }
+
+
+_rutas: Dict[str, _RutaStats] = {}
+_n_mas_uno: Deque[Dict] = deque(maxlen=MAX_EVENTOS)
+_lentas: Deque[Dict] = deque(maxlen=MAX_EVENTOS)
+_contadores = {"consultas_lentas": 0, "consultas_fuera_de_request": 0}
+
+
+def _sentencia_corta(sql: str, largo: int = 300) -> str:
+    return " ".join(sql.split())[:largo]
+
+
+# ════════════════════════════════════════════════════════════════
+# EVENTOS DE SQLALCHEMY
+# ════════════════════════════════════════════════════════════════
+
+def instrumentar(engine, nombre: str) -> None:
+    """Medir cada consulta de `engine` (síncrono, o `.sync_engine` del async)."""
+    lenta_ms = settings.SLOW_QUERY_MS
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("qv_inicio", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get("qv_inicio")
+        if not inicios:
+            return
+        ms = (time.perf_counter() - inicios.pop()) * 1000
+
+        medicion = _medicion_var.get()
+        if medicion is not None:
+            medicion.queries += 1
+            medicion.db_ms += ms
+            medicion.sentencias[statement] += 1
+        else:
+            _contadores["consultas_fuera_de_request"] += 1
+
+        if lenta_ms > 0 and ms >= lenta_ms:
+            _contadores["consultas_lentas"] += 1
+            sql = _sentencia_corta(statement)
+            _lentas.append({
+                "engine": nombre,
+                "ms": round(ms, 1),
+                "sql": sql,
+                "request_id": request_id_var.get(),
+                "en": time.time(),
+            })
+            logger.warning("[SlowQuery] %s: %.0f ms: %s", nombre, ms, sql)
+
+
+# ════════════════════════════════════════════════════════════════
+# MIDDLEWARE
+# ════════════════════════════════════════════════════════════════
+
+def _ruta(scope) -> str:
+    route = scope.get("route")
+    plantilla = getattr(route, "path", None)
+    if plantilla is None:
+        return "sin_ruta"
+    return f"{scope['method']} {plantilla}"
+
+
+def _stats(ruta: str) -> _RutaStats:
+    stats = _rutas.get(ruta)
+    if stats is None:
+        if len(_rutas) >= MAX_RUTAS:
+            ruta = "sin_ruta"
+        stats = _rutas.setdefault(ruta, _RutaStats())
+    return stats
+
+
+def _registrar(scope, medicion: _Medicion, status: int, ms: float) -> None:
+    ruta = _ruta(scope)
+    stats = _stats(ruta)
+    stats.latencia_ms.observar(ms)
+    stats.db_ms.observar(medicion.db_ms)
+    stats.queries.observar(medicion.queries)
+    stats.status[f"{status // 100}xx"] += 1
+
+    umbral = settings.N_MAS_UNO_UMBRAL
+    if umbral <= 0 or not medicion.sentencias:
+        return
+    sentencia, veces = medicion.sentencias.most_common(1)[0]
+    if veces >= umbral:
+        stats.n_mas_uno += 1
+        sql = _sentencia_corta(sentencia)
+        _n_mas_uno.append({
+            "ruta": ruta,
+            "veces": veces,
+            "queries": medicion.queries,
+            "sql": sql,
+            "request_id": request_id_var.get(),
+            "en": time.time(),
+        })
+        logger.warning(f"[N+1] {ruta}: la misma consulta {veces} veces ({medicion.queries} en total): {sql}")
+
+
+class TimingMiddleware:
+    """Middleware ASGI: latencia, tiempo en base y consultas por ruta."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        medicion = _Medicion()
+        token = _medicion_var.set(medicion)
+        inicio = time.perf_counter()
+        status = 500
+
+        async def _send(mensaje):
+            nonlocal status
+            if mensaje["type"] == "http.response.start":
+                status = mensaje["status"]
+                timing = f'db;dur={medicion.db_ms:.1f};desc="{medicion.queries} queries"'
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [
+                    (b"server-timing", timing.encode("latin-1"))
+                ]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _medicion_var.reset(token)
+            _registrar(scope, medicion, status, (time.perf_counter() - inicio) * 1000)
+
+
+# ════════════════════════════════════════════════════════════════
+# LECTURA
+# ════════════════════════════════════════════════════════════════
+
+def estado() -> Dict:
+    """JSON para /admin: por ruta, contadores y últimos N+1 / lentas."""
+    return {
+        "rutas": {ruta: s.snapshot() for ruta, s in sorted(_rutas.items())},
+        "contadores": dict(_contadores),
+        "n_mas_uno": list(_n_mas_uno),
+        "consultas_lentas": list(_lentas),
+    }
+
+
+def reset() -> None:
+    _rutas.clear()
+    _n_mas_uno.clear()
+    _lentas.clear()
+    for k in _contadores:
+        _contadores[k] = 0
+
+
+def _etiquetas(**valores) -> str:
+    partes = []
+    for k, v in valores.items():
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{k}="{v}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _histograma_prom(lineas: List[str], nombre: str, snap: Dict, **etiquetas) -> None:
+    """`snap` es un Histograma.snapshot()."""
+    for limite, acumulado in snap["buckets"].items():
+        lineas.append(f"{nombre}_bucket{_etiquetas(**etiquetas, le=limite)} {acumulado}")
+    lineas.append(f"{nombre}_sum{_etiquetas(**etiquetas)} {snap['sum']}")
+    lineas.append(f"{nombre}_count{_etiquetas(**etiquetas)} {snap['count']}")
+
+
+def prometheus() -> str:
+    """Formato de texto de Prometheus (exposition format 0.0.4)."""
+    from app.core import db_pool
+
+    lineas: List[str] = []
+    rutas = sorted(_rutas.items())
+
+    histogramas = (
+        ("qv_http_request_duration_ms", "Latencia del request por ruta (ms)", "latencia_ms"),
+        ("qv_http_request_db_ms", "Tiempo en la base por request (ms)", "db_ms"),
+        ("qv_http_request_queries", "Consultas SQL por request", "queries"),
+    )
+    for nombre, ayuda, atributo in histogramas:
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+        for ruta, s in rutas:
+            _histograma_prom(lineas, nombre, getattr(s, atributo).snapshot(), route=ruta)
+
+    lineas += ["# HELP qv_http_responses_total Respuestas por ruta y clase de status",
+               "# TYPE qv_http_responses_total counter"]
+    for ruta, s in rutas:
+        for clase, n in sorted(s.status.items()):
+            lineas.append(f"qv_http_responses_total{_etiquetas(route=ruta, status=clase)} {n}")
+
+    lineas += ["# HELP qv_http_n_plus_one_total Requests con una consulta repetida N_MAS_UNO_UMBRAL veces o más",
+               "# TYPE qv_http_n_plus_one_total counter"]
+    for ruta, s in rutas:
+        lineas.append(f"qv_http_n_plus_one_total{_etiquetas(route=ruta)} {s.n_mas_uno}")
+
+    lineas += ["# HELP qv_db_slow_queries_total Consultas de SLOW_QUERY_MS o más",
+               "# TYPE qv_db_slow_queries_total counter",
+               f"qv_db_slow_queries_total {_contadores['consultas_lentas']}"]
+
+    pools = db_pool.estado()
+    lineas += ["# HELP qv_db_pool_wait_ms Espera por una conexión del pool (ms)",
+               "# TYPE qv_db_pool_wait_ms histogram"]
+    for nombre, p in sorted(pools.items()):
+        _histograma_prom(lineas, "qv_db_pool_wait_ms", p["espera_ms"], pool=nombre)
+    lineas += ["# HELP qv_db_pool_in_use Conexiones en uso ahora",
+               "# TYPE qv_db_pool_in_use gauge"]
+    for nombre, p in sorted(pools.items()):
+        if p["ahora"] is not None:
+            lineas.append(f"qv_db_pool_in_use{_etiquetas(pool=nombre)} {p['ahora']['en_uso']}")
+    lineas += ["# HELP qv_db_pool_timeouts_total Checkouts que agotaron pool_timeout",
+               "# TYPE qv_db_pool_timeouts_total counter"]
+    for nombre, p in sorted(pools.items()):
+        lineas.append(f"qv_db_pool_timeouts_total{_etiquetas(pool=nombre)} {p['contadores']['timeouts']}")
+
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,307 @@
+"""
+QueVendi — Tareas periódicas
+============================
+
+Reemplaza el `while True: ...; await asyncio.sleep(86400)` del lifespan,
+que corría consultas síncronas dentro del event loop (congelando los
+requests mientras recorría todas las tiendas) y se ejecutaba una vez
+por worker.
+
+Cada módulo registra sus tareas al importarse:
+
+    jobs.registrar("fiados_vencidos", marcar_creditos_vencidos, cada_segundos=3600)
+    jobs.registrar("tributario_alertas", enviar_alertas_vencimiento, hora_lima=8)
+
+Cómo corre
+----------
+Un thread por proceso revisa cada JOBS_TICK_SEGUNDOS qué tareas tocan y
+las manda a un ThreadPoolExecutor (JOBS_WORKERS threads): la tarea es
+una función síncrona normal que abre su propia sesión (SessionLocal), y
+nunca toca el event loop.
+
+Una sola réplica
+----------------
+Antes de ejecutar se toma `pg_try_advisory_lock` con la clave de la
+tarea, en una conexión propia que se retiene mientras corre. Si otro
+worker (u otra réplica) lo tiene, se salta. Con el lock tomado se vuelve
+a mirar el historial: si alguien la corrió hace un momento, tampoco.
+
+Historial y reintentos
+----------------------
+Cada intento deja una fila en `qv_jobs_ejecuciones` (inicio, fin,
+estado, resultado, error, host). Si la función lanza, se reintenta
+hasta `reintentos` veces esperando `espera_reintento` segundos, sin
+soltar el lock. El "¿toca?" se calcula con el último inicio registrado,
+así que reiniciar el proceso no vuelve a disparar lo que ya corrió.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core import schema
+from app.core.config import settings
+from app.core.database import engine
+from app.core.tiempo import PERU_TZ
+
+logger = logging.getLogger(__name__)
+
+# Primer entero de pg_advisory_lock(int, int): espacio de claves de jobs
+_LOCK_CLASE = 7_241_002
+
+MIGRATION_SQL = """
+CREATE TABLE IF NOT EXISTS qv_jobs_ejecuciones (
+    id          BIGSERIAL PRIMARY KEY,
+    job         VARCHAR(100) NOT NULL,
+    intento     INTEGER NOT NULL DEFAULT 1,
+    estado      VARCHAR(20) NOT NULL,          -- corriendo | ok | error
+    inicio      TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    fin         TIMESTAMP WITH TIME ZONE,
+    resultado   JSONB,
+    error       TEXT,
+    host        VARCHAR(120)
+);
+CREATE INDEX IF NOT EXISTS idx_qv_jobs_ejecuciones_job
+    ON qv_jobs_ejecuciones(job, inicio DESC);
+"""
+
+schema.registrar("jobs", MIGRATION_SQL, orden=5)
+
+_HOST = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class Job:
+    nombre: str
+    fn: Callable[[], Optional[dict]]
+    cada_segundos: Optional[int] = None     # periódica...
+    hora_lima: Optional[int] = None         # ...o diaria a esa hora de Lima
+    reintentos: int = 2
+    espera_reintento: int = 60
+
+    @property
+    def clave_lock(self) -> int:
+        # int4 con signo estable entre procesos (hash() de Python no lo es)
+        return zlib.crc32(self.nombre.encode("utf-8")) - 2**31
+
+    def toca(self, ultimo_inicio: Optional[datetime], ahora: datetime) -> bool:
+        if self.hora_lima is not None:
+            lima = ahora.astimezone(PERU_TZ)
+            objetivo = lima.replace(hour=self.hora_lima, minute=0, second=0, microsecond=0)
+            if lima < objetivo:
+                objetivo -= timedelta(days=1)
+            if ultimo_inicio is None:
+                # Nunca corrió (primer despliegue): esperar a su hora, no
+                # disparar las alertas diarias a la hora que toque arrancar
+                return lima.hour == self.hora_lima
+            return ultimo_inicio < objetivo
+        if ultimo_inicio is None:
+            return True
+        return (ahora - ultimo_inicio).total_seconds() >= self.cada_segundos
+
+
+_jobs: Dict[str, Job] = {}
+_corriendo: Dict[str, bool] = {}
+_lock = threading.Lock()
+_parar = threading.Event()
+_hilo: Optional[threading.Thread] = None
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def registrar(
+    nombre: str,
+    fn: Callable[[], Optional[dict]],
+    cada_segundos: Optional[int] = None,
+    hora_lima: Optional[int] = None,
+    reintentos: int = 2,
+    espera_reintento: int = 60,
+) -> None:
+    """Registrar una tarea. `fn` es síncrona; lo que devuelva (dict) va al historial."""
+    if (cada_segundos is None) == (hora_lima is None):
+        raise ValueError(f"Job {nombre}: indicar cada_segundos o hora_lima (uno solo)")
+    _jobs[nombre] = Job(nombre, fn, cada_segundos, hora_lima, reintentos, espera_reintento)
+
+
+# ════════════════════════════════════════════════════════════════
+# HISTORIAL
+# ════════════════════════════════════════════════════════════════
+
+def _ultimo_inicio(conn, nombre: str) -> Optional[datetime]:
+    return conn.execute(
+        text("SELECT MAX(inicio) FROM qv_jobs_ejecuciones WHERE job = :j"), {"j": nombre}
+    ).scalar()
+
+
+def _abrir(conn, nombre: str, intento: int) -> int:
+    eid = conn.execute(text("""
+        INSERT INTO qv_jobs_ejecuciones (job, intento, estado, host)
+        VALUES (:j, :i, 'corriendo', :h) RETURNING id
+    """), {"j": nombre, "i": intento, "h": _HOST}).scalar()
+    conn.commit()
+    return eid
+
+
+def _cerrar(conn, eid: int, estado: str, resultado=None, error: Optional[str] = None) -> None:
+    conn.execute(text("""
+        UPDATE qv_jobs_ejecuciones
+        SET estado = :e, fin = NOW(), resultado = CAST(:r AS JSONB), error = :err
+        WHERE id = :id
+    """), {
+        "id": eid, "e": estado, "err": error,
+        "r": json.dumps(resultado, default=str) if resultado is not None else None,
+    })
+    conn.commit()
+
+
+# ════════════════════════════════════════════════════════════════
+# EJECUCIÓN
+# ════════════════════════════════════════════════════════════════
+
+def _ejecutar(job: Job, forzar: bool = False) -> Optional[str]:
+    """Corre `job` si le toca y nadie más lo tiene. Devuelve el estado final."""
+    try:
+        with engine.connect() as conn:
+            tomado = conn.execute(
+                text("SELECT pg_try_advisory_lock(:c, :k)"),
+                {"c": _LOCK_CLASE, "k": job.clave_lock},
+            ).scalar()
+            conn.commit()
+            if not tomado:
+                return None
+            try:
+                ultimo = _ultimo_inicio(conn, job.nombre)
+                conn.commit()
+                if not forzar and not job.toca(ultimo, datetime.now(timezone.utc)):
+                    return None
+                return _con_reintentos(conn, job)
+            finally:
+                conn.rollback()
+                conn.execute(
+                    text("SELECT pg_advisory_unlock(:c, :k)"),
+                    {"c": _LOCK_CLASE, "k": job.clave_lock},
+                )
+                conn.commit()
+    except Exception as e:
+        logger.exception(f"[Jobs] {job.nombre}: no se pudo ejecutar: {e}")
+        return "error"
+    finally:
+        with _lock:
+            _corriendo[job.nombre] = False
+
+
+def _con_reintentos(conn, job: Job) -> str:
+    for intento in range(1, job.reintentos + 2):
+        eid = _abrir(conn, job.nombre, intento)
+        inicio = time.monotonic()
+        try:
+            resultado = job.fn()
+        except Exception as e:
+            _cerrar(conn, eid, "error", error=str(e)[:2000])
+            logger.exception(f"[Jobs] {job.nombre}: intento {intento} falló: {e}")
+            if intento <= job.reintentos and not _parar.wait(job.espera_reintento):
+                continue
+            return "error"
+        _cerrar(conn, eid, "ok", resultado=resultado)
+        logger.info(f"[Jobs] {job.nombre}: ok en {time.monotonic() - inicio:.1f} s ({resultado})")
+        return "ok"
+    return "error"
+
+
+def _enviar(job: Job, forzar: bool = False) -> bool:
+    with _lock:
+        if _corriendo.get(job.nombre) or _pool is None:
+            return False
+        _corriendo[job.nombre] = True
+    _pool.submit(_ejecutar, job, forzar)
+    return True
+
+
+def _bucle() -> None:
+    # Primer tick un poco después del arranque (schema.aplicar ya corrió)
+    while not _parar.wait(settings.JOBS_TICK_SEGUNDOS):
+        if not schema.asegurar("jobs"):
+            continue
+        ahora = datetime.now(timezone.utc)
+        try:
+            with engine.connect() as conn:
+                ultimos = dict(conn.execute(text("""
+                    SELECT job, MAX(inicio) FROM qv_jobs_ejecuciones GROUP BY job
+                """)).fetchall())
+        except Exception as e:
+            logger.warning(f"[Jobs] No se pudo leer el historial: {e}")
+            continue
+        for job in list(_jobs.values()):
+            if job.toca(ultimos.get(job.nombre), ahora):
+                _enviar(job)
+
+
+def iniciar() -> None:
+    """Arrancar el planificador de este proceso (lifespan)."""
+    global _hilo, _pool
+    if not settings.JOBS_HABILITADOS or _hilo is not None:
+        return
+    _parar.clear()
+    _pool = ThreadPoolExecutor(max_workers=settings.JOBS_WORKERS, thread_name_prefix="qv-job")
+    _hilo = threading.Thread(target=_bucle, name="qv-jobs", daemon=True)
+    _hilo.start()
+    logger.info(f"[Jobs] Planificador iniciado: {', '.join(sorted(_jobs))}")
+
+
+def detener() -> None:
+    """Dejar de planificar. Lo que esté corriendo termina su intento actual."""
+    global _hilo, _pool
+    _parar.set()
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _hilo, _pool = None, None
+
+
+def ejecutar_ahora(nombre: str) -> bool:
+    """Encolar `nombre` ya, aunque no le toque (sigue respetando el lock)."""
+    job = _jobs.get(nombre)
+    if job is None:
+        raise KeyError(nombre)
+    return _enviar(job, forzar=True)
+
+
+# Índices registrados con schema.registrar_indice (CONCURRENTLY, fuera
+# del arranque). Con todos construidos es sólo una consulta al catálogo.
+registrar("schema_indices", schema.crear_indices, cada_segundos=3600, reintentos=0)
+
+
+def estado(limite: int = 10) -> List[Dict]:
+    """Por tarea: programación y últimas ejecuciones (para /admin)."""
+    with engine.connect() as conn:
+        filas = conn.execute(text("""
+            SELECT job, intento, estado, inicio, fin, resultado, error, host
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY job ORDER BY inicio DESC) AS n
+                FROM qv_jobs_ejecuciones
+            ) t
+            WHERE n <= :lim
+            ORDER BY job, inicio DESC
+        """), {"lim": limite}).mappings().all()
+    historial: Dict[str, List[Dict]] = {}
+    for f in filas:
+        historial.setdefault(f["job"], []).append({k: f[k] for k in f.keys() if k != "job"})
+    return [
+        {
+            "nombre": j.nombre,
+            "cada_segundos": j.cada_segundos,
+            "hora_lima": j.hora_lima,
+            "reintentos": j.reintentos,
+            "corriendo_aqui": bool(_corriendo.get(j.nombre)),
+            "ejecuciones": historial.get(j.nombre, []),
+        }
+        for j in sorted(_jobs.values(), key=lambda j: j.nombre)
+    ]
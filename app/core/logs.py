@@ -0,0 +1,181 @@
+"""
+QueVendi — Logging estructurado
+===============================
+
+Reemplaza los `print()` sueltos: cada línea sale como un JSON con nivel,
+módulo y el `request_id` del request que la produjo, así en Railway se
+puede filtrar todo lo que pasó en una venta concreta.
+
+    {"ts": "...", "nivel": "INFO", "logger": "app.services.sale_service",
+     "msg": "[SaleService] Venta creada: ID 812", "request_id": "3f9c..."}
+
+No bloqueante
+-------------
+Los handlers de la raíz son un solo QueueHandler: el request sólo encola
+el registro y un thread (QueueListener) hace el formateo y la escritura a
+stdout. El JSON se arma en ese thread, no en el del request.
+
+Niveles
+-------
+LOG_LEVEL es el nivel general y LOG_LEVELS ajusta por módulo:
+
+    LOG_LEVELS="app.services.voice_service=DEBUG,sqlalchemy.engine=INFO"
+
+Los `logger.debug(...)` de los caminos calientes usan argumentos `%s`
+(no f-strings): si DEBUG está apagado para ese módulo, la llamada se
+descarta antes de formatear nada.
+
+Request id
+----------
+`RequestIdMiddleware` toma la cabecera X-Request-ID (o genera una), la
+deja en un ContextVar para todo el request y la devuelve en la respuesta.
+"""
+
+import json
+import logging
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from app.core.config import settings
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Atributos propios de LogRecord: lo demás que llegue por `extra=` va al JSON
+_ATRIBUTOS_RECORD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        datos = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            datos["request_id"] = record.request_id
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD and not clave.startswith("_"):
+                datos[clave] = valor
+        if record.exc_text:
+            datos["exc"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class _FiltroRequestId(logging.Filter):
+    """Copia el request id al registro en el thread del request."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _ColaHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el thread del request: sólo resuelve
+    el mensaje (los args pueden cambiar después) y el traceback.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _niveles_por_modulo(valor: str):
+    for par in filter(None, (p.strip() for p in valor.split(","))):
+        nombre, _, nivel = par.partition("=")
+        if nombre and nivel:
+            yield nombre.strip(), nivel.strip().upper()
+
+
+def configurar() -> None:
+    """Instalar los handlers de la raíz. Idempotente (uvicorn --reload)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    salida = logging.StreamHandler(sys.stdout)
+    if settings.LOG_JSON:
+        salida.setFormatter(FormatoJSON())
+    else:
+        salida.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s"
+        ))
+
+    cola: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _ColaHandler(cola)
+    handler.addFilter(_FiltroRequestId())
+
+    raiz = logging.getLogger()
+    for h in list(raiz.handlers):
+        raiz.removeHandler(h)
+    raiz.addHandler(handler)
+    raiz.setLevel(settings.LOG_LEVEL.upper())
+
+    for nombre, nivel in _niveles_por_modulo(settings.LOG_LEVELS):
+        logging.getLogger(nombre).setLevel(nivel)
+
+    # Los loggers de uvicorn traen handlers propios: que pasen por la cola
+    for nombre in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        log = logging.getLogger(nombre)
+        log.handlers.clear()
+        log.propagate = True
+
+    _listener = QueueListener(cola, salida, respect_handler_level=True)
+    _listener.start()
+
+
+def detener() -> None:
+    """Vaciar la cola al apagar (si no, se pierden las últimas líneas)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """Middleware ASGI: X-Request-ID de entrada o uno nuevo, y de vuelta en la respuesta."""
+
+    CABECERA = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for nombre, valor in scope.get("headers", ()):
+            if nombre == self.CABECERA:
+                request_id = valor.decode("latin-1")[:64]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex[:16]
+        token = request_id_var.set(request_id)
+
+        async def _send(mensaje):
+            if mensaje["type"] == "http.response.start":
+                mensaje.setdefault("headers", [])
+                mensaje["headers"] = list(mensaje["headers"]) + [
+                    (self.CABECERA, request_id.encode("latin-1"))
+                ]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            request_id_var.reset(token)
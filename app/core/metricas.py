@@ -0,0 +1,78 @@
+"""
+QueVendi — Histogramas en memoria
+=================================
+
+Histograma de buckets fijos, barato de alimentar desde eventos que
+corren en cada request (checkout del pool, latencias). Los percentiles
+son estimados: el límite superior del bucket donde cae el percentil,
+igual que `histogram_quantile` de Prometheus sin interpolar.
+"""
+
+import bisect
+import threading
+from typing import Dict, Optional, Sequence
+
+# Milisegundos: de 1 ms a 30 s
+LIMITES_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histograma:
+    """Conteo por bucket `<= limite`, con suma y total."""
+
+    def __init__(self, limites: Sequence[float] = LIMITES_MS):
+        self.limites = list(limites)
+        self._conteos = [0] * (len(self.limites) + 1)   # el último es +Inf
+        self._total = 0
+        self._suma = 0.0
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float) -> None:
+        i = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            self._conteos[i] += 1
+            self._total += 1
+            self._suma += valor
+
+    def percentil(self, p: float) -> Optional[float]:
+        """Límite superior del bucket que contiene el percentil `p` (0-1)."""
+        with self._lock:
+            conteos, total = list(self._conteos), self._total
+        if not total:
+            return None
+        objetivo = p * total
+        acumulado = 0
+        for limite, n in zip(self.limites, conteos):
+            acumulado += n
+            if acumulado >= objetivo:
+                return limite
+        return float("inf")
+
+    def buckets(self) -> Dict[str, int]:
+        """Conteos acumulados por límite, como los `le` de Prometheus."""
+        with self._lock:
+            conteos = list(self._conteos)
+        resultado, acumulado = {}, 0
+        for limite, n in zip(self.limites, conteos):
+            acumulado += n
+            resultado[str(limite)] = acumulado
+        resultado["+Inf"] = acumulado + conteos[-1]
+        return resultado
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total, suma = self._total, self._suma
+        return {
+            "count": total,
+            "sum": round(suma, 3),
+            "avg": round(suma / total, 3) if total else None,
+            "p50": self.percentil(0.50),
+            "p95": self.percentil(0.95),
+            "p99": self.percentil(0.99),
+            "buckets": self.buckets(),
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._conteos = [0] * (len(self.limites) + 1)
+            self._total = 0
+            self._suma = 0.0
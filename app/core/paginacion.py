@@ -0,0 +1,94 @@
+"""
+QueVendi — Paginación por cursor (keyset)
+=========================================
+
+`LIMIT n OFFSET k` obliga a Postgres a generar y descartar las k filas
+anteriores: cada página del historial es más lenta que la anterior. Con
+keyset la página siguiente se pide "después de la última fila vista":
+
+    WHERE (occurred_at, id) < (:ultimo_occurred_at, :ultimo_id)
+    ORDER BY occurred_at DESC, id DESC
+    LIMIT n
+
+que con un índice sobre esas columnas cuesta lo mismo en la página 1
+que en la 1.000.
+
+El cliente no ve los valores: recibe `next_cursor`, un token opaco
+(base64 de un JSON), y lo devuelve tal cual en `after`.
+"""
+
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+
+def _a_json(v: Any):
+    if isinstance(v, datetime):
+        return {"dt": v.isoformat()}
+    if isinstance(v, date):
+        return {"d": v.isoformat()}
+    if isinstance(v, Decimal):
+        return {"n": str(v)}
+    return v
+
+
+def _de_json(v: Any):
+    if isinstance(v, dict):
+        if "dt" in v:
+            return datetime.fromisoformat(v["dt"])
+        if "d" in v:
+            return date.fromisoformat(v["d"])
+        if "n" in v:
+            return Decimal(v["n"])
+    return v
+
+
+def codificar(valores: Sequence, clave: str = "") -> str:
+    """Token opaco con los valores de orden de la última fila."""
+    datos = {"k": clave, "v": [_a_json(v) for v in valores]}
+    crudo = json.dumps(datos, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(crudo).decode("ascii").rstrip("=")
+
+
+def decodificar(token: str, clave: str = "", columnas: int = 0) -> List:
+    """
+    Valores del cursor. `clave` identifica el orden con que se generó
+    (p. ej. "name:asc"): un cursor de otro orden es un 400, no una
+    página equivocada.
+    """
+    try:
+        crudo = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        datos = json.loads(crudo)
+        valores = [_de_json(v) for v in datos["v"]]
+        if datos.get("k", "") != clave or (columnas and len(valores) != columnas):
+            raise ValueError("cursor de otro listado")
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return valores
+
+
+def despues_de(columnas: Sequence, valores: Sequence, descendente: bool):
+    """
+    Condición keyset: las filas estrictamente después de `valores` en el
+    orden (columnas..., todas asc o todas desc).
+    """
+    if descendente:
+        return tuple_(*columnas) < tuple_(*valores)
+    return tuple_(*columnas) > tuple_(*valores)
+
+
+def siguiente(filas: list, limite: int, valores_de, clave: str = "") -> Optional[str]:
+    """
+    `filas` se pidió con LIMIT limite + 1: si sobró una, hay otra página.
+    Recorta `filas` a `limite` y devuelve el cursor de la última.
+    """
+    if len(filas) <= limite:
+        return None
+    del filas[limite:]
+    return codificar(valores_de(filas[-1]), clave)
@@ -0,0 +1,269 @@
+"""
+QueVendi — Registro de migraciones idempotentes
+===============================================
+
+El proyecto no usa Alembic (la tabla `alembic_version` está vacía): cada
+módulo traía su bloque `CREATE TABLE IF NOT EXISTS` / `ADD COLUMN IF NOT
+EXISTS` y lo ejecutaba con un `_ensure_tables(db)` en CADA request, con
+su commit y sus locks de catálogo. La carta pública y el polling de
+cocina pagaban ese DDL en cada hit.
+
+Ahora cada módulo registra su DDL al importarse:
+
+    schema.registrar("caja", MIGRATION_SQL, MIGRATION_STORE_CONFIG_SQL)
+
+y `aplicar()` corre una vez al arrancar (lifespan). La tabla
+`qv_schema_versiones` guarda el hash del DDL aplicado por módulo: si no
+cambió, el arranque ni siquiera ejecuta el DDL. Un advisory lock evita
+que varios workers lo apliquen a la vez.
+
+Los `_ensure_tables(db)` de los módulos quedan como `asegurar(nombre)`:
+un flag en memoria. Sólo si el arranque no pudo aplicar la migración
+(la base no respondía) se reintenta ahí, como mucho cada
+REINTENTO_SEGUNDOS.
+
+Migraciones perezosas (`perezosa=True`): no se aplican al arrancar sino
+en el primer `asegurar`, para DDL que sólo hace falta en algunos casos.
+Nada que reescriba o bloquee una tabla caliente debe ser perezoso: se
+aplicaría en medio del día, en el request que lo pidió. Una vez
+registradas en la tabla de versiones, los siguientes arranques las dan
+por hechas sin tocar nada.
+
+El DDL va por el engine síncrono en su propia conexión, nunca por la
+sesión del request (asyncpg no ejecuta varias sentencias en un execute).
+
+Índices sobre tablas grandes
+----------------------------
+Un `CREATE INDEX` dentro de la migración bloquea las escrituras de la
+tabla mientras se construye: en products o inventory_movements eso es
+cada venta, en cada despliegue que lo estrene. Esos índices se registran
+aparte:
+
+    schema.registrar_indice("idx_x", "ON products (store_id, name, id)")
+
+y los construye la tarea `schema_indices` (app.core.jobs) con CREATE
+INDEX CONCURRENTLY en autocommit, fuera del arranque y de la
+transacción de las migraciones. Un índice que quedó inválido (build
+cortado) se borra y se vuelve a construir.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+
+from app.core.database import engine
+
+logger = logging.getLogger(__name__)
+
+REINTENTO_SEGUNDOS = 60
+
+# pg_advisory_lock compartido por todos los workers/réplicas al migrar
+_LOCK_ID = 7_241_001
+
+VERSIONES_SQL = """
+CREATE TABLE IF NOT EXISTS qv_schema_versiones (
+    nombre      VARCHAR(100) PRIMARY KEY,
+    hash        VARCHAR(40)  NOT NULL,
+    aplicada_en TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+"""
+
+
+@dataclass
+class Migracion:
+    nombre: str
+    sql: List[str]
+    orden: int = 100
+    perezosa: bool = False
+    hash: str = ""
+    aplicada: Optional[bool] = None     # None = pendiente, False = falló
+    reintentar_en: float = 0.0
+    error: Optional[str] = None
+    ms: Optional[int] = None            # lo que tardó el DDL, si se ejecutó
+
+
+_migraciones: Dict[str, Migracion] = {}
+_lock = threading.Lock()
+
+
+def registrar(nombre: str, *sql: str, orden: int = 100, perezosa: bool = False) -> None:
+    """
+    Registrar el DDL de un módulo. Las piezas se ejecutan en orden y en
+    una sola transacción; entre módulos manda `orden` (menor primero:
+    store_config va antes que los que le agregan columnas).
+    """
+    huella = hashlib.sha1("\n".join(sql).encode("utf-8")).hexdigest()
+    _migraciones[nombre] = Migracion(nombre, list(sql), orden, perezosa, huella)
+
+
+def _versiones(conn) -> Dict[str, str]:
+    conn.execute(text(VERSIONES_SQL))
+    rows = conn.execute(text("SELECT nombre, hash FROM qv_schema_versiones")).fetchall()
+    return {r.nombre: r.hash for r in rows}
+
+
+def _aplicar_una(conn, m: Migracion, versiones: Dict[str, str]) -> None:
+    """Ejecuta el DDL de `m` si su hash no está registrado. `conn` ya tiene el lock."""
+    if versiones.get(m.nombre) == m.hash:
+        m.aplicada, m.error = True, None
+        return
+    inicio = time.monotonic()
+    try:
+        for pieza in m.sql:
+            conn.execute(text(pieza))
+        conn.execute(text("""
+            INSERT INTO qv_schema_versiones (nombre, hash, aplicada_en)
+            VALUES (:n, :h, NOW())
+            ON CONFLICT (nombre) DO UPDATE SET hash = :h, aplicada_en = NOW()
+        """), {"n": m.nombre, "h": m.hash})
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        m.aplicada, m.error = False, str(e).splitlines()[0][:300]
+        m.reintentar_en = time.monotonic() + REINTENTO_SEGUNDOS
+        logger.warning(f"[Schema] {m.nombre}: migración no aplicada: {e}")
+        return
+    m.aplicada, m.error = True, None
+    m.ms = int((time.monotonic() - inicio) * 1000)
+    logger.info(f"[Schema] {m.nombre}: migración aplicada ({m.ms} ms)")
+
+
+def _con_lock(fn) -> None:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _LOCK_ID})
+        try:
+            versiones = _versiones(conn)
+            conn.commit()
+            fn(conn, versiones)
+        finally:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _LOCK_ID})
+            conn.commit()
+
+
+def aplicar() -> Dict:
+    """
+    Al arrancar: aplica, en orden, las migraciones no perezosas cuyo DDL
+    cambió (o nunca se aplicó). Bloqueante: llamarla en un thread.
+    """
+    def _todas(conn, versiones):
+        for m in sorted(_migraciones.values(), key=lambda m: (m.orden, m.nombre)):
+            if m.aplicada:
+                continue
+            if m.perezosa:
+                if versiones.get(m.nombre) == m.hash:
+                    m.aplicada = True
+                continue
+            _aplicar_una(conn, m, versiones)
+
+    inicio = time.monotonic()
+    with _lock:
+        try:
+            _con_lock(_todas)
+        except Exception as e:
+            # Base caída al arrancar: cada módulo reintenta en su asegurar()
+            logger.error(f"[Schema] No se pudieron aplicar migraciones al arrancar: {e}")
+    logger.info(f"[Schema] Arranque: {int((time.monotonic() - inicio) * 1000)} ms")
+    return estado()
+
+
+def lista(nombre: str) -> bool:
+    """¿Ya aplicada? Nunca toca la base."""
+    return bool(_migraciones[nombre].aplicada)
+
+
+def asegurar(nombre: str) -> bool:
+    """
+    ¿El esquema del módulo está listo? En el camino normal es sólo leer
+    un flag; aplica la migración si está pendiente (perezosa o fallida
+    al arrancar, respetando REINTENTO_SEGUNDOS).
+    """
+    m = _migraciones[nombre]
+    if m.aplicada:
+        return True
+    if m.aplicada is False and time.monotonic() < m.reintentar_en:
+        return False
+    with _lock:
+        if m.aplicada:
+            return True
+        if m.aplicada is False and time.monotonic() < m.reintentar_en:
+            return False
+        try:
+            _con_lock(lambda conn, versiones: _aplicar_una(conn, m, versiones))
+        except Exception as e:
+            m.aplicada, m.error = False, str(e).splitlines()[0][:300]
+            m.reintentar_en = time.monotonic() + REINTENTO_SEGUNDOS
+            logger.warning(f"[Schema] {nombre}: sin conexión para migrar: {e}")
+    return bool(m.aplicada)
+
+
+# ════════════════════════════════════════════════════════════════
+# ÍNDICES CONCURRENTES
+# ════════════════════════════════════════════════════════════════
+
+_indices: Dict[str, str] = {}
+
+
+def registrar_indice(nombre: str, definicion: str) -> None:
+    """`definicion` es lo que sigue al nombre: "ON tabla (cols) [WHERE ...]"."""
+    _indices[nombre] = definicion
+
+
+def _estado_indices(conn, nombres: Iterable[str]) -> Dict[str, bool]:
+    """{nombre: válido} de los índices que existen."""
+    rows = conn.execute(text("""
+        SELECT c.relname, i.indisvalid
+          FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+         WHERE c.relname = ANY(:nombres)
+    """), {"nombres": list(nombres)}).fetchall()
+    return {r.relname: bool(r.indisvalid) for r in rows}
+
+
+def indices_validos(nombres: Iterable[str]) -> bool:
+    """¿Existen y están válidos (build terminado)?"""
+    nombres = list(nombres)
+    with engine.connect() as conn:
+        validos = _estado_indices(conn, nombres)
+    return all(validos.get(n) for n in nombres)
+
+
+def crear_indices(definiciones: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Construir con CONCURRENTLY los índices que falten (por defecto, los
+    registrados). Bloqueante y puede tardar: llamarla desde una tarea,
+    que además garantiza una sola réplica a la vez.
+    """
+    defs = _indices if definiciones is None else definiciones
+    creados = []
+    # CONCURRENTLY no puede ir dentro de una transacción
+    with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        validos = _estado_indices(conn, defs)
+        for nombre, definicion in defs.items():
+            if validos.get(nombre):
+                continue
+            if nombre in validos:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nombre}"))
+            inicio = time.monotonic()
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nombre} {definicion}"))
+            logger.info(f"[Schema] Índice {nombre} creado ({int((time.monotonic() - inicio) * 1000)} ms)")
+            creados.append(nombre)
+    return {"creados": creados}
+
+
+def estado() -> Dict:
+    """Por módulo: aplicada / pendiente / error (para /admin)."""
+    return {
+        m.nombre: {
+            "estado": {True: "aplicada", False: "error", None: "pendiente"}[m.aplicada],
+            "perezosa": m.perezosa,
+            "hash": m.hash[:12],
+            "ms": m.ms,
+            "error": m.error,
+        }
+        for m in sorted(_migraciones.values(), key=lambda m: (m.orden, m.nombre))
+    }
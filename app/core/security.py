@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.core.config import settings
@@ -11,6 +11,7 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from app.models.user import User
+from app.core.auth_cache import adjuntar, auth_cache
 
 
 # Contexto para hashing de PINs
@@ -108,6 +109,33 @@ def decode_token(token: str) -> Optional[dict]:
 # GET CURRENT USER
 # ============================================
 
+def usuario_desde_token(db: Session, token: str) -> Optional[Tuple[User, Optional[int]]]:
+    """
+    Usuario activo dueño del token y el store_id que trae el token.
+
+    Con el token en auth_cache no hay decode ni SELECT: la foto del
+    usuario se adjunta a `db`. Usuarios desactivados no autentican.
+    """
+    entrada = auth_cache.get(token)
+    if entrada is not None:
+        return adjuntar(db, entrada), entrada.token_store_id
+
+    payload = decode_token(token)
+    if not payload:
+        return None
+    try:
+        user_id = int(payload.get("sub") or payload.get("user_id"))
+    except (TypeError, ValueError):
+        return None
+
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user or not user.is_active:
+        return None
+
+    auth_cache.put(token, user, payload)
+    return user, payload.get("store_id")
+
+
 security = HTTPBearer(auto_error=False)
 
 async def get_current_user(
@@ -127,16 +155,11 @@ async def get_current_user(
     if not token:
         raise HTTPException(status_code=401, detail="No autenticado")
 
-    payload = decode_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Token inválido")
-
-    user_id = payload.get("user_id") or payload.get("sub")
-    user = db.query(User).filter(User.id == int(user_id)).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    resultado = usuario_desde_token(db, token)
+    if not resultado:
+        raise HTTPException(status_code=401, detail="Token inválido o usuario no encontrado")
 
-    token_store_id = payload.get("store_id")
+    user, token_store_id = resultado
     if token_store_id:
         user.store_id = token_store_id
 
@@ -4,8 +4,13 @@ QueVendi - Sistema POS para Bodegas
 Main Application Entry Point
 """
 
+# Primero que todo: con QV_PERFIL_ARRANQUE=1 mide cada import que sigue
+from app.core import arranque
+arranque.activar_si_corresponde()
+
 import os
 import asyncio
+import logging
 from pathlib import Path
 from contextlib import asynccontextmanager
 from typing import Optional
@@ -18,6 +23,12 @@ from fastapi.templating import Jinja2Templates
 from sqlalchemy import func
 
 from app.core.config import settings
+from app.core import instrumentacion, logs
+
+# Antes de importar el resto: database y los routers ya loguean al importarse
+logs.configurar()
+logger = logging.getLogger(__name__)
+
 from app.core.security import decode_token
 from app.core.database import SessionLocal
 from app.models.user import User
@@ -71,6 +82,7 @@ from app.api.v1 import (
     tributario,
     pricing,
     webhooks,
+    admin,
 )
 from app.routers import lite
 
@@ -83,14 +95,10 @@ TEMPLATES_DIR = BASE_DIR / "app" / "templates"
 STATIC_DIR = BASE_DIR / "static"
 
 # Verificar directorios
-print(f"📂 BASE_DIR: {BASE_DIR}")
-print(f"📂 TEMPLATES_DIR: {TEMPLATES_DIR}")
-print(f"📂 STATIC_DIR: {STATIC_DIR}")
+logger.debug("BASE_DIR: %s | TEMPLATES_DIR: %s | STATIC_DIR: %s", BASE_DIR, TEMPLATES_DIR, STATIC_DIR)
 
-if TEMPLATES_DIR.exists():
-    print(f"✅ Templates encontrado")
-else:
-    print(f"⚠️ ERROR: Templates no encontrado en {TEMPLATES_DIR}")
+if not TEMPLATES_DIR.exists():
+    logger.error("Templates no encontrado en %s", TEMPLATES_DIR)
 
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
@@ -98,66 +106,59 @@ templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 # ========================================
 # LIFESPAN EVENT
 # ========================================
-async def _cron_tributario_diario():
-    """Revisa cada 24h vencimientos próximos y envía push (zClaude-28)."""
-    from app.api.v1.tributario import enviar_alertas_vencimiento
-    while True:
-        try:
-            await enviar_alertas_vencimiento()
-        except Exception as e:
-            print(f"[Tributario] Error en cron diario: {e}")
-        await asyncio.sleep(86400)  # 24 horas
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup y shutdown events"""
 
     # ===== STARTUP =====
-    print("\n" + "="*60)
-    print("🚀 QUEVENDI - SERVIDOR INICIADO")
-    print("="*60)
+    logger.info("QUEVENDI - servidor iniciando")
 
-    # Tarea de fondo: alertas tributarias diarias
-    cron_task = asyncio.create_task(_cron_tributario_diario())
-    
-    # Listar rutas registradas
-    routes_html = []
-    routes_api = []
-    
-    for route in app.routes:
-        if hasattr(route, 'methods') and hasattr(route, 'path'):
-            methods = ', '.join(sorted(route.methods - {'HEAD', 'OPTIONS'}))
-            if not methods:
-                continue
-            path = route.path
-            
-            if path.startswith('/api/'):
-                routes_api.append(f"  {methods:12} {path}")
-            elif not path.startswith('/static') and not path.startswith('/openapi') and not path.startswith('/docs') and not path.startswith('/redoc'):
-                routes_html.append(f"  {methods:12} {path}")
-    
-    print("\n📄 RUTAS HTML:")
-    for route in sorted(set(routes_html)):
-        print(route)
-    
-    print("\n🔌 RUTAS API:")
-    for route in sorted(set(routes_api)):
-        print(route)
+    # Esquema: el DDL que registran los módulos, una sola vez por arranque
+    from app.core import schema
+    await asyncio.to_thread(schema.aplicar)
+
+    # Tareas periódicas (alertas tributarias, fiados vencidos, cola
+    # offline): las registran sus módulos, corren en threads propios
+    from app.core import jobs
+    jobs.iniciar()
     
-    print("\n" + "="*60)
-    print(f"✅ Servidor listo en: http://0.0.0.0:{os.getenv('PORT', '8080')}")
-    print("="*60 + "\n")
+    # Listar rutas registradas (sólo con DEBUG: son ~400 líneas)
+    if logger.isEnabledFor(logging.DEBUG):
+        routes_html = []
+        routes_api = []
+
+        for route in app.routes:
+            if hasattr(route, 'methods') and hasattr(route, 'path'):
+                methods = ', '.join(sorted(route.methods - {'HEAD', 'OPTIONS'}))
+                if not methods:
+                    continue
+                path = route.path
+
+                if path.startswith('/api/'):
+                    routes_api.append(f"  {methods:12} {path}")
+                elif not path.startswith('/static') and not path.startswith('/openapi') and not path.startswith('/docs') and not path.startswith('/redoc'):
+                    routes_html.append(f"  {methods:12} {path}")
+
+        logger.debug("RUTAS HTML:\n%s", "\n".join(sorted(set(routes_html))))
+        logger.debug("RUTAS API:\n%s", "\n".join(sorted(set(routes_api))))
+
+    logger.info(f"Servidor listo en: http://0.0.0.0:{os.getenv('PORT', '8080')}")
+    arranque.marcar_listo()
+
+    # SDKs de LLM/TTS diferidos: importarlos ya, pero sin demorar el arranque
+    if settings.PRECALENTAR_SDKS:
+        asyncio.get_running_loop().run_in_executor(None, arranque.precalentar)
     
     yield
 
     # ===== SHUTDOWN =====
-    cron_task.cancel()
-    try:
-        await cron_task
-    except (asyncio.CancelledError, Exception):
-        pass
-    print("\n👋 Servidor detenido")
+    jobs.detener()
+    from app.services.llm_service import LLMService
+    await LLMService.aclose()
+    from app.core.database import async_engine
+    await async_engine.dispose()
+    logger.info("Servidor detenido")
+    logs.detener()
 
 
 # ========================================
@@ -179,17 +180,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+# El último agregado es el más externo: el request id cubre todo el
+# request, y la medición (instrumentacion) incluye CORS
+app.add_middleware(instrumentacion.TimingMiddleware)
+app.add_middleware(logs.RequestIdMiddleware)
+
 
 # ========================================
 # ARCHIVOS ESTÁTICOS
 # ========================================
 if STATIC_DIR.exists():
     app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
-    print(f"📁 Archivos estáticos montados: {STATIC_DIR}")
+    logger.debug("Archivos estáticos montados: %s", STATIC_DIR)
 else:
-    print(f"⚠️ Directorio static/ no encontrado")
+    logger.warning("Directorio static/ no encontrado")
 
 
 # ========================================
@@ -234,6 +241,8 @@ app.include_router(purchases.router, prefix="/api/v1", tags=["purchases"])
 app.include_router(tributario.router, prefix="/api/v1", tags=["tributario"])
 app.include_router(pricing.router, prefix="/api/v1", tags=["pricing"])
 app.include_router(webhooks.router, prefix="/api/v1", tags=["webhooks"])
+app.include_router(admin.router, prefix="/api/v1", tags=["admin"])
+app.include_router(admin.metrics_router, tags=["admin"])
 
 # ── Health check para PWA offline ──
 @app.get("/api/v1/health")
@@ -12,6 +12,7 @@
 #   app.include_router(billing_offline_router, prefix="/api/v1/billing/offline")
 # ================================================================
 
+import asyncio
 import logging
 from datetime import datetime, timezone, timedelta
 from typing import Optional, List
@@ -21,7 +22,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text, func
 from pydantic import BaseModel
 
-from app.core.database import get_db
+from app.core import jobs, schema
+from app.core.database import SessionLocal, get_db
 from app.core.security import get_current_user
 from app.models.user import User
 from app.models.billing import StoreBillingConfig
@@ -36,6 +38,10 @@ TZ_PERU = timezone(timedelta(hours=-5))
 DEFAULT_BLOCK_SIZE = 50
 MAX_BLOCK_SIZE = 200
 
+# Reenvío en segundo plano de la cola offline
+MAX_REINTENTOS = 5
+LOTE_REINTENTOS = 100
+
 
 # ================================================================
 # SCHEMAS
@@ -185,14 +191,12 @@ CREATE INDEX IF NOT EXISTS idx_offline_queue_status
 # HELPERS
 # ================================================================
 
+schema.registrar("billing_offline", MIGRATION_SQL)
+
+
 def _ensure_tables(db: Session):
-    """Crear tablas si no existen (idempotente)"""
-    try:
-        db.execute(text(MIGRATION_SQL))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.warning(f"[OfflineBilling] Migration warning: {e}")
+    """Tablas de facturación offline (aplicadas al arrancar)"""
+    schema.asegurar("billing_offline")
 
 
 def _get_next_serie(db: Session, store_id: int, tipo: str) -> str:
@@ -736,4 +740,92 @@ async def _enviar_offline_a_facturalo(
                 }
 
     except Exception as e:
-        return {"success": False, "error": str(e)}
\ No newline at end of file
+        return {"success": False, "error": str(e)}
+
+
+# ================================================================
+# TAREA PERIÓDICA — Reenviar la cola offline
+# ================================================================
+
+def reintentar_pendientes() -> dict:
+    """
+    Tarea cada 10 min (app.core.jobs): reenvía a Facturalo lo que quedó
+    en billing_offline_queue — 'pending' (la tienda no tenía config o el
+    sync se cortó) y 'error' con menos de MAX_REINTENTOS intentos.
+    Los de los últimos minutos se dejan al sync que los está enviando.
+
+    Sólo de tiendas con config activa (filtrado antes del LIMIT: si no,
+    los de tiendas sin config ocupan el lote para siempre). Cada
+    resultado se confirma apenas llega: si la tarea se corta, lo que
+    Facturalo ya aceptó no se vuelve a enviar.
+    """
+    db = SessionLocal()
+    try:
+        schema.asegurar("billing_offline")
+        filas = db.execute(text("""
+            SELECT q.id, q.store_id, q.payload
+            FROM billing_offline_queue q
+            WHERE q.status IN ('pending', 'error')
+              AND COALESCE(q.retry_count, 0) < :max
+              AND q.created_at < NOW() - INTERVAL '5 minutes'
+              AND EXISTS (
+                  SELECT 1 FROM store_billing_configs c
+                  WHERE c.store_id = q.store_id AND c.is_active = TRUE
+              )
+            ORDER BY q.created_at
+            LIMIT :lote
+        """), {"max": MAX_REINTENTOS, "lote": LOTE_REINTENTOS}).fetchall()
+        if not filas:
+            return {"pendientes": 0}
+
+        configs = {
+            c.store_id: c
+            for c in db.query(StoreBillingConfig).filter(
+                StoreBillingConfig.store_id.in_({f.store_id for f in filas}),
+                StoreBillingConfig.is_active == True
+            )
+        }
+        envios = [f for f in filas if f.store_id in configs]
+
+        async def _enviar_todos() -> int:
+            aceptados = 0
+            for f in envios:
+                comp = OfflineComprobanteItem(**f.payload)
+                result = await _enviar_offline_a_facturalo(configs[f.store_id], comp, f.store_id)
+                aceptados += _guardar_reintento(db, f.id, result)
+                db.commit()
+            return aceptados
+
+        aceptados = asyncio.run(_enviar_todos())
+    finally:
+        db.close()
+
+    return {
+        "pendientes": len(filas),
+        "enviados": len(envios),
+        "aceptados": aceptados,
+        "sin_config": len(filas) - len(envios),
+    }
+
+
+def _guardar_reintento(db, fila_id: int, result: dict) -> bool:
+    """Estado del reintento en la cola (sin commit). True si fue aceptado."""
+    if result["success"]:
+        db.execute(text("""
+            UPDATE billing_offline_queue SET
+                status = 'accepted', facturalo_id = :fid, pdf_url = :pdf,
+                error_message = NULL, synced_at = NOW()
+            WHERE id = :id
+        """), {"id": fila_id, "fid": result.get("facturalo_id"),
+               "pdf": result.get("pdf_url")})
+        return True
+    db.execute(text("""
+        UPDATE billing_offline_queue SET
+            status = 'error', error_message = :err,
+            retry_count = COALESCE(retry_count, 0) + 1
+        WHERE id = :id
+    """), {"id": fila_id, "err": result.get("error", "Unknown")})
+    return False
+
+
+jobs.registrar("billing_offline_reintentos", reintentar_pendientes, cada_segundos=600, reintentos=0)
@@ -25,6 +25,7 @@ Agregar en main.py:
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import HTMLResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime, timedelta
@@ -32,7 +33,8 @@ from typing import Optional, List
 from pydantic import BaseModel
 import logging
 
-from app.core.database import get_db
+from app.core import schema
+from app.core.database import get_async_db, get_db
 from app.api.dependencies import get_current_user
 from app.models.user import User
 
@@ -105,14 +107,11 @@ MIGRATION_STORE_CONFIG_SQL = """
 ALTER TABLE store_config ADD COLUMN IF NOT EXISTS caja_apertura_requerida BOOLEAN DEFAULT TRUE;
 """
 
+schema.registrar("caja", MIGRATION_SQL, MIGRATION_STORE_CONFIG_SQL)
+
+
 def _ensure_tables(db: Session):
-    try:
-        db.execute(text(MIGRATION_SQL))
-        db.execute(text(MIGRATION_STORE_CONFIG_SQL))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.warning(f"[Caja] Migración: {e}")
+    schema.asegurar("caja")
 
 # ════════════════════════════════════════════════
 # SCHEMAS
@@ -292,15 +291,28 @@ async def abrir_caja(
     }
 
 
-@router.get("/activa")
-async def caja_activa(
+def _store_caja(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
-):
-    """Obtener la sesión de caja activa del usuario actual."""
+) -> int:
+    """Migración + store_id, en el threadpool (dependencia síncrona)."""
     _ensure_tables(db)
-    store_id = current_user.store_id
+    return current_user.store_id
+
+
+@router.get("/activa")
+async def caja_activa(
+    db: AsyncSession = Depends(get_async_db),
+    store_id: int = Depends(_store_caja)
+):
+    """
+    Obtener la sesión de caja activa del usuario actual.
+    El POS la consulta a cada rato: va por la sesión async.
+    """
+    return await db.run_sync(_sesion_activa, store_id)
+
 
+def _sesion_activa(db: Session, store_id: int) -> dict:
     row = db.execute(text("""
     SELECT * FROM caja_sesiones
     WHERE store_id = :sid AND estado = 'abierta'
@@ -38,6 +38,7 @@ from typing import Optional
 from datetime import datetime
 import logging
 
+from app.core import schema
 from app.core.database import get_db
 from app.core.tiempo import dia_operativo_peru
 from app.models.store import Store
@@ -112,13 +113,11 @@ CREATE TABLE IF NOT EXISTS chat_mensajes (
 CREATE INDEX IF NOT EXISTS idx_chat_store ON chat_mensajes(store_id);
 """
 
+schema.registrar("carta_virtual", MIGRATION_SQL)
+
+
 def _ensure_tables(db: Session):
-    try:
-        db.execute(text(MIGRATION_SQL))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.warning(f"[Carta] Migración: {e}")
+    schema.asegurar("carta_virtual")
 
 
 # ════════════════════════════════════════════════
@@ -1,6 +1,7 @@
 """
 Chat en tiempo real vía WebSocket — multi-tenant por store_id.
 """
+import logging
 import asyncio
 from typing import Dict, List, Optional
 from datetime import datetime, timezone, timedelta
@@ -28,6 +29,8 @@ from app.api.dependencies import get_current_user
 # siempre: el comportamiento del chat no cambia.
 from app.services.ws_manager import ConnectionManager, manager  # noqa: F401
 
+logger = logging.getLogger(__name__)
+
 
 # ──────────────────────────────────────────────────────────────────────────
 # Routers
@@ -132,7 +135,7 @@ async def websocket_chat(
             except WebSocketDisconnect:
                 raise
             except Exception as e:
-                print(f"[chat WS] receive error user={user_id}: {e}")
+                logger.warning("[chat WS] receive error user=%s: %s", user_id, e)
                 break
 
             msg_type = data.get("type", "text")
@@ -258,7 +261,7 @@ async def websocket_chat(
     except WebSocketDisconnect:
         pass
     except Exception as e:
-        print(f"[chat WS] error en loop user={user_id} store={store_id}: {e}")
+        logger.warning("[chat WS] error en loop user=%s store=%s: %s", user_id, store_id, e)
     finally:
         manager.disconnect(store_id, user_id)
         await manager.send_to_store(
@@ -415,7 +418,7 @@ async def upload_media(
         blob.upload_from_string(content, content_type=file.content_type)
         return {"url": f"/api/v1/chat/media/{blob_path}", "ok": True}
     except Exception as e:
-        print(f"[chat upload] GCS falló, fallback local: {e}")
+        logger.warning("[chat upload] GCS falló, fallback local: %s", e)
         local_dir = f"static/uploads/chat/{store_id}"
         os.makedirs(local_dir, exist_ok=True)
         local_file = f"{local_dir}/{uuid.uuid4()}.{ext}"
@@ -454,7 +457,7 @@ async def serve_chat_media(path: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[chat media] no se pudo servir {path}: {e}")
+        logger.info("[chat media] no se pudo servir %s: %s", path, e)
         raise HTTPException(status_code=404, detail="No encontrado")
 
 
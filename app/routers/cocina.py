@@ -32,13 +32,15 @@ from fastapi import (APIRouter, Depends, HTTPException, Query, Request,
                      WebSocket, WebSocketDisconnect)
 from pydantic import BaseModel, Field
 from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.dependencies import get_current_user
-from app.core.database import get_db
+from app.api.dependencies import get_current_user, get_token_from_request
+from app.core.database import get_async_db, get_db
 from app.core.security import decode_token
 from app.models.user import User
 from app.services import comanda_service as cs
+from app.services.auth_service import AuthService
 from app.services.comanda_print import payload_impresion
 from app.services.ws_manager import (broadcast as ws_broadcast, canal_caja,
                                      canal_cocina, channels)
@@ -105,7 +107,7 @@ def _store_cocina(
     return store_id
 
 
-async def _store_cocina_o_device(
+def _store_cocina_o_device(
     request: Request,
     device_token: Optional[str] = Query(None),
     db: Session = Depends(get_db),
@@ -117,6 +119,9 @@ async def _store_cocina_o_device(
     una contraseña, así que se identifica con un token largo en la URL.
     Ese token sólo sirve para leer la cola y mover estados: no crea
     comandas ni ve ventas.
+
+    Es síncrona a propósito: FastAPI la corre en el threadpool, y la
+    pantalla de cocina la llama cada pocos segundos.
     """
     cs._ensure_tables(db)
 
@@ -129,9 +134,9 @@ async def _store_cocina_o_device(
         raise HTTPException(401, "Dispositivo no autorizado o revocado")
 
     # 2) Usuario autenticado normal
-    try:
-        user = await get_current_user(request, db)
-    except HTTPException:
+    jwt_token = get_token_from_request(request)
+    user = AuthService(db).get_current_user(jwt_token) if jwt_token else None
+    if not user:
         raise HTTPException(401, "No autenticado")
 
     store_id = getattr(user, "store_id", None)
@@ -233,11 +238,12 @@ async def impresion_comanda(
 @router.get("/pendientes")
 async def listar_pendientes(
     store_id_param: Optional[int] = Query(None, alias="store_id"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     store_id: int = Depends(_store_cocina_o_device),
 ):
     """
     Cola de cocina: comandas de HOY en estado 'sent' o 'preparing'.
+    Es el polling de la pantalla de cocina: va por la sesión async.
 
     El parámetro `store_id` se acepta por comodidad del cliente, pero se
     valida: pedir el de otra tienda es 403. La consulta siempre usa el
@@ -246,7 +252,7 @@ async def listar_pendientes(
     if store_id_param is not None and store_id_param != store_id:
         raise HTTPException(403, "No puedes consultar la cocina de otro negocio")
 
-    pendientes = cs.comandas_pendientes(db, store_id)
+    pendientes = await db.run_sync(cs.comandas_pendientes, store_id)
     return {"comandas": pendientes, "total": len(pendientes)}
 
 
@@ -9,7 +9,8 @@ import csv
 import io
 import re
 import secrets
-from datetime import datetime
+from calendar import monthrange
+from datetime import date, datetime
 from decimal import Decimal
 from typing import Optional
 from urllib.parse import quote
@@ -20,16 +21,15 @@ from pydantic import BaseModel, EmailStr
 from sqlalchemy import func, and_, or_
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
+from app.core.database import get_db, get_read_db
 from app.api.dependencies import get_current_user
 from app.models.user import User
 from app.models.store import Store
 from app.models.billing import Comprobante
-from app.models.sale import Sale, SaleItem
-from app.models.product import Product
 from app.models.contador import Contador, ContadorStore, ContadorPermiso
 from app.routers.contador_auth import get_current_contador
-from app.api.v1.kardex import _compute_corte, _build_corte_xlsx
+from app.services import agregados_ventas, exportacion
+from app.api.v1.kardex import _compute_corte, _corte_xlsx
 
 
 router = APIRouter(tags=["contador"])
@@ -598,7 +598,7 @@ async def libro_ventas(
     store_id: int,
     mes: int = Query(..., ge=1, le=12),
     anio: int = Query(..., ge=2000, le=2100),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     contador: Contador = Depends(get_current_contador),
 ):
     _ensure_contador_access(db, contador.id, store_id)
@@ -629,7 +629,7 @@ async def libro_ventas_export(
     mes: int = Query(..., ge=1, le=12),
     anio: int = Query(..., ge=2000, le=2100),
     formato: str = Query("csv"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     contador: Contador = Depends(get_current_contador),
 ):
     """Descarga CSV formato PLE SUNAT 14.1 (Registro de Ventas)."""
@@ -700,7 +700,7 @@ async def resumen_cliente(
     store_id: int,
     mes: int = Query(..., ge=1, le=12),
     anio: int = Query(..., ge=2000, le=2100),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     contador: Contador = Depends(get_current_contador),
 ):
     _ensure_contador_access(db, contador.id, store_id)
@@ -720,27 +720,13 @@ async def resumen_cliente(
         por_dia[dia] = por_dia.get(dia, 0.0) + _to_float(c.total)
     ventas_por_dia = [{"dia": d, "total": round(por_dia[d], 2)} for d in sorted(por_dia)]
 
-    # Top productos del periodo (vía sales/sale_items)
-    top_rows = (
-        db.query(
-            Product.name.label("name"),
-            func.sum(SaleItem.quantity).label("qty"),
-            func.sum(SaleItem.subtotal).label("total"),
-        )
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .join(Product, Product.id == SaleItem.product_id)
-        .filter(
-            Sale.store_id == store_id,
-            func.extract("month", Sale.created_at) == mes,
-            func.extract("year", Sale.created_at) == anio,
-        )
-        .group_by(Product.name)
-        .order_by(func.sum(SaleItem.subtotal).desc())
-        .limit(5)
-        .all()
+    # Top productos del periodo (agregados diarios, no sales/sale_items)
+    top_rows = agregados_ventas.por_producto(
+        db, store_id, date(anio, mes, 1), date(anio, mes, monthrange(anio, mes)[1]),
+        orden="ingresos", limite=5,
     )
     top_productos = [
-        {"name": r.name, "qty": _to_float(r.qty), "total": round(_to_float(r.total), 2)}
+        {"name": r.name, "qty": _to_float(r.cantidad), "total": round(_to_float(r.ingresos), 2)}
         for r in top_rows
     ]
 
@@ -762,7 +748,7 @@ async def corte_inventario_contador(
     store_id: int,
     fecha: Optional[str] = None,
     categoria: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     contador: Contador = Depends(get_current_contador),
 ):
     """Corte de inventario a una fecha/hora, para un store del contador."""
@@ -775,19 +761,14 @@ async def exportar_corte_contador(
     store_id: int,
     fecha: Optional[str] = None,
     categoria: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     contador: Contador = Depends(get_current_contador),
 ):
     """Exporta el corte de inventario a Excel para un store del contador."""
     _ensure_contador_access(db, contador.id, store_id)
     corte = _compute_corte(db, store_id, fecha=fecha, categoria=categoria)
-    buf = _build_corte_xlsx(corte)
 
     fecha_dt = datetime.fromisoformat(corte["fecha_corte"])
     fecha_str = fecha_dt.strftime("%Y%m%d_%H%M")
     filename = f"corte_inventario_store{store_id}_{fecha_str}.xlsx"
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-    )
+    return exportacion.descarga(_corte_xlsx(corte), filename, exportacion.MEDIA_XLSX)
@@ -26,6 +26,7 @@ from app.models.store import Store
 from app.models.user import User
 from app.models.product import Product
 from app.models.billing import StoreBillingConfig
+from app.services import search_index
 
 router = APIRouter(tags=["demo"])
 
@@ -326,6 +327,7 @@ def import_products_from_catalog(db: Session, store_id: int, niche: str) -> int:
         count += 1
 
     db.commit()
+    search_index.invalidar_tienda(store_id)
     return count
 
 
@@ -17,6 +17,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from pydantic import BaseModel
 
+from app.core import schema
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.models.user import User
@@ -79,14 +80,12 @@ ALTER TABLE store_config
 """
 
 
+# orden=10: caja y cocina le agregan columnas a store_config
+schema.registrar("store_config", MIGRATION_SQL, MIGRATION_COLUMNAS_NUEVAS_SQL, orden=10)
+
+
 def _ensure_table(db: Session):
-    try:
-        db.execute(text(MIGRATION_SQL))
-        db.execute(text(MIGRATION_COLUMNAS_NUEVAS_SQL))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.warning(f"[StoreConfig] Migration warning: {e}")
+    schema.asegurar("store_config")
 
 
 # ================================================================
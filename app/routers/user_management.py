@@ -18,6 +18,7 @@ from sqlalchemy import text
 
 from app.core.database import get_db
 from app.core.security import get_current_user
+from app.core.auth_cache import auth_cache
 from app.models.user import User
 
 logger = logging.getLogger(__name__)
@@ -80,6 +81,7 @@ async def deactivate_user(
     # Desactivar usuario
     user.is_active = False
     db.commit()
+    auth_cache.invalidar_usuario(user_id)
 
     # Intentar revocar dispositivos del usuario (si la tabla existe)
     try:
@@ -130,6 +132,7 @@ async def activate_user(
 
     user.is_active = True
     db.commit()
+    auth_cache.invalidar_usuario(user_id)
 
     logger.info(f"[UserMgmt] ✅ Usuario {user.username} (ID:{user_id}) reactivado")
 
@@ -0,0 +1,279 @@
+"""
+QueVendi — Agregados de ventas por día y hora
+=============================================
+
+El dashboard de reportes (stats/today, top-products, hourly-sales,
+payment-methods, sales-by-category, cierre-caja) y el resumen del
+contador volvían a sumar `sales` × `sale_items` × `products` en cada
+carga: seis agregaciones sobre las ventas del día cada vez que el dueño
+refrescaba los gráficos.
+
+Ahora se mantienen dos tablas de agregados:
+
+  ventas_por_hora          (store, día Lima, hora, método) → ventas, total
+  ventas_por_producto_dia  (store, día Lima, producto)     → cantidad,
+                                                             ingresos, margen
+
+y los reportes leen esas filas (unas decenas por día), no las ventas.
+
+Incremental
+-----------
+`aplicar_venta(db, sale_id, +1)` suma la venta en la MISMA transacción
+que la crea (SaleService.create_sale) y `aplicar_venta(db, sale_id, -1)`
+la resta al anularla (POST /sales/{id}/void). Es un INSERT ... ON
+CONFLICT DO UPDATE con el delta: no se lee nada en Python. Las filas se
+insertan ordenadas por clave para que dos cajas de la misma tienda
+tomen los locks en el mismo orden.
+
+El día y la hora salen de `sales.created_at` en hora de Lima, igual que
+la ventana de `dia_operativo_peru`. Las ventas anuladas no cuentan.
+
+El margen es (precio − costo) × cantidad, con el costo del kardex de la
+propia venta (`inventory_movements` con reference_type 'sale'): sumar y
+restar la misma venta da lo mismo aunque el producto cambie de costo
+entre medio, y reconstruir da lo que se sumó. Sólo una venta sin
+movimiento (anterior al kardex) usa el costo actual del producto.
+
+Reconstrucción
+--------------
+`reconstruir(db, desde, hasta, store_id)` recalcula un rango de días
+desde las ventas (backfill al desplegar, POST /api/v1/admin/agregados/
+reconstruir). La tarea diaria `agregados_reconciliar` rehace ayer y hoy
+por si algún camino escribió ventas sin pasar por aquí.
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core import jobs, schema
+from app.core.database import SessionLocal
+from app.core.tiempo import hoy_peru
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_SQL = """
+CREATE TABLE IF NOT EXISTS ventas_por_hora (
+    store_id        INTEGER NOT NULL,
+    dia             DATE NOT NULL,
+    hora            SMALLINT NOT NULL,
+    payment_method  VARCHAR(20) NOT NULL,
+    num_ventas      INTEGER NOT NULL DEFAULT 0,
+    total           NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, dia, hora, payment_method)
+);
+CREATE TABLE IF NOT EXISTS ventas_por_producto_dia (
+    store_id    INTEGER NOT NULL,
+    dia         DATE NOT NULL,
+    product_id  INTEGER NOT NULL,
+    cantidad    NUMERIC(14, 3) NOT NULL DEFAULT 0,
+    ingresos    NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    margen      NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (store_id, dia, product_id)
+);
+"""
+
+schema.registrar("agregados_ventas", MIGRATION_SQL)
+
+# Costo de cada línea en el kardex de su venta. CONCURRENTLY, por la
+# tarea schema_indices: inventory_movements recibe una fila por línea.
+schema.registrar_indice(
+    "idx_inventory_mov_venta",
+    "ON inventory_movements (reference_id, product_id) WHERE reference_type = 'sale'",
+)
+
+# Día y hora de Lima de una venta (misma frontera que dia_operativo_peru)
+_DIA = "(s.created_at AT TIME ZONE 'America/Lima')::date"
+_HORA = "EXTRACT(HOUR FROM s.created_at AT TIME ZONE 'America/Lima')::smallint"
+
+_SELECT_HORA = f"""
+    SELECT s.store_id, {_DIA} AS dia, {_HORA} AS hora,
+           COALESCE(s.payment_method, '') AS payment_method,
+           :signo * COUNT(*) AS num_ventas,
+           :signo * COALESCE(SUM(s.total), 0) AS total
+      FROM sales s
+     WHERE {{filtro}}
+     GROUP BY 1, 2, 3, 4
+     ORDER BY 1, 2, 3, 4
+"""
+
+_SELECT_PRODUCTO = f"""
+    SELECT s.store_id, {_DIA} AS dia, si.product_id,
+           :signo * COALESCE(SUM(si.quantity), 0) AS cantidad,
+           :signo * COALESCE(SUM(si.subtotal), 0) AS ingresos,
+           :signo * COALESCE(SUM((si.unit_price - COALESCE(c.cost_price, p.cost_price, 0)) * si.quantity), 0) AS margen
+      FROM sales s
+      JOIN sale_items si ON si.sale_id = s.id
+      JOIN products p ON p.id = si.product_id
+      LEFT JOIN LATERAL (
+          SELECT im.cost_price FROM inventory_movements im
+           WHERE im.reference_type = 'sale' AND im.reference_id = s.id
+             AND im.product_id = si.product_id
+           ORDER BY im.id LIMIT 1
+      ) c ON TRUE
+     WHERE {{filtro}}
+     GROUP BY 1, 2, 3
+     ORDER BY 1, 2, 3
+"""
+
+# `sumar`: el delta se acumula; `reemplazar`: el valor reconstruido manda
+_CONFLICTO_HORA = {
+    "sumar": """
+        num_ventas = ventas_por_hora.num_ventas + EXCLUDED.num_ventas,
+        total = ventas_por_hora.total + EXCLUDED.total""",
+    "reemplazar": """
+        num_ventas = EXCLUDED.num_ventas, total = EXCLUDED.total""",
+}
+_CONFLICTO_PRODUCTO = {
+    "sumar": """
+        cantidad = ventas_por_producto_dia.cantidad + EXCLUDED.cantidad,
+        ingresos = ventas_por_producto_dia.ingresos + EXCLUDED.ingresos,
+        margen = ventas_por_producto_dia.margen + EXCLUDED.margen""",
+    "reemplazar": """
+        cantidad = EXCLUDED.cantidad, ingresos = EXCLUDED.ingresos,
+        margen = EXCLUDED.margen""",
+}
+
+
+def _upsert(db: Session, filtro: str, params: dict, modo: str) -> None:
+    db.execute(text(f"""
+        INSERT INTO ventas_por_hora (store_id, dia, hora, payment_method, num_ventas, total)
+        {_SELECT_HORA.format(filtro=filtro)}
+        ON CONFLICT (store_id, dia, hora, payment_method) DO UPDATE SET {_CONFLICTO_HORA[modo]}
+    """), params)
+    db.execute(text(f"""
+        INSERT INTO ventas_por_producto_dia (store_id, dia, product_id, cantidad, ingresos, margen)
+        {_SELECT_PRODUCTO.format(filtro=filtro)}
+        ON CONFLICT (store_id, dia, product_id) DO UPDATE SET {_CONFLICTO_PRODUCTO[modo]}
+    """), params)
+
+
+# ════════════════════════════════════════════════════════════════
+# ESCRITURA
+# ════════════════════════════════════════════════════════════════
+
+def aplicar_venta(db: Session, sale_id: int, signo: int = 1) -> None:
+    """
+    Sumar (+1) o restar (-1) una venta en los agregados. Sin commit: va
+    dentro de la transacción de quien crea o anula la venta.
+    """
+    if not schema.lista("agregados_ventas"):
+        return
+    _upsert(db, "s.id = :sale_id", {"sale_id": sale_id, "signo": signo}, "sumar")
+
+
+def reconstruir(db: Session, desde: date, hasta: date,
+                store_id: Optional[int] = None) -> Dict:
+    """
+    Recalcular los días [desde, hasta] (inclusive) desde las ventas, de
+    a un mes por transacción. Bloqueante: llamarla en un thread.
+    """
+    schema.asegurar("agregados_ventas")
+    dias = 0
+    inicio = desde
+    while inicio <= hasta:
+        siguiente = (inicio.replace(day=1) + timedelta(days=32)).replace(day=1)
+        fin = min(hasta, siguiente - timedelta(days=1))
+        params = {"desde": inicio, "hasta": fin, "sid": store_id, "signo": 1}
+        por_store = "AND (CAST(:sid AS INTEGER) IS NULL OR store_id = :sid)"
+        for tabla in ("ventas_por_hora", "ventas_por_producto_dia"):
+            db.execute(text(f"""
+                DELETE FROM {tabla}
+                 WHERE dia BETWEEN :desde AND :hasta {por_store}
+            """), params)
+        _upsert(db, """
+            s.created_at >= (CAST(:desde AS date)::timestamp AT TIME ZONE 'America/Lima')
+            AND s.created_at < ((CAST(:hasta AS date) + 1)::timestamp AT TIME ZONE 'America/Lima')
+            AND s.status IS DISTINCT FROM 'cancelled'
+            AND (CAST(:sid AS INTEGER) IS NULL OR s.store_id = :sid)
+        """, params, "reemplazar")
+        db.commit()
+        dias += (fin - inicio).days + 1
+        inicio = siguiente
+    logger.info(f"[Agregados] Reconstruidos {dias} días ({desde} → {hasta}, store={store_id or 'todas'})")
+    return {"desde": desde.isoformat(), "hasta": hasta.isoformat(), "dias": dias, "store_id": store_id}
+
+
+def reconciliar() -> dict:
+    """Tarea diaria (app.core.jobs): rehace ayer y hoy para todas las tiendas."""
+    hoy = hoy_peru()
+    db = SessionLocal()
+    try:
+        return reconstruir(db, hoy - timedelta(days=1), hoy)
+    finally:
+        db.close()
+
+
+jobs.registrar("agregados_reconciliar", reconciliar, hora_lima=4)
+
+
+# ════════════════════════════════════════════════════════════════
+# LECTURA
+# ════════════════════════════════════════════════════════════════
+
+def totales_por_dia(db: Session, store_id: int, desde: date, hasta: date) -> Dict[date, Tuple[float, int]]:
+    """{día: (total, num_ventas)} para [desde, hasta]."""
+    rows = db.execute(text("""
+        SELECT dia, SUM(total) AS total, SUM(num_ventas) AS num_ventas
+          FROM ventas_por_hora
+         WHERE store_id = :sid AND dia BETWEEN :desde AND :hasta
+         GROUP BY dia
+    """), {"sid": store_id, "desde": desde, "hasta": hasta}).fetchall()
+    return {r.dia: (float(r.total or 0), int(r.num_ventas or 0)) for r in rows}
+
+
+def por_hora(db: Session, store_id: int, dia: date) -> Dict[int, float]:
+    """{hora: total} del día."""
+    rows = db.execute(text("""
+        SELECT hora, SUM(total) AS total
+          FROM ventas_por_hora
+         WHERE store_id = :sid AND dia = :dia
+         GROUP BY hora
+    """), {"sid": store_id, "dia": dia}).fetchall()
+    return {int(r.hora): float(r.total or 0) for r in rows}
+
+
+def por_metodo(db: Session, store_id: int, dia: date) -> List[Tuple[str, int, float]]:
+    """[(método, num_ventas, total)] del día."""
+    rows = db.execute(text("""
+        SELECT payment_method, SUM(num_ventas) AS num_ventas, SUM(total) AS total
+          FROM ventas_por_hora
+         WHERE store_id = :sid AND dia = :dia
+         GROUP BY payment_method
+        HAVING SUM(num_ventas) > 0
+    """), {"sid": store_id, "dia": dia}).fetchall()
+    return [(r.payment_method or None, int(r.num_ventas or 0), float(r.total or 0)) for r in rows]
+
+
+def por_producto(db: Session, store_id: int, desde: date, hasta: date,
+                 orden: str = "cantidad", limite: Optional[int] = None) -> List:
+    """
+    Filas (product_id, name, unit, category, cantidad, ingresos, margen)
+    del rango, con nombre y categoría actuales del producto. `orden`:
+    "cantidad" o "ingresos".
+    """
+    columna = {"cantidad": "cantidad", "ingresos": "ingresos"}[orden]
+    return db.execute(text(f"""
+        SELECT a.product_id, p.name, p.unit, p.category,
+               SUM(a.cantidad) AS cantidad, SUM(a.ingresos) AS ingresos,
+               SUM(a.margen) AS margen
+          FROM ventas_por_producto_dia a
+          JOIN products p ON p.id = a.product_id
+         WHERE a.store_id = :sid AND a.dia BETWEEN :desde AND :hasta
+         GROUP BY a.product_id, p.name, p.unit, p.category
+        HAVING SUM(a.cantidad) <> 0
+         ORDER BY {columna} DESC
+         {"LIMIT :lim" if limite else ""}
+    """), {"sid": store_id, "desde": desde, "hasta": hasta, "lim": limite}).fetchall()
+
+
+def margen(db: Session, store_id: int, dia: date) -> float:
+    """Ganancia estimada del día."""
+    return float(db.execute(text("""
+        SELECT COALESCE(SUM(margen), 0)
+          FROM ventas_por_producto_dia
+         WHERE store_id = :sid AND dia = :dia
+    """), {"sid": store_id, "dia": dia}).scalar() or 0)
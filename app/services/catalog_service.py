@@ -11,15 +11,19 @@ Flujo de importación:
   3. Segundo pase: resolver complementarios/sustitutos (código→ID)
   4. Registrar catalog_origin para trazabilidad
 """
+import logging
 import json
 from pathlib import Path
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, any_
+from sqlalchemy import func
 from datetime import datetime, timezone
 
 from app.models.product import Product
 from app.models.store import Store
+from app.services import search_index
+
+logger = logging.getLogger(__name__)
 
 
 # Ruta a los catálogos JSON
@@ -74,7 +78,7 @@ class CatalogService:
                         )
                     })
             except Exception as e:
-                print(f"⚠️ Error leyendo {file}: {e}")
+                logger.warning("Error leyendo %s: %s", file, e)
         
         return catalogs
     
@@ -84,14 +88,14 @@ class CatalogService:
         file_path = CATALOGS_DIR / f"{nicho}.json"
         
         if not file_path.exists():
-            print(f"⚠️ Catálogo no encontrado: {nicho}")
+            logger.warning("Catálogo no encontrado: %s", nicho)
             return None
         
         try:
             with open(file_path, "r", encoding="utf-8") as f:
                 return json.load(f)
         except Exception as e:
-            print(f"❌ Error cargando catálogo {nicho}: {e}")
+            logger.warning("Error cargando catálogo %s: %s", nicho, e)
             return None
     
     @staticmethod
@@ -286,7 +290,7 @@ class CatalogService:
                     existing_codes.add(codigo)
                 
             except Exception as e:
-                print(f"❌ Error importando {nombre}: {e}")
+                logger.warning("Error importando %s: %s", nombre, e)
                 stats["errors"] += 1
         
         # ── PASE 2: Resolver relaciones complementarios/sustitutos ──
@@ -300,12 +304,14 @@ class CatalogService:
         try:
             db.commit()
             
+            search_index.invalidar_tienda(store_id)
+            
             # Actualizar active_catalogs del store
             CatalogService._update_store_catalogs(db, store_id, nicho)
             
         except Exception as e:
             db.rollback()
-            print(f"❌ Error en commit: {e}")
+            logger.warning("Error en commit: %s", e)
             stats["errors"] += stats["imported"]
             stats["imported"] = 0
         
@@ -412,6 +418,7 @@ class CatalogService:
         
         try:
             db.commit()
+            search_index.invalidar_tienda(store_id)
             
             # Actualizar active_catalogs del store
             store = db.query(Store).get(store_id)
@@ -422,7 +429,7 @@ class CatalogService:
                 
         except Exception as e:
             db.rollback()
-            print(f"❌ Error eliminando catálogo {nicho}: {e}")
+            logger.warning("Error eliminando catálogo %s: %s", nicho, e)
             stats["deleted"] = 0
         
         return stats
@@ -518,41 +525,19 @@ class CatalogService:
         Búsqueda inteligente de productos por nombre y aliases.
         Pensada para el POS y especialmente para comandos de voz.
         
-        Prioridad de resultados:
-          1. Coincidencia exacta en nombre
-          2. Nombre contiene la búsqueda
-          3. Búsqueda está en aliases
-          4. Búsqueda en tags
+        Prioridad de resultados (índice en memoria, ver search_index):
+          1. Coincidencia exacta en nombre o alias
+          2. Palabra exacta / prefijo de nombre o alias
+          3. Nombre o alias contiene la búsqueda
+          4. Parecido fuzzy (errores de dictado)
         """
-        query_lower = query.strip().lower()
-        if not query_lower:
+        if not query.strip():
             return []
         
-        base = db.query(Product).filter(
-            Product.store_id == store_id,
-            Product.is_active == True,
-            Product.deleted_at.is_(None)
+        return search_index.buscar_productos(
+            db, store_id, query, limit=limit, categoria=category,
+            solo_con_stock=only_in_stock,
         )
-        
-        if category:
-            base = base.filter(Product.category == category)
-        
-        if only_in_stock:
-            base = base.filter(Product.stock > 0)
-        
-        # Búsqueda combinada: nombre ILIKE OR alias ANY
-        results = base.filter(
-            or_(
-                func.lower(Product.name).contains(query_lower),
-                func.lower(any_(Product.aliases)).op('LIKE')(f'%{query_lower}%')
-            )
-        ).order_by(
-            # Exact match first, then partial
-            func.lower(Product.name) == query_lower,  # Exacto primero
-            Product.name
-        ).limit(limit).all()
-        
-        return results
 
 
 # Instancia global del servicio
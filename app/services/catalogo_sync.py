@@ -0,0 +1,267 @@
+"""
+QueVendi — Sync del catálogo offline (v2)
+=========================================
+
+Cada terminal pide `GET /api/v1/products/catalog` al reconectar, y en
+una bodega con datos móviles eso es todo el tiempo. El protocolo v1
+filtraba por `updated_at` (sin índice, y que los UPDATE en SQL del
+stock no tocan) y buscaba las bajas en una columna `Product.active` que
+no existe: las bajas nunca llegaban.
+
+Versión = transacción que escribió
+---------------------------------
+Un trigger en `products` (AFTER INSERT/UPDATE/DELETE) anota en
+`catalogo_cambios` (tienda, id de la transacción, producto) cuando cambia
+algo que la terminal usa (nombre, precios, stock, activo, borrado...),
+no en cualquier UPDATE. Un cambio de tienda anota el producto en las
+dos. El trigger no toma ningún lock aparte del de la fila que ya se
+escribe: una venta no espera a otra por el catálogo.
+
+La versión no vive en `products`: una columna indexada ahí haría que
+cada UPDATE de stock (el más frecuente, en cada venta) dejara de ser HOT
+y tocara todos los índices de la tabla, incluidos los GIN de búsqueda.
+Así `products` no gana índices y cada cambio cuesta un INSERT de tres
+enteros en una tabla angosta (uno por producto y transacción).
+
+El sync incremental lee los ids anotados desde el cursor y manda el
+estado actual de cada uno: si ya no está en la tienda o tiene
+deleted_at, va en `deleted_ids`. No hace falta distinguir bajas.
+
+El cursor que recibe la terminal es el xmin del snapshot
+(`pg_snapshot_xmin`): toda transacción con id menor ya terminó cuando se
+leyó, así que lo que hizo ya está en la respuesta (o se abortó). Las que
+seguían abiertas tienen id >= xmin y entran en el próximo sync, que pide
+`xid >= cursor`. Los ids no llegan en orden de commit, por eso el
+cursor no es "el mayor visto" sino ese piso.
+
+El costo: lo escrito entre el xmin y la lectura se vuelve a mandar en el
+sync siguiente (upserts idempotentes), y una transacción larga en la
+base retiene el xmin y alarga ese tramo.
+
+Protocolo
+---------
+- La terminal manda `since_seq` (el `seq` de su última respuesta) y
+  recibe los productos cambiados desde ahí y los ids borrados
+  (deleted_at, DELETE físico o cambio de tienda) en `deleted_ids`.
+- Sin `since_seq`, o si ese tramo de `catalogo_cambios` ya se purgó
+  (CAMBIOS_DIAS), recibe el catálogo completo con `is_full_sync`.
+- El ETag lleva el cursor: con `If-None-Match` y sin cambios desde ahí
+  se responde 304 sin leer productos (una consulta por índice).
+"""
+
+import logging
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core import jobs, schema
+from app.core.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Días que se guardan los cambios; una terminal más atrasada recibe el
+# catálogo completo
+CAMBIOS_DIAS = 90
+
+MIGRATION_SQL = """
+-- Restos de la primera versión (versión en products.sync_xid)
+DROP TRIGGER IF EXISTS trg_catalogo_baja ON products;
+DROP FUNCTION IF EXISTS qv_catalogo_baja();
+DROP INDEX IF EXISTS idx_products_store_sync_xid;
+ALTER TABLE products DROP COLUMN IF EXISTS sync_xid;
+DROP TABLE IF EXISTS catalogo_bajas;
+DROP TABLE IF EXISTS catalogo_purgas;
+
+-- Tabla nueva: la PK se crea vacía, no bloquea nada
+CREATE TABLE IF NOT EXISTS catalogo_cambios (
+    store_id        INTEGER NOT NULL,
+    xid             BIGINT NOT NULL,
+    product_id      INTEGER NOT NULL,
+    PRIMARY KEY (store_id, xid, product_id)
+);
+-- Marca diaria del cursor, para purgar por xid sin guardar fechas por fila
+CREATE TABLE IF NOT EXISTS catalogo_marcas (
+    dia             DATE PRIMARY KEY,
+    xid             BIGINT NOT NULL,
+    purgado         BOOLEAN NOT NULL DEFAULT FALSE  -- cambios con xid < esto ya no están
+);
+
+CREATE OR REPLACE FUNCTION qv_catalogo_marcar() RETURNS trigger AS $$
+DECLARE
+    x BIGINT := pg_current_xact_id()::text::bigint;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO catalogo_cambios (store_id, xid, product_id)
+        VALUES (OLD.store_id, x, OLD.id) ON CONFLICT DO NOTHING;
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        IF NEW.store_id IS DISTINCT FROM OLD.store_id THEN
+            INSERT INTO catalogo_cambios (store_id, xid, product_id)
+            VALUES (OLD.store_id, x, OLD.id) ON CONFLICT DO NOTHING;
+        ELSIF (NEW.name, NEW.barcode, NEW.sale_price, NEW.cost_price, NEW.stock,
+               NEW.unit, NEW.category, NEW.image_url, NEW.sell_by_fraction,
+               NEW.min_stock_alert, NEW.is_active, NEW.deleted_at)
+              IS NOT DISTINCT FROM
+              (OLD.name, OLD.barcode, OLD.sale_price, OLD.cost_price, OLD.stock,
+               OLD.unit, OLD.category, OLD.image_url, OLD.sell_by_fraction,
+               OLD.min_stock_alert, OLD.is_active, OLD.deleted_at) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+    INSERT INTO catalogo_cambios (store_id, xid, product_id)
+    VALUES (NEW.store_id, x, NEW.id) ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_catalogo_marcar ON products;
+CREATE TRIGGER trg_catalogo_marcar AFTER INSERT OR UPDATE OR DELETE ON products
+    FOR EACH ROW EXECUTE PROCEDURE qv_catalogo_marcar();
+"""
+
+schema.registrar("catalogo_sync", MIGRATION_SQL)
+
+_COLUMNAS = """
+    id, name, barcode, sale_price, cost_price, stock, unit, category,
+    image_url, sell_by_fraction, min_stock_alert, is_active, deleted_at
+"""
+
+
+def _producto(r) -> Dict:
+    return {
+        "id": r.id,
+        "name": r.name,
+        "barcode": r.barcode,
+        "sale_price": float(r.sale_price or 0),
+        "purchase_price": float(r.cost_price or 0),
+        "stock": float(r.stock or 0),
+        "unit": r.unit or "unidad",
+        "category": r.category,
+        "image_url": r.image_url,
+        "allow_fractional": bool(r.sell_by_fraction),
+        "min_stock": r.min_stock_alert or 0,
+        "active": r.is_active is not False,
+    }
+
+
+def etag(store_id: int, cursor: int) -> str:
+    return f'W/"cat2-{store_id}-{cursor}"'
+
+
+def cursor_en_etag(store_id: int, if_none_match: Optional[str]) -> Optional[int]:
+    """Cursor del ETag que manda la terminal (si es de esta tienda)."""
+    for t in (if_none_match or "").split(","):
+        m = re.fullmatch(r'(?:W/)?"cat2-(\d+)-(\d+)"', t.strip())
+        if m and int(m.group(1)) == store_id:
+            return int(m.group(2))
+    return None
+
+
+def cursor_actual(db: Session) -> int:
+    """xmin del snapshot: las transacciones con id menor ya terminaron."""
+    return int(db.execute(text(
+        "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+    )).scalar())
+
+
+def _purgado(db: Session) -> int:
+    return db.execute(text("""
+        SELECT MAX(xid) FROM catalogo_marcas WHERE purgado
+    """)).scalar() or 0
+
+
+def hay_cambios(db: Session, store_id: int, desde: int) -> bool:
+    """¿Algo que mandar a una terminal con cursor `desde`?"""
+    if desde < _purgado(db):
+        return True
+    return bool(db.execute(text("""
+        SELECT EXISTS (SELECT 1 FROM catalogo_cambios
+                        WHERE store_id = :sid AND xid >= :desde)
+    """), {"sid": store_id, "desde": desde}).scalar())
+
+
+def cambios(db: Session, store_id: int, desde: Optional[int], cursor: int) -> Dict:
+    """
+    Productos anotados con xid >= `desde`, en su estado actual. `cursor` es cursor_actual()
+    leído antes: lo que aún no se veía entra en el próximo sync. Si
+    `desde` no sirve (None, purgado o de otra base), completo.
+    """
+    completo = desde is None or desde > cursor or desde < _purgado(db)
+    params = {"sid": store_id, "desde": desde or 0}
+
+    if completo:
+        filas = db.execute(text(f"""
+            SELECT {_COLUMNAS} FROM products
+             WHERE store_id = :sid AND deleted_at IS NULL
+        """), params).fetchall()
+        return {
+            "products": [_producto(r) for r in filas],
+            "deleted_ids": [],
+            "is_full_sync": True,
+        }
+
+    ids = db.execute(text("""
+        SELECT DISTINCT product_id FROM catalogo_cambios
+         WHERE store_id = :sid AND xid >= :desde
+    """), params).scalars().all()
+    filas = db.execute(text(f"""
+        SELECT {_COLUMNAS} FROM products
+         WHERE id = ANY(:ids) AND store_id = :sid AND deleted_at IS NULL
+    """), {**params, "ids": list(ids)}).fetchall() if ids else []
+    # Lo que ya no está vigente en la tienda (borrado, DELETE, otra tienda)
+    vigentes = {r.id for r in filas}
+    borrados: List[int] = [pid for pid in ids if pid not in vigentes]
+    return {
+        "products": [_producto(r) for r in filas],
+        "deleted_ids": borrados,
+        "is_full_sync": False,
+    }
+
+
+def purgar_cambios() -> dict:
+    """
+    Tarea diaria (app.core.jobs): anota la marca del día y borra los
+    cambios anteriores a la de hace CAMBIOS_DIAS. El corte se publica
+    (purgado) antes de borrar, así ningún sync incremental cae en el
+    hueco; el DELETE va tienda por tienda sobre la PK.
+    """
+    if not schema.asegurar("catalogo_sync"):
+        return {"omitido": "sin migración"}
+    db = SessionLocal()
+    try:
+        db.execute(text("""
+            INSERT INTO catalogo_marcas (dia, xid)
+            VALUES ((NOW() AT TIME ZONE 'America/Lima')::date,
+                    pg_snapshot_xmin(pg_current_snapshot())::text::bigint)
+            ON CONFLICT (dia) DO NOTHING
+        """))
+        db.execute(text("""
+            UPDATE catalogo_marcas SET purgado = TRUE
+             WHERE NOT purgado
+               AND dia <= (NOW() AT TIME ZONE 'America/Lima')::date - CAST(:dias AS INTEGER)
+        """), {"dias": CAMBIOS_DIAS})
+        db.commit()
+
+        corte = _purgado(db)
+        if not corte:
+            return {"borrados": 0}
+        borrados = 0
+        for store_id in db.execute(text("SELECT id FROM stores")).scalars().all():
+            borrados += db.execute(text("""
+                DELETE FROM catalogo_cambios WHERE store_id = :sid AND xid < :corte
+            """), {"sid": store_id, "corte": corte}).rowcount
+            db.commit()
+        # Sólo hace falta la última marca purgada
+        db.execute(text("""
+            DELETE FROM catalogo_marcas WHERE purgado AND xid < :corte
+        """), {"corte": corte})
+        db.commit()
+        return {"borrados": borrados}
+    finally:
+        db.close()
+
+
+jobs.registrar("catalogo_purgar_cambios", purgar_cambios, hora_lima=5)
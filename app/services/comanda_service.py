@@ -15,9 +15,10 @@ No hay estaciones de cocina, ni mesas, ni zonas de mozo, ni delivery.
 MIGRACIÓN
 ---------
 El proyecto no usa Alembic (la tabla `alembic_version` está vacía). El
-patrón vigente es auto-migración idempotente al primer uso, igual que
-`caja.py`, `store_config.py` y `billing_offline.py`. `_ensure_tables()`
-es seguro de llamar en cada request.
+DDL idempotente se registra en `app.core.schema`, igual que `caja.py`,
+`store_config.py` y `billing_offline.py`, y se aplica una vez al
+arrancar. `_ensure_tables()` sólo consulta un flag en memoria: es
+gratis llamarlo en cada request.
 
 CORRELATIVO THREAD-SAFE
 -----------------------
@@ -52,6 +53,7 @@ from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from app.core import schema
 from app.core.tiempo import dia_operativo_peru, hoy_peru
 
 logger = logging.getLogger(__name__)
@@ -176,17 +178,15 @@ ALTER TABLE store_config
 """
 
 
+schema.registrar(
+    "cocina",
+    MIGRATION_SQL, MIGRATION_COMANDAS_SQL, MIGRATION_SALE_PAGOS_SQL, MIGRATION_STORE_CONFIG_SQL,
+)
+
+
 def _ensure_tables(db: Session) -> None:
-    """Crea tablas e índices del módulo cocina si no existen (idempotente)."""
-    try:
-        db.execute(text(MIGRATION_SQL))
-        db.execute(text(MIGRATION_COMANDAS_SQL))
-        db.execute(text(MIGRATION_SALE_PAGOS_SQL))
-        db.execute(text(MIGRATION_STORE_CONFIG_SQL))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.warning(f"[Cocina] Migración: {e}")
+    """Tablas e índices del módulo cocina (aplicados al arrancar)."""
+    schema.asegurar("cocina")
 
 
 # ════════════════════════════════════════════════════════════════
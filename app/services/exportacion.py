@@ -0,0 +1,89 @@
+"""
+QueVendi — Exportaciones en streaming (CSV / XLSX)
+==================================================
+
+Los exports armaban todo en memoria: `.all()` de las filas, un
+`io.StringIO` con el CSV completo y `StreamingResponse(iter([texto]))`,
+que de streaming sólo tenía el nombre. Un año de ventas eran cientos de
+MB en el worker.
+
+CSV
+---
+`csv_stream(encabezado, filas)` es un generador: escribe las filas en un
+buffer chico y entrega bytes cada CHUNK_BYTES. Si `filas` sale de una
+consulta con `yield_per`, SQLAlchemy usa un cursor del lado del servidor
+y la memoria queda constante sin importar el rango.
+
+XLSX
+----
+`xlsx_stream(armar)` usa el modo write-only de openpyxl (las filas van
+directo a disco, no a un árbol de celdas) sobre un archivo temporal y
+lo entrega por partes. El modo write-only no permite celdas combinadas
+ni editar filas ya escritas: `armar` recibe el Workbook y sólo hace
+`append`.
+
+Los generadores son síncronos: Starlette los itera en el threadpool, así
+que la lectura del cursor no bloquea el event loop. La sesión de la
+dependencia (get_db / get_read_db) sigue abierta hasta terminar de
+enviar la respuesta.
+"""
+
+import csv
+import io
+import tempfile
+from typing import Callable, Iterable, Iterator, Sequence
+
+from fastapi.responses import StreamingResponse
+
+CHUNK_BYTES = 64 * 1024
+# Filas por tanda al leer de la base (Query.yield_per)
+FILAS_POR_TANDA = 2000
+
+MEDIA_CSV = "text/csv; charset=utf-8"
+MEDIA_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def csv_stream(encabezado: Sequence, filas: Iterable[Sequence],
+               delimiter: str = ",", bom: bool = True) -> Iterator[bytes]:
+    """CSV en UTF-8 (con BOM para Excel) por partes de ~CHUNK_BYTES."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=delimiter)
+    if bom:
+        buf.write("\ufeff")
+    writer.writerow(encabezado)
+    for fila in filas:
+        writer.writerow(fila)
+        if buf.tell() >= CHUNK_BYTES:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def xlsx_stream(armar: Callable) -> Iterator[bytes]:
+    """
+    Libro write-only: `armar(wb)` crea las hojas y hace `append` de las
+    filas; el .xlsx resultante se lee de un temporal por partes.
+    """
+    # openpyxl diferido: sólo lo usan los exports
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    armar(wb)
+    with tempfile.TemporaryFile() as f:
+        wb.save(f)
+        f.seek(0)
+        while True:
+            chunk = f.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+def descarga(contenido: Iterator[bytes], filename: str, media_type: str) -> StreamingResponse:
+    return StreamingResponse(
+        contenido,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,340 @@
+"""
+QueVendi — Snapshots de valorización del kardex
+===============================================
+
+Un corte de inventario (`/kardex/corte`) reconstruye stock y costo
+promedio ponderado recorriendo `inventory_movements`. Sin puntos de
+partida, un corte de hoy en una tienda con dos años de kardex recorre
+dos años de movimientos.
+
+Snapshots
+---------
+Al inicio de cada mes (medianoche de Lima) se guarda, por producto, el
+estado del recorrido con todos los movimientos ANTERIORES a ese instante:
+
+  kardex_snapshot_cortes  (store, corte_en)      → qué snapshots valen
+  kardex_snapshots        (store, corte_en, prod) → stock, saldo_valor,
+                                                    costo_prom, movimientos
+
+Un corte a la fecha F parte del último snapshot con corte_en <= F y
+recorre sólo los movimientos de [corte_en, F]: a lo sumo un mes.
+
+Cada snapshot se arma desde el anterior (no desde cero), así que la
+tarea diaria `kardex_snapshots` sólo recorre el último mes por tienda.
+
+Movimientos con fecha pasada
+----------------------------
+Un movimiento con occurred_at anterior a un snapshot lo deja viejo. Un
+trigger por sentencia en inventory_movements (INSERT, UPDATE, DELETE)
+borra los snapshots con corte_en posterior al movimiento más antiguo
+tocado, y la tarea diaria los vuelve a armar. Además, la tarea descarta
+los snapshots en los que aparezca un movimiento con id mayor al último
+que vieron y fecha anterior al corte (lo que una carrera con el trigger
+pudiera haber dejado pasar).
+
+El costo de partida de un producto sin entradas valorizadas es su
+cost_price al momento de armar el snapshot (el recorrido completo usa
+el actual).
+"""
+
+import logging
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core import jobs, schema
+from app.core.database import SessionLocal
+from app.core.tiempo import dia_operativo_peru, hoy_peru
+from app.models.inventory import InventoryMovement
+from app.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+# Snapshots mensuales que se mantienen por tienda (hacia atrás desde hoy)
+MESES_SNAPSHOT = 24
+
+MIGRATION_SQL = """
+CREATE TABLE IF NOT EXISTS kardex_snapshot_cortes (
+    store_id        INTEGER NOT NULL,
+    corte_en        TIMESTAMP WITH TIME ZONE NOT NULL,
+    ultimo_mov_id   BIGINT NOT NULL DEFAULT 0,
+    creado_en       TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (store_id, corte_en)
+);
+CREATE TABLE IF NOT EXISTS kardex_snapshots (
+    store_id        INTEGER NOT NULL,
+    corte_en        TIMESTAMP WITH TIME ZONE NOT NULL,
+    product_id      INTEGER NOT NULL,
+    stock           NUMERIC(14, 3) NOT NULL,
+    saldo_valor     NUMERIC(16, 6) NOT NULL,
+    costo_prom      NUMERIC(16, 6) NOT NULL,
+    num_movimientos INTEGER NOT NULL,
+    PRIMARY KEY (store_id, corte_en, product_id),
+    FOREIGN KEY (store_id, corte_en)
+        REFERENCES kardex_snapshot_cortes (store_id, corte_en) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE FUNCTION qv_kardex_invalidar_snapshots() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM kardex_snapshot_cortes c
+     USING (SELECT store_id, MIN(occurred_at) AS desde FROM movs GROUP BY store_id) m
+     WHERE c.store_id = m.store_id AND c.corte_en > m.desde;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_kardex_snap_ins ON inventory_movements;
+CREATE TRIGGER trg_kardex_snap_ins AFTER INSERT ON inventory_movements
+    REFERENCING NEW TABLE AS movs
+    FOR EACH STATEMENT EXECUTE PROCEDURE qv_kardex_invalidar_snapshots();
+DROP TRIGGER IF EXISTS trg_kardex_snap_del ON inventory_movements;
+CREATE TRIGGER trg_kardex_snap_del AFTER DELETE ON inventory_movements
+    REFERENCING OLD TABLE AS movs
+    FOR EACH STATEMENT EXECUTE PROCEDURE qv_kardex_invalidar_snapshots();
+DROP TRIGGER IF EXISTS trg_kardex_snap_upd_old ON inventory_movements;
+CREATE TRIGGER trg_kardex_snap_upd_old AFTER UPDATE ON inventory_movements
+    REFERENCING OLD TABLE AS movs
+    FOR EACH STATEMENT EXECUTE PROCEDURE qv_kardex_invalidar_snapshots();
+DROP TRIGGER IF EXISTS trg_kardex_snap_upd_new ON inventory_movements;
+CREATE TRIGGER trg_kardex_snap_upd_new AFTER UPDATE ON inventory_movements
+    REFERENCING NEW TABLE AS movs
+    FOR EACH STATEMENT EXECUTE PROCEDURE qv_kardex_invalidar_snapshots();
+"""
+
+schema.registrar("kardex_snapshots", MIGRATION_SQL)
+
+
+def _f(x) -> float:
+    return float(x) if x is not None else 0.0
+
+
+class SaldoPromedio:
+    """Saldo de un producto recorriendo sus movimientos (promedio ponderado)."""
+
+    __slots__ = ("stock", "saldo_valor", "costo_prom", "num_movimientos")
+
+    def __init__(self, costo_inicial: float, stock: float = 0.0,
+                 saldo_valor: float = 0.0, num_movimientos: int = 0):
+        self.stock = stock
+        self.saldo_valor = saldo_valor
+        self.costo_prom = costo_inicial
+        self.num_movimientos = num_movimientos
+
+    def aplicar(self, quantity, cost_price, stock_after) -> None:
+        self.num_movimientos += 1
+        qty = _f(quantity)
+        if qty > 0:
+            entrada_unit = _f(cost_price) if cost_price is not None else self.costo_prom
+            self.saldo_valor += qty * entrada_unit
+            self.stock = _f(stock_after)
+            if self.stock > 0:
+                self.costo_prom = self.saldo_valor / self.stock
+        else:
+            self.stock = _f(stock_after)
+            self.saldo_valor = self.stock * self.costo_prom
+
+
+def recorrer(movs: Iterable, saldos: Dict[int, SaldoPromedio],
+             costo_inicial: Dict[int, float]) -> int:
+    """
+    Aplica `movs` (product_id, quantity, cost_price, stock_after, id),
+    ordenados por producto y fecha, sobre `saldos`. Devuelve el mayor id.
+    """
+    ultimo_id = 0
+    for product_id, quantity, cost_price, stock_after, mov_id in movs:
+        saldo = saldos.get(product_id)
+        if saldo is None:
+            saldo = saldos[product_id] = SaldoPromedio(costo_inicial.get(product_id, 0.0))
+        saldo.aplicar(quantity, cost_price, stock_after)
+        if mov_id > ultimo_id:
+            ultimo_id = mov_id
+    return ultimo_id
+
+
+def consulta_movimientos(db: Session, store_id: int, desde: Optional[datetime],
+                         hasta: datetime, hasta_inclusive: bool, filtros: list):
+    """Movimientos de [desde, hasta] (o [desde, hasta)) por producto y fecha, leídos por tandas."""
+    condiciones = [InventoryMovement.store_id == store_id, *filtros]
+    if desde is not None:
+        condiciones.append(InventoryMovement.occurred_at >= desde)
+    condiciones.append(
+        InventoryMovement.occurred_at <= hasta if hasta_inclusive
+        else InventoryMovement.occurred_at < hasta
+    )
+    return (
+        db.query(
+            InventoryMovement.product_id,
+            InventoryMovement.quantity,
+            InventoryMovement.cost_price,
+            InventoryMovement.stock_after,
+            InventoryMovement.id,
+        )
+        .join(Product, Product.id == InventoryMovement.product_id)
+        .filter(*condiciones)
+        .order_by(
+            InventoryMovement.product_id,
+            InventoryMovement.occurred_at.asc(),
+            InventoryMovement.id.asc(),
+        )
+        .yield_per(5000)
+    )
+
+
+# ════════════════════════════════════════════════════════════════
+# LECTURA (cortes)
+# ════════════════════════════════════════════════════════════════
+
+def _ultimo_corte(db: Session, store_id: int, hasta: datetime) -> Optional[datetime]:
+    return db.execute(text("""
+        SELECT MAX(corte_en) FROM kardex_snapshot_cortes
+         WHERE store_id = :sid AND corte_en <= :hasta
+    """), {"sid": store_id, "hasta": hasta}).scalar()
+
+
+def saldos_base(db: Session, store_id: int, hasta: datetime,
+                product_ids: set) -> Tuple[Optional[datetime], Dict[int, SaldoPromedio]]:
+    """
+    Punto de partida para un corte a `hasta`: (corte_en, saldos) del
+    último snapshot válido, sólo de `product_ids`. (None, {}) si no hay
+    snapshot: recorrer desde el principio.
+    """
+    if not schema.lista("kardex_snapshots"):
+        return None, {}
+    corte_en = _ultimo_corte(db, store_id, hasta)
+    if corte_en is None:
+        return None, {}
+    filas = db.execute(text("""
+        SELECT product_id, stock, saldo_valor, costo_prom, num_movimientos
+          FROM kardex_snapshots
+         WHERE store_id = :sid AND corte_en = :corte
+    """), {"sid": store_id, "corte": corte_en}).fetchall()
+    saldos = {
+        f.product_id: SaldoPromedio(_f(f.costo_prom), _f(f.stock), _f(f.saldo_valor), f.num_movimientos)
+        for f in filas if f.product_id in product_ids
+    }
+    return corte_en, saldos
+
+
+# ════════════════════════════════════════════════════════════════
+# ESCRITURA (tarea diaria)
+# ════════════════════════════════════════════════════════════════
+
+def _inicios_de_mes(cantidad: int) -> List[datetime]:
+    """Medianoche de Lima del día 1 de los últimos `cantidad` meses (UTC), ascendente."""
+    hoy = hoy_peru()
+    anio, mes = hoy.year, hoy.month
+    inicios = []
+    for _ in range(cantidad):
+        inicios.append(dia_operativo_peru(date(anio, mes, 1))[0])
+        mes, anio = (12, anio - 1) if mes == 1 else (mes - 1, anio)
+    return sorted(inicios)
+
+
+def construir(db: Session, store_id: int, corte_en: datetime) -> int:
+    """
+    Arma (o rearma) el snapshot de `store_id` a `corte_en` partiendo del
+    snapshot válido anterior. Devuelve cuántos productos quedaron.
+    """
+    anterior = db.execute(text("""
+        SELECT corte_en, ultimo_mov_id FROM kardex_snapshot_cortes
+         WHERE store_id = :sid AND corte_en < :corte
+         ORDER BY corte_en DESC LIMIT 1
+    """), {"sid": store_id, "corte": corte_en}).fetchone()
+
+    costos = {
+        pid: _f(costo)
+        for pid, costo in db.query(Product.id, Product.cost_price).filter(Product.store_id == store_id)
+    }
+    saldos: Dict[int, SaldoPromedio] = {}
+    desde = None
+    ultimo_id = 0
+    if anterior:
+        desde, ultimo_id = anterior.corte_en, anterior.ultimo_mov_id
+        _, saldos = saldos_base(db, store_id, desde, set(costos))
+    ultimo_id = max(ultimo_id, recorrer(
+        consulta_movimientos(db, store_id, desde, corte_en, False, []), saldos, costos,
+    ))
+
+    db.execute(text("""
+        DELETE FROM kardex_snapshot_cortes WHERE store_id = :sid AND corte_en = :corte
+    """), {"sid": store_id, "corte": corte_en})
+    db.execute(text("""
+        INSERT INTO kardex_snapshot_cortes (store_id, corte_en, ultimo_mov_id)
+        VALUES (:sid, :corte, :ult)
+    """), {"sid": store_id, "corte": corte_en, "ult": ultimo_id})
+    if saldos:
+        db.execute(text("""
+            INSERT INTO kardex_snapshots
+                (store_id, corte_en, product_id, stock, saldo_valor, costo_prom, num_movimientos)
+            VALUES (:sid, :corte, :pid, :stock, :valor, :costo, :n)
+        """), [
+            {"sid": store_id, "corte": corte_en, "pid": pid, "stock": s.stock,
+             "valor": s.saldo_valor, "costo": s.costo_prom, "n": s.num_movimientos}
+            for pid, s in saldos.items()
+        ])
+    db.commit()
+    return len(saldos)
+
+
+def _descartar_viejos(db: Session) -> int:
+    """Snapshots con un movimiento posterior a su armado y fecha anterior al corte."""
+    n = db.execute(text("""
+        DELETE FROM kardex_snapshot_cortes c
+         WHERE EXISTS (
+            SELECT 1 FROM inventory_movements m
+             WHERE m.store_id = c.store_id
+               AND m.id > c.ultimo_mov_id
+               AND m.occurred_at < c.corte_en
+         )
+    """)).rowcount
+    db.commit()
+    return n
+
+
+def mantener() -> dict:
+    """
+    Tarea diaria (app.core.jobs): para cada tienda con kardex, arma los
+    snapshots mensuales que falten (nuevos o invalidados) de los últimos
+    MESES_SNAPSHOT meses, en orden, cada uno desde el anterior.
+    """
+    db = SessionLocal()
+    construidos = 0
+    try:
+        schema.asegurar("kardex_snapshots")
+        descartados = _descartar_viejos(db)
+        objetivos = _inicios_de_mes(MESES_SNAPSHOT)
+
+        existentes: Dict[int, set] = {}
+        for sid, corte in db.execute(text("""
+            SELECT store_id, corte_en FROM kardex_snapshot_cortes WHERE corte_en >= :desde
+        """), {"desde": objetivos[0]}):
+            existentes.setdefault(sid, set()).add(corte)
+
+        stores = db.execute(text("""
+            SELECT s.id, (SELECT MIN(occurred_at) FROM inventory_movements m
+                           WHERE m.store_id = s.id) AS primer_mov
+              FROM stores s
+             WHERE s.is_active = TRUE
+        """)).fetchall()
+        for store_id, primer_mov in stores:
+            if primer_mov is None:
+                continue
+            hechos = existentes.get(store_id, set())
+            for corte in objetivos:
+                if corte <= primer_mov or corte in hechos:
+                    continue
+                try:
+                    construir(db, store_id, corte)
+                    construidos += 1
+                except Exception as e:
+                    db.rollback()
+                    logger.warning(f"[KardexSnapshots] Store {store_id} a {corte.isoformat()}: {e}")
+                    break
+    finally:
+        db.close()
+    return {"construidos": construidos, "descartados": descartados}
+
+
+jobs.registrar("kardex_snapshots", mantener, hora_lima=3)
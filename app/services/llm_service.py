@@ -1,15 +1,52 @@
+"""
+LLM Service - Parseo de comandos de voz con Claude, OpenAI y Gemini
+
+Todas las llamadas son async de verdad (AsyncAnthropic, AsyncOpenAI,
+generate_content_async): antes los métodos eran `async` pero llamaban a
+los clientes síncronos y congelaban el event loop (WebSockets incluidos)
+durante los 1-3 s de cada parseo.
+
+Gateway (LLMService.parse):
+- Timeout por proveedor (LLM_TIMEOUT_*_MS)
+- Hedging: si el proveedor pedido no respondió en LLM_HEDGE_MS se lanza
+  el siguiente de LLM_FALLBACK y gana el primero que responda
+- Fallback: si el proveedor falla, se pasa al siguiente sin esperar
+- Métricas por proveedor en memoria (LLMService.stats) y, por comando,
+  en VoiceCommandLog (proveedor, latencia, costo, errores)
+
+Los SDK (anthropic, openai, google.generativeai) se importan recién al
+crear cada cliente: juntos suman segundos de arranque y la mayoría de
+los comandos se resuelven con la gramática local o la caché. El
+lifespan los precalienta en un thread (ver app.core.arranque).
+"""
+import asyncio
+import json
+import logging
 import os
 import time
-import json
-from typing import List, Dict, Literal
-import anthropic
-import openai
-import google.generativeai as genai
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Deque, Dict, List, Literal, Optional
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Provider = Literal["claude", "openai", "gemini"]
 
 # Configurar APIs
-anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-openai.api_key = os.getenv("OPENAI_API_KEY")
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+if TYPE_CHECKING:
+    import anthropic
+    import openai
+
+# Conexiones keep-alive por proveedor: el handshake TLS no se paga en
+# cada comando de voz.
+HTTP_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60)
 
 SYSTEM_PROMPT = """Eres un asistente para una bodega en Perú. 
 Tu trabajo es extraer productos de un comando de voz.
@@ -37,6 +74,120 @@ Si cantidad es por monto, pon null en cantidad y el monto en soles.
 Si es por cantidad, pon cantidad y null en monto."""
 
 
+class LLMUnavailableError(RuntimeError):
+    """Ningún proveedor respondió (timeouts o errores en todos)"""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("; ".join(errors) or "Sin proveedores LLM configurados")
+
+
+@dataclass
+class LLMResult:
+    """Respuesta del gateway"""
+    products: List[Dict]
+    provider: str                   # quién respondió
+    latency_ms: int                 # desde que se pidió al gateway
+    cost_usd: float
+    hedged: bool = False            # se lanzó un segundo proveedor
+    errors: List[str] = field(default_factory=list)   # proveedores que fallaron antes
+
+
+# ============================================
+# CLIENTES (lazy, uno por proceso)
+# ============================================
+
+_anthropic_client: Optional["anthropic.AsyncAnthropic"] = None
+_openai_client: Optional["openai.AsyncOpenAI"] = None
+_genai = None
+
+
+def _timeout_s(provider: str) -> float:
+    ms = {
+        "claude": settings.LLM_TIMEOUT_CLAUDE_MS,
+        "openai": settings.LLM_TIMEOUT_OPENAI_MS,
+        "gemini": settings.LLM_TIMEOUT_GEMINI_MS,
+    }[provider]
+    return ms / 1000
+
+
+def _get_anthropic() -> "anthropic.AsyncAnthropic":
+    global _anthropic_client
+    if _anthropic_client is None:
+        import anthropic
+        _anthropic_client = anthropic.AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY,
+            timeout=_timeout_s("claude"),
+            max_retries=0,  # los reintentos los decide el gateway
+            http_client=httpx.AsyncClient(limits=HTTP_LIMITS),
+        )
+    return _anthropic_client
+
+
+def _get_openai() -> "openai.AsyncOpenAI":
+    global _openai_client
+    if _openai_client is None:
+        import openai
+        _openai_client = openai.AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=_timeout_s("openai"),
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=HTTP_LIMITS),
+        )
+    return _openai_client
+
+
+def _get_genai():
+    """Módulo google.generativeai ya configurado."""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GOOGLE_API_KEY)
+        _genai = genai
+    return _genai
+
+
+def _extract_json(response_text: str) -> Dict:
+    """JSON de la respuesta, limpiando markdown si existe"""
+    response_text = response_text.strip()
+    if response_text.startswith("```"):
+        response_text = response_text.split("```")[1]
+        if response_text.startswith("json"):
+            response_text = response_text[4:]
+    return json.loads(response_text)
+
+
+# ============================================
+# MÉTRICAS EN MEMORIA
+# ============================================
+
+class _ProviderStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cost_usd = 0.0
+        self.latencies: Deque[int] = deque(maxlen=500)
+
+    def snapshot(self) -> Dict:
+        lat = sorted(self.latencies)
+
+        def pct(p: float) -> Optional[int]:
+            return lat[min(len(lat) - 1, int(len(lat) * p))] if lat else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "cost_usd": round(self.cost_usd, 6),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+        }
+
+
+_stats: Dict[str, _ProviderStats] = {p: _ProviderStats() for p in ("claude", "openai", "gemini")}
+
+
 class LLMService:
     
     @staticmethod
@@ -45,7 +196,7 @@ class LLMService:
         start = time.time()
         
         try:
-            message = anthropic_client.messages.create(
+            message = await _get_anthropic().messages.create(
                 model="claude-3-5-sonnet-20241022",
                 max_tokens=1024,
                 system=SYSTEM_PROMPT,
@@ -57,16 +208,7 @@ class LLMService:
             
             latency = int((time.time() - start) * 1000)
             
-            # Extraer JSON del response
-            response_text = message.content[0].text.strip()
-            
-            # Limpiar markdown si existe
-            if response_text.startswith("```"):
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:]
-            
-            data = json.loads(response_text)
+            data = _extract_json(message.content[0].text)
             products = data.get("productos", [])
             
             # Calcular costo aproximado
@@ -77,7 +219,7 @@ class LLMService:
             return products, latency, cost
             
         except Exception as e:
-            print(f"[Claude] Error: {str(e)}")
+            logger.warning(f"[Claude] Error: {e!r}")
             raise
     
     
@@ -87,7 +229,7 @@ class LLMService:
         start = time.time()
         
         try:
-            response = openai.chat.completions.create(
+            response = await _get_openai().chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": SYSTEM_PROMPT},
@@ -102,19 +244,16 @@ class LLMService:
             content = response.choices[0].message.content
             data = json.loads(content)
             
-            # 🔥 ARREGLADO: Buscar en español e inglés
-            products = (
-                data.get("productos") or 
-                data.get("products") or 
-                data.get("items") or 
-                []
-            )
-            
-            # Si data es un array directo (no debería pasar con json_object)
+            # Buscar en español e inglés
             if isinstance(data, list):
                 products = data
-            
-            print(f"[OpenAI] Parsed {len(products)} productos")
+            else:
+                products = (
+                    data.get("productos") or 
+                    data.get("products") or 
+                    data.get("items") or 
+                    []
+                )
             
             # Calcular costo
             input_tokens = response.usage.prompt_tokens
@@ -124,7 +263,7 @@ class LLMService:
             return products, latency, cost
             
         except Exception as e:
-            print(f"[OpenAI] Error: {str(e)}")
+            logger.warning(f"[OpenAI] Error: {e!r}")
             raise
     
     
@@ -134,7 +273,7 @@ class LLMService:
         start = time.time()
         
         try:
-            model = genai.GenerativeModel("gemini-1.5-flash")
+            model = _get_genai().GenerativeModel("gemini-1.5-flash")
             
             prompt = f"""{SYSTEM_PROMPT}
 
@@ -142,20 +281,11 @@ Comando: {transcript}
 
 Retorna SOLO el JSON, sin markdown ni explicaciones."""
             
-            response = model.generate_content(prompt)
+            response = await model.generate_content_async(prompt)
             
             latency = int((time.time() - start) * 1000)
             
-            # Extraer JSON
-            response_text = response.text.strip()
-            
-            # Limpiar markdown
-            if response_text.startswith("```"):
-                response_text = response_text.split("```")[1]
-                if response_text.startswith("json"):
-                    response_text = response_text[4:]
-            
-            data = json.loads(response_text)
+            data = _extract_json(response.text)
             products = data.get("productos", [])
             
             # Gemini es gratis (por ahora)
@@ -164,5 +294,126 @@ Retorna SOLO el JSON, sin markdown ni explicaciones."""
             return products, latency, cost
             
         except Exception as e:
-            print(f"[Gemini] Error: {str(e)}")
-            raise
\ No newline at end of file
+            logger.warning(f"[Gemini] Error: {e!r}")
+            raise
+    
+    
+    # ============================================
+    # GATEWAY
+    # ============================================
+    
+    @staticmethod
+    def is_configured(provider: str) -> bool:
+        return bool({
+            "claude": ANTHROPIC_API_KEY,
+            "openai": OPENAI_API_KEY,
+            "gemini": GOOGLE_API_KEY,
+        }.get(provider))
+    
+    @staticmethod
+    async def _call(provider: str, transcript: str) -> tuple[List[Dict], int, float]:
+        """Un proveedor con su timeout, registrando métricas"""
+        fn = {
+            "claude": LLMService.parse_with_claude,
+            "openai": LLMService.parse_with_openai,
+            "gemini": LLMService.parse_with_gemini,
+        }[provider]
+        stats = _stats[provider]
+        stats.calls += 1
+        try:
+            products, latency, cost = await asyncio.wait_for(fn(transcript), _timeout_s(provider))
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            # Perdió el hedge: no es error del proveedor
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        stats.latencies.append(latency)
+        stats.cost_usd += cost
+        return products, latency, cost
+    
+    @staticmethod
+    async def parse(transcript: str, provider: Provider = "openai") -> LLMResult:
+        """
+        Parsear con `provider`, con hedging y fallback a los demás
+        proveedores configurados en LLM_FALLBACK.
+        
+        Raises:
+            LLMUnavailableError: ningún proveedor respondió.
+        """
+        order = [provider] + [
+            p.strip() for p in settings.LLM_FALLBACK.split(",")
+            if p.strip() in _stats and p.strip() != provider and LLMService.is_configured(p.strip())
+        ]
+        hedge_s = settings.LLM_HEDGE_MS / 1000 if settings.LLM_HEDGE_MS > 0 else None
+        start = time.monotonic()
+        
+        pending: Dict[asyncio.Task, str] = {}
+        errors: List[str] = []
+        next_idx = 0
+        hedged = False
+        
+        def launch() -> None:
+            nonlocal next_idx
+            p = order[next_idx]
+            next_idx += 1
+            pending[asyncio.create_task(LLMService._call(p, transcript))] = p
+        
+        launch()
+        try:
+            while pending:
+                # Hedge sólo con un proveedor en vuelo y otro disponible
+                can_hedge = hedge_s is not None and len(pending) == 1 and next_idx < len(order)
+                done, _ = await asyncio.wait(
+                    pending, timeout=hedge_s if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    logger.info(f"[LLM] {order[next_idx - 1]} sin respuesta en {settings.LLM_HEDGE_MS} ms, hedge a {order[next_idx]}")
+                    hedged = True
+                    launch()
+                    continue
+                
+                for task in done:
+                    p = pending.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        products, _, cost = task.result()
+                        return LLMResult(
+                            products=products,
+                            provider=p,
+                            latency_ms=int((time.monotonic() - start) * 1000),
+                            cost_usd=cost,
+                            hedged=hedged,
+                            errors=errors,
+                        )
+                    reason = "timeout" if isinstance(exc, asyncio.TimeoutError) else repr(exc)
+                    errors.append(f"{p}: {reason}")
+                
+                # Fallback inmediato si no queda nadie en vuelo
+                if not pending and next_idx < len(order):
+                    launch()
+        finally:
+            # El que perdió el hedge se cancela (su costo no se registra)
+            for task in pending:
+                task.cancel()
+        
+        raise LLMUnavailableError(errors)
+    
+    @staticmethod
+    def stats() -> Dict[str, Dict]:
+        """Métricas por proveedor desde que arrancó el proceso"""
+        return {p: s.snapshot() for p, s in _stats.items()}
+    
+    @staticmethod
+    async def aclose() -> None:
+        """Cerrar los pools HTTP (shutdown de la app)"""
+        global _anthropic_client, _openai_client
+        for client in (_anthropic_client, _openai_client):
+            if client is not None:
+                await client.close()
+        _anthropic_client = None
+        _openai_client = None
\ No newline at end of file
@@ -1,11 +1,14 @@
 # app/services/openai_service.py - CREAR ESTE ARCHIVO
 
+import logging
 import os
 from openai import OpenAI
 from typing import Dict, Optional
 import json
 from fastapi  import HTTPException
 
+logger = logging.getLogger(__name__)
+
 class OpenAIService:
     
     client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -87,12 +90,12 @@ Interpreta este comando y responde en JSON:"""
             
             parsed = json.loads(result_text)
             
-            print(f"[OpenAI] ✅ Comando parseado: {text} → {parsed['type']}")
+            logger.info("[OpenAI] Comando parseado: %s → %s", text, parsed['type'])
             
             return parsed
             
         except Exception as e:
-            print(f"[OpenAI] ❌ Error: {e}")
+            logger.warning("[OpenAI] Error: %s", e)
             return None
 
 
@@ -113,7 +116,7 @@ async def parse_voice_command(
     
     # 2. Si falla, intentar con OpenAI (si está habilitado)
     if not parsed and os.getenv("OPENAI_API_KEY"):
-        print("[VoiceParser] Parser local falló, intentando con OpenAI...")
+        logger.warning("[VoiceParser] Parser local falló, intentando con OpenAI...")
         
         # Obtener contexto del carrito (si existe en sesión)
         cart_context = []  # Aquí deberías obtener el carrito del usuario
@@ -124,7 +127,7 @@ async def parse_voice_command(
         )
         
         if parsed:
-            print("[VoiceParser] ✅ OpenAI entendió el comando")
+            logger.info("[VoiceParser] OpenAI entendió el comando")
     
     if not parsed:
         raise HTTPException(400, detail="No se pudo entender el comando")
@@ -1,7 +1,10 @@
+import logging
 from sqlalchemy.orm import Session
 from app.models.product import Product
 from typing import List
-from difflib import SequenceMatcher
+from app.services import search_index
+
+logger = logging.getLogger(__name__)
 
 class ProductService:
     def __init__(self, db: Session):
@@ -19,7 +22,7 @@ class ProductService:
             
             return query.order_by(Product.name).all()
         except Exception as e:
-            print(f"[ProductService] Error al obtener productos: {e}")
+            logger.warning("[ProductService] Error al obtener productos: %s", e)
             # Si hay error de columna, reintentar sin columnas opcionales
             return self.db.query(
                 Product.id,
@@ -33,67 +36,15 @@ class ProductService:
     
     def search_products(self, store_id: int, query: str) -> List[Product]:
         """
-        Búsqueda inteligente optimizada para prefijos y plurales
-        """
-        import unicodedata
-        
-        def normalize(text):
-            if not text: return ""
-            return unicodedata.normalize('NFD', text.lower()).encode('ascii', 'ignore').decode('utf-8')
+        Búsqueda inteligente optimizada para prefijos y plurales.
 
-        query = normalize(query.strip())
+        Los niveles de score (exacto, palabra, prefijo, contiene, fuzzy)
+        viven en el índice en memoria de la tienda (ver search_index); aquí
+        sólo se traen las 10 mejores filas por PK.
+        """
+        query = query.strip()
         if not query: return []
-        
-        # Generar variantes (singular/plural)
-        queries = {query}
-        if query.endswith('s'): queries.add(query.rstrip('s'))
-        else: queries.add(query + 's')
-        
-        # Obtener productos
-        all_products = self.db.query(Product).filter(
-            Product.store_id == store_id,
-            Product.is_active == True
-        ).all()
-        
-        scored_products = []
-        
-        for product in all_products:
-            p_name = normalize(product.name)
-            p_words = p_name.split()
-            
-            max_score = 0
-            
-            # Chequear variantes
-            for q in queries:
-                # 1. Match Exacto o Inicio de nombre
-                if p_name == q:
-                    max_score = 100
-                elif p_name.startswith(q):
-                    max_score = 90
-                
-                # 2. Match de palabras (El producto contiene la palabra que empieza con q)
-                # Ejemplo: q="galleta", p="soda galletas" -> "galletas" empieza con "galleta" -> 85 pts
-                for word in p_words:
-                    if word == q:
-                        max_score = max(max_score, 95)
-                    elif word.startswith(q) and len(q) >= 3:
-                        max_score = max(max_score, 85)
-                
-                # 3. Contenido general
-                if q in p_name:
-                    max_score = max(max_score, 60)
-                
-                # 4. Fuzzy (si no hubo match fuerte)
-                if max_score < 60:
-                    ratio = SequenceMatcher(None, q, p_name).ratio()
-                    if ratio > 0.6:
-                        max_score = max(max_score, ratio * 60)
-
-            if max_score >= 50:
-                scored_products.append((product, max_score))
-        
-        scored_products.sort(key=lambda x: x[1], reverse=True)
-        return [p[0] for p in scored_products[:10]]
+        return search_index.buscar_productos(self.db, store_id, query, limit=10)
     
     def get_product_by_id(self, product_id: int) -> Product:
         """Obtener un producto por ID"""
@@ -108,6 +59,7 @@ class ProductService:
         self.db.add(product)
         self.db.commit()
         self.db.refresh(product)
+        search_index.actualizar_producto(product)
         return product
     
     def update_product(self, product_id: int, product_data: dict) -> Product:
@@ -122,6 +74,7 @@ class ProductService:
         
         self.db.commit()
         self.db.refresh(product)
+        search_index.actualizar_producto(product)
         return product
     
     def delete_product(self, product_id: int) -> bool:
@@ -132,4 +85,5 @@ class ProductService:
         
         product.is_active = False
         self.db.commit()
+        search_index.quitar_producto(product.store_id, product.id)
         return True
\ No newline at end of file
@@ -20,6 +20,8 @@ from typing import Optional
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
+from app.services import agregados_ventas
+
 logger = logging.getLogger(__name__)
 
 METODOS = ("yape", "plin", "efectivo", "tarjeta", "transferencia", "otro")
@@ -143,6 +145,10 @@ def _sincronizar_payment_method(db: Session, sale_id: int) -> None:
 
     Un solo método → ese método. Varios → 'yape+efectivo'. Así los
     reportes viejos que leen esa columna siguen diciendo algo cierto.
+
+    Los agregados (ventas_por_hora) guardan el total bajo ese método: si
+    cambia, la venta se resta con el viejo y se suma con el nuevo en la
+    misma transacción. Una venta anulada ya se restó al anularla.
     """
     metodos = [r[0] for r in db.execute(text("""
         SELECT DISTINCT metodo FROM sale_pagos WHERE sale_id = :sid ORDER BY metodo
@@ -160,8 +166,20 @@ def _sincronizar_payment_method(db: Session, sale_id: int) -> None:
         # Mejor decir 'multiple' y que el detalle se consulte en sale_pagos.
         resumen_txt = unidos if len(unidos) <= 20 else "multiple"
 
+    resumen_txt = resumen_txt[:20]
+    venta = db.execute(text("""
+        SELECT payment_method, status FROM sales WHERE id = :sid
+    """), {"sid": sale_id}).fetchone()
+    if venta is None or venta.payment_method == resumen_txt:
+        return
+    contar = venta.status != "cancelled"
+
+    if contar:
+        agregados_ventas.aplicar_venta(db, sale_id, -1)
     db.execute(text("UPDATE sales SET payment_method = :pm WHERE id = :sid"),
-               {"pm": resumen_txt[:20], "sid": sale_id})
+               {"pm": resumen_txt, "sid": sale_id})
+    if contar:
+        agregados_ventas.aplicar_venta(db, sale_id, +1)
 
 
 def resumen_por_metodo(db: Session, store_id: int, desde, hasta) -> list:
@@ -1,14 +1,19 @@
+import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Dict
+from typing import List, Dict, Optional
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from app.models.sale import Sale, SaleItem
-from app.models.product import Product
 from app.models.user import User
 from app.models.inventory import InventoryMovement
 from app.models.billing import Comprobante
+from app.services import agregados_ventas, stock_service
+from app.services.stock_service import StockInsuficienteError
 import pytz
 
+logger = logging.getLogger(__name__)
+
 # Timezone de Perú
 PERU_TZ = pytz.timezone('America/Lima')
 
@@ -17,8 +22,39 @@ class SaleService:
     
     def __init__(self, db: Session):
         self.db = db
+
+    def _user_name(self, user_id: int) -> str:
+        """Nombre del cajero para el kardex (una consulta por venta)."""
+        row = self.db.query(User.full_name).filter(User.id == user_id).first()
+        return row.full_name if row and row.full_name else 'Sistema'
+
+    def _documento_venta(self, sale: Sale) -> tuple:
+        """
+        Tipo y número del documento que sustenta la venta en el kardex.
+
+        Returns:
+            (doc_tipo, doc_numero): ('BOLETA', 'B001-00000042'),
+            ('FACTURA', ...) o ('TICKET', 'VTA-<n>') si no hay comprobante.
+        """
+        comprobante = (
+            self.db.query(Comprobante)
+            .filter(Comprobante.sale_id == sale.id)
+            .first()
+        )
+        if comprobante and comprobante.tipo == '03':
+            doc_tipo = 'BOLETA'
+        elif comprobante and comprobante.tipo == '01':
+            doc_tipo = 'FACTURA'
+        else:
+            doc_tipo = 'TICKET'
+        if comprobante:
+            doc_numero = f"{comprobante.serie}-{str(comprobante.numero).zfill(8)}"
+        else:
+            doc_numero = f"VTA-{sale.sale_number or sale.id}"
+        return doc_tipo, doc_numero
     
-    def create_sale(self, sale_data, user_id: int, store_id: int) -> Sale:
+    def create_sale(self, sale_data, user_id: int, store_id: int,
+                    permitir_negativo: Optional[bool] = None) -> Sale:
         """
         Crear una nueva venta con hora de Perú
         
@@ -26,11 +62,14 @@ class SaleService:
             sale_data: Objeto SaleCreate (Pydantic) o diccionario con items y payment_method
             user_id: ID del usuario
             store_id: ID de la tienda
+            permitir_negativo: política de stock negativo; None usa la global
+                (ver stock_service). Las ventas offline pasan True.
         
         Returns:
             Objeto Sale creado
         
         Raises:
+            StockInsuficienteError: Si la política no permite vender sin stock
             ValueError: Si hay algún error en los datos
         """
         try:
@@ -66,75 +105,93 @@ class SaleService:
             
             self.db.add(sale)
             self.db.flush()  # Para obtener el ID de la venta
-            
-            # Crear los items de la venta
+
+            # Todo lo que no depende de la línea se resuelve UNA vez por
+            # venta: antes cada ítem repetía el SELECT de producto, usuario
+            # y comprobante (~90 round trips en un ticket de 30 líneas).
+            user_name = self._user_name(user_id)
+            doc_tipo, doc_numero = self._documento_venta(sale)
+            glosa = f"Venta a {sale.customer_name or 'Cliente varios'}"
+
+            # Stock: una sola sentencia UPDATE ... RETURNING para toda la
+            # venta (ver stock_service). Si el mismo producto aparece en
+            # varias líneas se descuenta la suma.
+            deltas = {}
             for item in items:
-                sale_item = SaleItem(
-                    sale_id=sale.id,
-                    product_id=item['product_id'],
-                    quantity=item['quantity'],
-                    unit_price=item['unit_price'],
-                    subtotal=item['subtotal']
-                )
-                self.db.add(sale_item)
-                
-                # Actualizar el stock del producto
-                product = self.db.query(Product).filter(Product.id == item['product_id']).first()
-                if product:
-                    qty = Decimal(str(item['quantity']))
-                    cost = Decimal(str(product.cost_price or 0))
-                    stock_before = Decimal(str(product.stock or 0))
-                    product.stock = stock_before - qty
+                pid = item['product_id']
+                deltas[pid] = deltas.get(pid, Decimal('0')) - Decimal(str(item['quantity']))
+            cambios = stock_service.aplicar_deltas(
+                self.db, deltas, store_id=store_id,
+                permitir_negativo=permitir_negativo,
+            )
 
-                    # Datos contables del movimiento
-                    user = self.db.query(User).filter(User.id == user_id).first()
-                    user_name = user.full_name if user else 'Sistema'
+            # stock_before de cada línea: el stock real antes del UPDATE,
+            # menos lo que ya descontaron las líneas anteriores del ticket.
+            stock_corriente = {pid: c.stock_before for pid, c in cambios.items()}
 
-                    comprobante = (
-                        self.db.query(Comprobante)
-                        .filter(Comprobante.sale_id == sale.id)
-                        .first()
-                    )
-                    if comprobante and comprobante.tipo == '03':
-                        doc_tipo = 'BOLETA'
-                    elif comprobante and comprobante.tipo == '01':
-                        doc_tipo = 'FACTURA'
-                    else:
-                        doc_tipo = 'TICKET'
-                    if comprobante:
-                        doc_numero = f"{comprobante.serie}-{str(comprobante.numero).zfill(8)}"
-                    else:
-                        doc_numero = f"VTA-{sale.sale_number or sale.id}"
+            sale_item_rows = []
+            movement_rows = []
+            for item in items:
+                sale_item_rows.append({
+                    'sale_id': sale.id,
+                    'product_id': item['product_id'],
+                    'quantity': item['quantity'],
+                    'unit_price': item['unit_price'],
+                    'subtotal': item['subtotal'],
+                })
+
+                cambio = cambios.get(item['product_id'])
+                if not cambio:
+                    continue
+
+                qty = Decimal(str(item['quantity']))
+                cost = cambio.cost_price
+                stock_before = stock_corriente[cambio.product_id]
+                stock_after = stock_before - qty
+                stock_corriente[cambio.product_id] = stock_after
+
+                movement_rows.append({
+                    'store_id': store_id,
+                    'product_id': cambio.product_id,
+                    'user_id': user_id,
+                    'movement_type': 'salida_venta',
+                    'quantity': -qty,
+                    'cost_price': cost,
+                    'costo_total': cost * qty,
+                    'reference_type': 'sale',
+                    'reference_id': sale.id,
+                    'doc_tipo': doc_tipo,
+                    'doc_numero': doc_numero,
+                    'glosa': glosa,
+                    'user_name': user_name,
+                    'stock_before': stock_before,
+                    'stock_after': stock_after,
+                    'notes': f"Venta #{sale.id}",
+                })
+
+            # Inserción masiva: un INSERT multi-VALUES por tabla, sin
+            # importar cuántas líneas tenga el ticket.
+            if sale_item_rows:
+                self.db.execute(insert(SaleItem), sale_item_rows)
+            if movement_rows:
+                self.db.execute(insert(InventoryMovement), movement_rows)
+
+            # Agregados del dashboard, en la misma transacción
+            agregados_ventas.aplicar_venta(self.db, sale.id)
 
-                    self.db.add(InventoryMovement(
-                        store_id=store_id,
-                        product_id=product.id,
-                        user_id=user_id,
-                        movement_type='salida_venta',
-                        quantity=-qty,
-                        cost_price=cost,
-                        costo_total=cost * qty,
-                        reference_type='sale',
-                        reference_id=sale.id,
-                        doc_tipo=doc_tipo,
-                        doc_numero=doc_numero,
-                        glosa=f"Venta a {sale.customer_name or 'Cliente varios'}",
-                        user_name=user_name,
-                        stock_before=stock_before,
-                        stock_after=product.stock,
-                        notes=f"Venta #{sale.id}",
-                    ))
-            
             self.db.commit()
             self.db.refresh(sale)
             
-            print(f"[SaleService] Venta creada: ID {sale.id}, Total S/ {total:.2f}, Hora Perú: {sale.sale_date}")
+            logger.debug("[SaleService] Venta creada: ID %s, Total S/ %.2f, Hora Perú: %s", sale.id, total, sale.sale_date)
             
             return sale
             
+        except StockInsuficienteError:
+            self.db.rollback()
+            raise
         except Exception as e:
             self.db.rollback()
-            print(f"[SaleService] Error al crear venta: {e}")
+            logger.exception("[SaleService] Error al crear venta: %s", e)
             raise ValueError(f"Error al crear venta: {str(e)}")
     
     def get_sales_by_date(self, store_id: int, date: datetime = None) -> List[Sale]:
@@ -163,9 +220,9 @@ class SaleService:
         start_utc = start_of_day.astimezone(pytz.UTC)
         end_utc = end_of_day.astimezone(pytz.UTC)
         
-        print(f"[SaleService] Buscando ventas del día (hora Perú):")
-        print(f"[SaleService]   Desde: {start_of_day} → UTC: {start_utc}")
-        print(f"[SaleService]   Hasta: {end_of_day} → UTC: {end_utc}")
+        logger.debug("[SaleService] Buscando ventas del día (hora Perú):")
+        logger.debug("[SaleService]   Desde: %s → UTC: %s", start_of_day, start_utc)
+        logger.debug("[SaleService]   Hasta: %s → UTC: %s", end_of_day, end_utc)
         
         # Buscar ventas usando el rango UTC
         sales = self.db.query(Sale).filter(
@@ -174,7 +231,7 @@ class SaleService:
             Sale.sale_date < end_utc
         ).order_by(Sale.sale_date.desc()).all()
         
-        print(f"[SaleService] Ventas encontradas: {len(sales)}")
+        logger.debug("[SaleService] Ventas encontradas: %s", len(sales))
         
         return sales
     
@@ -192,7 +249,7 @@ class SaleService:
         sales = self.get_sales_by_date(store_id, date)
         total = sum(sale.total for sale in sales)
         
-        print(f"[SaleService] Total del día: S/ {total:.2f} ({len(sales)} ventas)")
+        logger.debug("[SaleService] Total del día: S/ %.2f (%s ventas)", total, len(sales))
         
         return total
     
@@ -244,21 +301,35 @@ class SaleService:
         """
         try:
             sale = self.get_sale_by_id(sale_id)
+
+            # Sacarla de los agregados mientras sus filas existen
+            # (una anulada ya se restó al anularla)
+            if sale.status != 'cancelled':
+                agregados_ventas.aplicar_venta(self.db, sale_id, -1)
             
             # Restaurar el stock de los productos
             user = self.db.query(User).filter(User.id == sale.user_id).first()
             user_name = user.full_name if user else 'Sistema'
+            deltas = {}
+            for item in sale.items:
+                deltas[item.product_id] = deltas.get(item.product_id, Decimal('0')) + Decimal(str(item.quantity))
+            cambios = stock_service.aplicar_deltas(
+                self.db, deltas, store_id=sale.store_id, permitir_negativo=True,
+            )
+            stock_corriente = {pid: c.stock_before for pid, c in cambios.items()}
+
             for item in sale.items:
-                product = self.db.query(Product).filter(Product.id == item.product_id).first()
-                if product:
+                cambio = cambios.get(item.product_id)
+                if cambio:
                     qty = Decimal(str(item.quantity))
-                    cost = Decimal(str(product.cost_price or 0))
-                    stock_before = Decimal(str(product.stock or 0))
-                    product.stock = stock_before + qty
+                    cost = cambio.cost_price
+                    stock_before = stock_corriente[cambio.product_id]
+                    stock_after = stock_before + qty
+                    stock_corriente[cambio.product_id] = stock_after
 
                     self.db.add(InventoryMovement(
                         store_id=sale.store_id,
-                        product_id=product.id,
+                        product_id=cambio.product_id,
                         user_id=sale.user_id,
                         movement_type='entrada_devolucion',
                         quantity=qty,
@@ -271,7 +342,7 @@ class SaleService:
                         glosa=f"Anulación venta #{sale.sale_number or sale.id}",
                         user_name=user_name,
                         stock_before=stock_before,
-                        stock_after=product.stock,
+                        stock_after=stock_after,
                         notes=f"Anulación venta #{sale.id}",
                     ))
             
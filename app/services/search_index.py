@@ -0,0 +1,381 @@
+"""
+QueVendi — Índice de búsqueda de productos en memoria
+=====================================================
+
+El type-ahead del POS dispara una búsqueda por tecla. Antes cada tecla
+era un `ILIKE '%q%'` sobre `products.name` y `array_to_string(aliases)`
+(seq scan: el patrón con comodín inicial no puede usar índice), o
+directamente cargar el catálogo entero y puntuar producto por producto
+con `SequenceMatcher`.
+
+Este módulo mantiene, por tienda y por proceso, un índice invertido de
+los productos activos:
+
+  - textos normalizados (minúsculas, sin tildes) de nombre y aliases
+  - palabra → productos           (match de palabra exacta)
+  - lista ordenada de palabras    (prefijo por bisect)
+  - lista ordenada de textos      (nombre/alias que empieza con q)
+  - trigrama → productos          (candidatos para "contiene" y fuzzy)
+
+y puntúa con los mismos niveles que `ProductService.search_products`:
+
+    exacto 100 · palabra exacta 95 · prefijo 90 · prefijo de palabra 85
+    · contiene 60 · fuzzy ratio×60 · umbral 50
+
+La búsqueda devuelve sólo ids + score. El llamador trae las filas por
+PK (precio y stock cambian con cada venta y no se cachean aquí).
+
+INVALIDACIÓN
+------------
+Los endpoints que cambian productos llaman a `actualizar_producto()`
+(crear/editar/activar) o `invalidar_tienda()` (importaciones y cambios
+masivos). Con varios workers cada proceso tiene su propio índice, así
+que además se reconstruye solo tras `TTL_INDICE_SEGUNDOS`.
+
+Las tiendas con catálogo grande no usan este índice: `buscar_productos`
+las despacha a search_pg (pg_trgm + full-text en el servidor).
+"""
+
+import bisect
+import logging
+import threading
+import time
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.product import Product
+from app.services import search_pg
+
+logger = logging.getLogger(__name__)
+
+# Un worker que no recibió la invalidación (otro proceso editó el
+# producto) converge como máximo en este tiempo.
+TTL_INDICE_SEGUNDOS = 300
+
+# Límite de candidatos fuzzy por consulta: los que más trigramas
+# comparten con la búsqueda. Con umbral 50 el ratio mínimo útil es ~0.83,
+# así que un candidato con pocos trigramas en común nunca llega.
+MAX_CANDIDATOS_FUZZY = 40
+
+SCORE_MINIMO = 50
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Minúsculas y sin tildes: 'Azúcar Rubia' → 'azucar rubia'."""
+    if not texto:
+        return ""
+    return (
+        unicodedata.normalize("NFD", texto.lower())
+        .encode("ascii", "ignore")
+        .decode("utf-8")
+        .strip()
+    )
+
+
+def trigramas(texto: str) -> Set[str]:
+    """Trigramas con relleno: 'pan' → {'  p', ' pa', 'pan', 'an '}."""
+    t = f"  {texto} "
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+def variantes(query: str) -> Set[str]:
+    """Singular/plural, igual que ProductService: 'galletas' ↔ 'galleta'."""
+    q = {query}
+    if query.endswith("s"):
+        q.add(query.rstrip("s"))
+    else:
+        q.add(query + "s")
+    return {v for v in q if v}
+
+
+def _con_prefijo(ordenada: List[str], prefijo: str) -> Iterable[str]:
+    """Elementos de una lista ordenada que empiezan con `prefijo`."""
+    i = bisect.bisect_left(ordenada, prefijo)
+    while i < len(ordenada) and ordenada[i].startswith(prefijo):
+        yield ordenada[i]
+        i += 1
+
+
+class IndiceProductos:
+    """Índice invertido de los productos activos de UNA tienda."""
+
+    def __init__(self, store_id: int):
+        self.store_id = store_id
+        self.creado_en = time.monotonic()
+        self._lock = threading.RLock()
+        self._textos: Dict[int, Tuple[str, ...]] = {}      # pid → nombre + aliases
+        self._categorias: Dict[int, Optional[str]] = {}
+        self._por_texto: Dict[str, Set[int]] = {}
+        self._por_palabra: Dict[str, Set[int]] = {}
+        self._por_trigrama: Dict[str, Set[int]] = {}
+        self._textos_ordenados: List[str] = []
+        self._palabras_ordenadas: List[str] = []
+        self._sucio = False
+
+    def __len__(self) -> int:
+        return len(self._textos)
+
+    # ── Mantenimiento ─────────────────────────────────────────
+
+    def agregar(self, product_id: int, nombre: str, aliases=None,
+                categoria: Optional[str] = None) -> None:
+        """Inserta o reemplaza un producto."""
+        textos = [normalizar(nombre)]
+        textos += [normalizar(a) for a in (aliases or []) if a]
+        textos = tuple(dict.fromkeys(t for t in textos if t))
+
+        with self._lock:
+            self._quitar_sin_lock(product_id)
+            self._textos[product_id] = textos
+            self._categorias[product_id] = categoria
+            for t in textos:
+                self._por_texto.setdefault(t, set()).add(product_id)
+                for palabra in t.split():
+                    self._por_palabra.setdefault(palabra, set()).add(product_id)
+                for tri in trigramas(t):
+                    self._por_trigrama.setdefault(tri, set()).add(product_id)
+            self._sucio = True
+
+    def quitar(self, product_id: int) -> None:
+        with self._lock:
+            self._quitar_sin_lock(product_id)
+
+    def _quitar_sin_lock(self, product_id: int) -> None:
+        textos = self._textos.pop(product_id, None)
+        self._categorias.pop(product_id, None)
+        if not textos:
+            return
+        for t in textos:
+            _descartar(self._por_texto, t, product_id)
+            for palabra in t.split():
+                _descartar(self._por_palabra, palabra, product_id)
+            for tri in trigramas(t):
+                _descartar(self._por_trigrama, tri, product_id)
+        self._sucio = True
+
+    def _ordenar(self) -> None:
+        """Re-ordena las listas de prefijos tras cambios (perezoso)."""
+        if self._sucio:
+            self._textos_ordenados = sorted(self._por_texto)
+            self._palabras_ordenadas = sorted(self._por_palabra)
+            self._sucio = False
+
+    # ── Consulta ──────────────────────────────────────────────
+
+    def buscar(self, query: str, limit: int = 10,
+               categoria: Optional[str] = None) -> List[Tuple[int, float]]:
+        """
+        Ranking de productos para `query`.
+
+        Returns:
+            [(product_id, score)] ordenado por score desc, hasta `limit`.
+        """
+        q = normalizar(query)
+        if not q:
+            return []
+
+        with self._lock:
+            self._ordenar()
+            scores: Dict[int, float] = {}
+
+            def subir(pids: Iterable[int], score: float) -> None:
+                for pid in pids:
+                    if scores.get(pid, 0) < score:
+                        scores[pid] = score
+
+            for v in variantes(q):
+                # 1. Nombre/alias exacto o que empieza con v
+                for texto in _con_prefijo(self._textos_ordenados, v):
+                    subir(self._por_texto[texto], 100 if texto == v else 90)
+
+                # 2. Palabra exacta o prefijo de palabra (≥3 letras)
+                subir(self._por_palabra.get(v, ()), 95)
+                if len(v) >= 3:
+                    for palabra in _con_prefijo(self._palabras_ordenadas, v):
+                        if palabra != v:
+                            subir(self._por_palabra[palabra], 85)
+
+                # 3. Contiene: todos los trigramas internos de v deben
+                # estar en el texto; se confirma con `in`.
+                for pid in self._candidatos_contiene(v):
+                    if scores.get(pid, 0) < 60 and any(v in t for t in self._textos[pid]):
+                        scores[pid] = 60
+
+                # 4. Fuzzy sólo para lo que no tuvo match fuerte
+                for pid in self._candidatos_fuzzy(v):
+                    if scores.get(pid, 0) >= 60:
+                        continue
+                    ratio = max(_ratio_util(v, t) for t in self._textos[pid])
+                    if ratio > 0.6:
+                        subir((pid,), ratio * 60)
+
+            ranking = [
+                (pid, s) for pid, s in scores.items()
+                if s >= SCORE_MINIMO
+                and (categoria is None or self._categorias.get(pid) == categoria)
+            ]
+
+        ranking.sort(key=lambda x: (-x[1], x[0]))
+        return ranking[:limit]
+
+    def _candidatos_contiene(self, v: str) -> Iterable[int]:
+        if len(v) < 3:
+            # "pa" contenido en cualquier parte es ruido (empaque, papa,
+            # zapatilla…): con 1-2 letras sólo cuentan prefijos y palabras.
+            return ()
+        internos = {v[i:i + 3] for i in range(len(v) - 2)}
+        conjuntos = sorted(
+            (self._por_trigrama.get(tri, set()) for tri in internos), key=len
+        )
+        if not conjuntos or not conjuntos[0]:
+            return ()
+        return set.intersection(*conjuntos)
+
+    def _candidatos_fuzzy(self, v: str) -> List[int]:
+        conteo: Dict[int, int] = {}
+        for tri in trigramas(v):
+            for pid in self._por_trigrama.get(tri, ()):
+                conteo[pid] = conteo.get(pid, 0) + 1
+        mejores = sorted(conteo.items(), key=lambda x: -x[1])[:MAX_CANDIDATOS_FUZZY]
+        return [pid for pid, _ in mejores]
+
+
+# ratio × 60 debe llegar a SCORE_MINIMO para que el fuzzy cuente.
+_RATIO_MINIMO = SCORE_MINIMO / 60
+
+
+def _ratio_util(a: str, b: str) -> float:
+    """
+    SequenceMatcher(a, b).ratio(), o 0 si no puede alcanzar _RATIO_MINIMO.
+
+    Las cotas (longitudes, quick_ratio) son baratas y descartan casi todos
+    los candidatos antes del cálculo completo, que es lo caro.
+    """
+    la, lb = len(a), len(b)
+    if 2.0 * min(la, lb) / (la + lb) < _RATIO_MINIMO:
+        return 0.0
+    sm = SequenceMatcher(None, a, b)
+    if sm.quick_ratio() < _RATIO_MINIMO:
+        return 0.0
+    return sm.ratio()
+
+
+def _descartar(mapa: Dict[str, Set[int]], clave: str, pid: int) -> None:
+    ids = mapa.get(clave)
+    if ids is not None:
+        ids.discard(pid)
+        if not ids:
+            del mapa[clave]
+
+
+# ════════════════════════════════════════════════════════════════
+# REGISTRO POR TIENDA
+# ════════════════════════════════════════════════════════════════
+
+_indices: Dict[int, IndiceProductos] = {}
+_registro_lock = threading.Lock()
+
+
+def _construir(db: Session, store_id: int) -> IndiceProductos:
+    inicio = time.perf_counter()
+    indice = IndiceProductos(store_id)
+    filas = db.query(
+        Product.id, Product.name, Product.aliases, Product.category
+    ).filter(
+        Product.store_id == store_id,
+        Product.is_active == True,
+        Product.deleted_at.is_(None),
+    ).all()
+    for f in filas:
+        indice.agregar(f.id, f.name, f.aliases, f.category)
+    logger.info(
+        f"[SearchIndex] Tienda {store_id}: {len(indice)} productos indexados "
+        f"en {(time.perf_counter() - inicio) * 1000:.1f}ms"
+    )
+    return indice
+
+
+def obtener_indice(db: Session, store_id: int) -> IndiceProductos:
+    """Índice de la tienda; lo construye (una consulta) si no existe o expiró."""
+    indice = _indices.get(store_id)
+    if indice is not None and time.monotonic() - indice.creado_en < TTL_INDICE_SEGUNDOS:
+        return indice
+
+    nuevo = _construir(db, store_id)
+    with _registro_lock:
+        _indices[store_id] = nuevo
+    return nuevo
+
+
+def buscar(db: Session, store_id: int, query: str, limit: int = 10,
+           categoria: Optional[str] = None) -> List[Tuple[int, float]]:
+    """Atajo: [(product_id, score)] para la tienda."""
+    return obtener_indice(db, store_id).buscar(query, limit=limit, categoria=categoria)
+
+
+def buscar_productos(db: Session, store_id: int, query: str, limit: int = 10,
+                     categoria: Optional[str] = None,
+                     solo_con_stock: bool = False) -> List[Product]:
+    """
+    Productos de la tienda que coinciden con `query`, en orden de score.
+
+    Tiendas con catálogo grande (SEARCH_PG_UMBRAL_PRODUCTOS) se resuelven
+    en Postgres (search_pg) en vez de mantener su índice en memoria.
+
+    Si no, el ranking sale del índice y las filas se traen por PK en una
+    sola consulta (precio y stock frescos). Como el filtro de stock se
+    aplica en esa consulta, se pide al índice algo más que `limit`.
+    """
+    if search_pg.usar_para_tienda(db, store_id):
+        return search_pg.buscar_productos(
+            db, store_id, query, limit=limit, categoria=categoria,
+            solo_con_stock=solo_con_stock,
+        )
+
+    margen = limit * 3 if solo_con_stock else limit
+    ranking = buscar(db, store_id, query, limit=margen, categoria=categoria)
+    if not ranking:
+        return []
+
+    ids = [pid for pid, _ in ranking]
+    consulta = db.query(Product).filter(
+        Product.id.in_(ids),
+        Product.store_id == store_id,
+        Product.is_active == True,
+        Product.deleted_at.is_(None),
+    )
+    if solo_con_stock:
+        consulta = consulta.filter(Product.stock > 0)
+    por_id = {p.id: p for p in consulta.all()}
+    return [por_id[pid] for pid in ids if pid in por_id][:limit]
+
+
+def actualizar_producto(product: Product) -> None:
+    """
+    Refleja un alta/edición/activación en el índice de su tienda.
+
+    Si la tienda aún no tiene índice en este proceso no hace nada: se
+    construirá completo en la primera búsqueda.
+    """
+    indice = _indices.get(product.store_id)
+    if indice is None:
+        return
+    if product.is_active and product.deleted_at is None:
+        indice.agregar(product.id, product.name, product.aliases, product.category)
+    else:
+        indice.quitar(product.id)
+
+
+def quitar_producto(store_id: int, product_id: int) -> None:
+    indice = _indices.get(store_id)
+    if indice is not None:
+        indice.quitar(product_id)
+
+
+def invalidar_tienda(store_id: int) -> None:
+    """Descarta el índice; la próxima búsqueda lo reconstruye."""
+    with _registro_lock:
+        _indices.pop(store_id, None)
@@ -0,0 +1,323 @@
+"""
+QueVendi — Búsqueda de productos en Postgres (pg_trgm + full-text)
+==================================================================
+
+Para catálogos grandes (ferreterías, farmacias con miles de SKUs) no
+conviene tener el índice en memoria de search_index en cada worker. En
+esas tiendas la búsqueda se resuelve en el servidor con índices GIN:
+
+  products.search_name  texto normalizado del nombre
+  products.search_text  '|nombre|alias1|alias2|' normalizado
+  products.search_tsv   tsvector 'simple' de nombre + aliases
+
+Son columnas comunes que mantiene un trigger (BEFORE INSERT / UPDATE OF
+name, aliases). No son GENERATED ... STORED: agregarlas así reescribe
+`products` con ACCESS EXCLUSIVE, y eso frena todas las ventas hasta que
+termina. `unaccent()` y `array_to_string()` no son IMMUTABLE, por eso se
+envuelven en `qv_normalizar()`/`qv_search_text()` (lo exigen los
+índices).
+
+Puesta en marcha
+----------------
+Al arrancar sólo se agregan las columnas (vacías, sin reescribir) y el
+trigger. La tarea `search_pg_preparar` (de madrugada) las llena de a
+LOTE_BACKFILL filas, una transacción por lote, y luego construye los GIN
+con CREATE INDEX CONCURRENTLY. Hasta que los índices estén válidos todas
+las tiendas buscan con el índice en memoria.
+
+El ranking reproduce los niveles de ProductService.search_products:
+
+    100 nombre o alias exacto      ('|q|' en search_text)
+     95 palabra exacta             (search_tsv @@ 'q')
+     90 nombre o alias empieza     ('|q' en search_text)
+     85 palabra empieza (≥3 letras)(search_tsv @@ 'q:*')
+     60 contiene                   (search_text LIKE '%q%', trigram GIN)
+  50-60 fuzzy                      (search_name % q, similitud trigram)
+
+El fuzzy usa similitud de trigramas en vez de SequenceMatcher. Sólo
+cuenta desde SIMILITUD_MINIMA (el umbral por defecto de pg_trgm, 0.3,
+dejaba pasar casi cualquier cosa con 50 puntos) y se lleva a 50-60
+como el ratio×60 del índice en memoria, que exige ratio >= 0.83: el
+orden de los niveles se conserva, el valor exacto dentro del nivel no.
+
+Los '%q%' viejos sobre lower(array_to_string(aliases)) nunca podían usar
+índice; estos LIKE sí, vía gin_trgm_ops.
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core import jobs, schema
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+# El conteo de productos por tienda se cachea: decidir el modo no debe
+# costar un COUNT por tecla.
+TTL_CONTEO_SEGUNDOS = 300
+# Filas por transacción al llenar las columnas de búsqueda
+LOTE_BACKFILL = 2000
+# Similitud de trigramas mínima para el nivel fuzzy (50 puntos); 1.0 da 60
+SIMILITUD_MINIMA = 0.6
+
+
+# ════════════════════════════════════════════════════════════════
+# MIGRACIÓN IDEMPOTENTE
+# ════════════════════════════════════════════════════════════════
+#
+# Sólo cambios de catálogo: ADD COLUMN sin default no reescribe la tabla.
+# Si una versión anterior dejó las columnas como GENERATED, DROP
+# EXPRESSION las vuelve comunes conservando los valores (tampoco
+# reescribe).
+
+MIGRATION_SQL = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+CREATE OR REPLACE FUNCTION qv_normalizar(t text) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, coalesce(t, ''))) $$;
+
+CREATE OR REPLACE FUNCTION qv_search_text(nombre text, aliases text[]) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT '|' || qv_normalizar(nombre) || '|'
+        || coalesce(qv_normalizar(array_to_string(aliases, '|')) || '|', '')
+$$;
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_name text;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_text text;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_tsv tsvector;
+ALTER TABLE products ALTER COLUMN search_name DROP EXPRESSION IF EXISTS;
+ALTER TABLE products ALTER COLUMN search_text DROP EXPRESSION IF EXISTS;
+ALTER TABLE products ALTER COLUMN search_tsv DROP EXPRESSION IF EXISTS;
+
+CREATE OR REPLACE FUNCTION qv_products_search() RETURNS trigger AS $$
+BEGIN
+    NEW.search_name := qv_normalizar(NEW.name);
+    NEW.search_text := qv_search_text(NEW.name, NEW.aliases);
+    NEW.search_tsv := to_tsvector('simple'::regconfig, replace(NEW.search_text, '|', ' '));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_search ON products;
+CREATE TRIGGER trg_products_search BEFORE INSERT OR UPDATE OF name, aliases ON products
+    FOR EACH ROW EXECUTE PROCEDURE qv_products_search();
+"""
+
+schema.registrar("search_pg", MIGRATION_SQL)
+
+INDICES = {
+    "idx_products_search_text_trgm": "ON products USING gin (search_text gin_trgm_ops)",
+    "idx_products_search_name_trgm": "ON products USING gin (search_name gin_trgm_ops)",
+    "idx_products_search_tsv": "ON products USING gin (search_tsv)",
+}
+
+_listo: Tuple[bool, float] = (False, 0.0)
+
+
+def _preparado() -> bool:
+    """
+    ¿Columnas llenas e índices válidos? Los índices se construyen después
+    del backfill, así que basta mirarlos. Cacheado TTL_CONTEO_SEGUNDOS.
+    """
+    global _listo
+    if _listo[0]:
+        return True
+    if time.monotonic() - _listo[1] < TTL_CONTEO_SEGUNDOS:
+        return False
+    ok = False
+    if schema.lista("search_pg"):
+        try:
+            ok = schema.indices_validos(INDICES)
+        except Exception as e:
+            logger.warning(f"[SearchPG] No se pudo verificar los índices: {e}")
+    _listo = (ok, time.monotonic())
+    return ok
+
+
+def preparar() -> dict:
+    """
+    Tarea de madrugada (app.core.jobs): llena las columnas de búsqueda de
+    a LOTE_BACKFILL filas y construye los índices GIN concurrentemente.
+    Con todo listo no hace nada.
+    """
+    if not schema.asegurar("search_pg"):
+        return {"omitido": "sin migración"}
+    if schema.indices_validos(INDICES):
+        return {"listo": True}
+    db = SessionLocal()
+    filas, ultimo = 0, 0
+    try:
+        while True:
+            hasta = db.execute(text("""
+                SELECT MAX(id) FROM (
+                    SELECT id FROM products WHERE id > :u ORDER BY id LIMIT :lote
+                ) t
+            """), {"u": ultimo, "lote": LOTE_BACKFILL}).scalar()
+            if hasta is None:
+                break
+            filas += db.execute(text("""
+                UPDATE products
+                   SET search_name = qv_normalizar(name),
+                       search_text = qv_search_text(name, aliases),
+                       search_tsv = to_tsvector('simple'::regconfig,
+                                                replace(qv_search_text(name, aliases), '|', ' '))
+                 WHERE id > :u AND id <= :hasta AND search_text IS NULL
+            """), {"u": ultimo, "hasta": hasta}).rowcount
+            db.commit()
+            ultimo = hasta
+    finally:
+        db.close()
+    resultado = schema.crear_indices(INDICES)
+    logger.info(f"[SearchPG] Backfill: {filas} filas; índices: {resultado['creados']}")
+    return {"filas": filas, **resultado}
+
+
+jobs.registrar("search_pg_preparar", preparar, hora_lima=3, reintentos=0)
+
+
+# ════════════════════════════════════════════════════════════════
+# ¿QUÉ TIENDAS USAN ESTE MODO?
+# ════════════════════════════════════════════════════════════════
+
+_conteos: Dict[int, Tuple[int, float]] = {}
+
+
+def _contar_productos(db: Session, store_id: int) -> int:
+    cache = _conteos.get(store_id)
+    if cache and time.monotonic() - cache[1] < TTL_CONTEO_SEGUNDOS:
+        return cache[0]
+    total = db.execute(text("""
+        SELECT COUNT(*) FROM products
+        WHERE store_id = :sid AND is_active = TRUE AND deleted_at IS NULL
+    """), {"sid": store_id}).scalar() or 0
+    _conteos[store_id] = (total, time.monotonic())
+    return total
+
+
+def usar_para_tienda(db: Session, store_id: int) -> bool:
+    """True si la tienda supera `SEARCH_PG_UMBRAL_PRODUCTOS` y el esquema está listo."""
+    umbral = settings.SEARCH_PG_UMBRAL_PRODUCTOS
+    if umbral <= 0:
+        return False
+    if _contar_productos(db, store_id) < umbral:
+        return False
+    return _preparado()
+
+
+# ════════════════════════════════════════════════════════════════
+# RANKING
+# ════════════════════════════════════════════════════════════════
+
+def _like_escape(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _score_sql(n: int) -> str:
+    """CASE con los niveles de score para la variante :q{n}."""
+    return f"""
+        CASE
+            WHEN p.search_text LIKE :exacto{n} ESCAPE '\\' THEN 100
+            WHEN :palabra{n} <> '' AND p.search_tsv @@ to_tsquery('simple', :palabra{n}) THEN 95
+            WHEN p.search_text LIKE :prefijo{n} ESCAPE '\\' THEN 90
+            WHEN :pref_palabra{n} <> '' AND p.search_tsv @@ to_tsquery('simple', :pref_palabra{n}) THEN 85
+            WHEN p.search_text LIKE :contiene{n} ESCAPE '\\' THEN 60
+            WHEN p.search_name % :q{n} AND similarity(p.search_name, :q{n}) >= :sim_min
+                THEN 50 + 10 * (similarity(p.search_name, :q{n}) - :sim_min) / (1 - :sim_min)
+            ELSE 0
+        END"""
+
+
+def _filtro_sql(n: int) -> str:
+    """Condición indexable que cubre todos los niveles de la variante."""
+    return f"""(
+            p.search_text LIKE :contiene{n} ESCAPE '\\'
+            OR (:pref_palabra{n} <> '' AND p.search_tsv @@ to_tsquery('simple', :pref_palabra{n}))
+            OR p.search_name % :q{n}
+        )"""
+
+
+def _params_variante(n: int, v: str) -> dict:
+    una_palabra = v.isalnum()
+    e = _like_escape(v)
+    return {
+        f"q{n}": v,
+        f"exacto{n}": f"%|{e}|%",
+        f"prefijo{n}": f"%|{e}%",
+        f"contiene{n}": f"%{e}%",
+        # to_tsquery sólo con tokens alfanuméricos: nada que escapar.
+        f"palabra{n}": v if una_palabra else "",
+        f"pref_palabra{n}": f"{v}:*" if una_palabra and len(v) >= 3 else "",
+    }
+
+
+def buscar(db: Session, store_id: int, query: str, limit: int = 10,
+           categoria: Optional[str] = None, solo_con_stock: bool = False
+           ) -> List[Tuple[int, float]]:
+    """
+    [(product_id, score)] ordenado por score, calculado en Postgres.
+
+    Mismo contrato que search_index.IndiceProductos.buscar.
+    """
+    # Import diferido: search_index importa este módulo para despachar.
+    from app.services.search_index import SCORE_MINIMO, normalizar, variantes
+
+    q = normalizar(query)
+    if not q:
+        return []
+    vs = sorted(variantes(q))
+
+    params = {"sid": store_id, "lim": limit, "minimo": SCORE_MINIMO,
+              "sim_min": SIMILITUD_MINIMA}
+    for n, v in enumerate(vs):
+        params.update(_params_variante(n, v))
+
+    score = "GREATEST(" + ", ".join(_score_sql(n) for n in range(len(vs))) + ")"
+    filtro = " OR ".join(_filtro_sql(n) for n in range(len(vs)))
+    extra = ""
+    if categoria:
+        extra += " AND p.category = :cat"
+        params["cat"] = categoria
+    if solo_con_stock:
+        extra += " AND p.stock > 0"
+
+    # `%` usa este umbral: con el de fábrica (0.3) el GIN devolvía
+    # candidatos que después nunca llegan a SIMILITUD_MINIMA
+    db.execute(text("SELECT set_config('pg_trgm.similarity_threshold', :t, true)"),
+               {"t": str(SIMILITUD_MINIMA)})
+    rows = db.execute(text(f"""
+        SELECT id, score FROM (
+            SELECT p.id, {score} AS score
+            FROM products p
+            WHERE p.store_id = :sid
+              AND p.is_active = TRUE
+              AND p.deleted_at IS NULL
+              {extra}
+              AND ({filtro})
+        ) r
+        WHERE score >= :minimo
+        ORDER BY score DESC, id
+        LIMIT :lim
+    """), params).fetchall()
+    return [(r.id, float(r.score)) for r in rows]
+
+
+def buscar_productos(db: Session, store_id: int, query: str, limit: int = 10,
+                     categoria: Optional[str] = None, solo_con_stock: bool = False
+                     ) -> List[Product]:
+    """Productos en orden de score (ranking + fetch por PK)."""
+    ranking = buscar(db, store_id, query, limit=limit, categoria=categoria,
+                     solo_con_stock=solo_con_stock)
+    if not ranking:
+        return []
+    ids = [pid for pid, _ in ranking]
+    por_id = {p.id: p for p in db.query(Product).filter(Product.id.in_(ids)).all()}
+    return [por_id[pid] for pid in ids if pid in por_id]
@@ -0,0 +1,172 @@
+"""
+QueVendi — Mutaciones de stock atómicas
+=======================================
+
+El stock se movía en Python: SELECT del producto, `product.stock =
+stock_before - qty` y UPDATE al commit. Dos cajas vendiendo el mismo
+producto leían el mismo `stock_before` y una de las dos restas se
+perdía. Lo mismo pasaba cuando la sincronización offline reenviaba
+ventas mientras la caja seguía vendiendo.
+
+Aquí el cálculo lo hace Postgres en UNA sentencia por venta:
+
+    UPDATE products SET stock = stock + d.delta
+    FROM (unnest(ids), unnest(deltas)) d
+    RETURNING stock - d.delta AS stock_before, stock AS stock_after
+
+El UPDATE toma el lock de fila, así que el segundo cajero espera y parte
+del stock que dejó el primero. `stock_before`/`stock_after` del kardex
+salen del RETURNING: son los valores reales, no una lectura previa que
+otra transacción pudo haber invalidado.
+
+POLÍTICA DE STOCK NEGATIVO
+--------------------------
+Por defecto se permite vender sin stock (la bodega vende lo que tiene en
+el anaquel aunque el sistema diga 0). Con `STOCK_BLOQUEAR_NEGATIVO=true`
+o `permitir_negativo=False`, una salida que dejaría stock < 0 no se
+aplica y se lanza StockInsuficienteError; quien llama hace rollback.
+
+Las ventas offline que se sincronizan SIEMPRE se aplican: la venta ya
+ocurrió en el mostrador y rechazarla sólo descuadraría el kardex.
+"""
+
+import logging
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StockInsuficienteError(ValueError):
+    """Una salida dejaría el stock en negativo con la política activa."""
+
+    def __init__(self, faltantes: Dict[int, Decimal]):
+        self.faltantes = faltantes      # {product_id: stock_disponible}
+        detalle = ", ".join(
+            f"#{pid} (hay {stock})" for pid, stock in sorted(faltantes.items())
+        )
+        super().__init__(f"Stock insuficiente: {detalle}")
+
+
+@dataclass(frozen=True)
+class CambioStock:
+    """Resultado de aplicar un delta a un producto."""
+    product_id: int
+    stock_before: Decimal
+    stock_after: Decimal
+    cost_price: Decimal
+
+
+# Los locks de fila se toman dentro del CTE `bloqueo`, ordenado por id.
+# Los CTE con FOR UPDATE se materializan, así que dos ventas con los
+# mismos productos bloquean en el mismo orden y no hay deadlock.
+#
+# Con :permitir_negativo = FALSE, las filas cuya salida dejaría stock < 0
+# no se actualizan ni aparecen en el RETURNING; las entradas (delta >= 0)
+# se aplican siempre.
+_APLICAR_DELTAS_SQL = text("""
+    WITH d AS (
+        SELECT unnest(CAST(:ids AS integer[]))    AS id,
+               unnest(CAST(:deltas AS numeric[])) AS delta
+    ),
+    bloqueo AS (
+        SELECT p.id
+        FROM products p
+        WHERE p.id = ANY(CAST(:ids AS integer[]))
+          AND (CAST(:sid AS integer) IS NULL OR p.store_id = :sid)
+        ORDER BY p.id
+        FOR UPDATE
+    )
+    UPDATE products p
+    SET stock = COALESCE(p.stock, 0) + d.delta
+    FROM bloqueo b
+    JOIN d ON d.id = b.id
+    WHERE p.id = b.id
+      AND (:permitir_negativo OR d.delta >= 0 OR COALESCE(p.stock, 0) + d.delta >= 0)
+    RETURNING p.id,
+              p.stock - d.delta AS stock_before,
+              p.stock           AS stock_after,
+              p.cost_price
+""")
+
+
+def politica_permite_negativo() -> bool:
+    """Política global: ¿se puede vender por debajo de cero?"""
+    return not settings.STOCK_BLOQUEAR_NEGATIVO
+
+
+def aplicar_deltas(
+    db: Session,
+    deltas: Dict[int, Decimal],
+    store_id: Optional[int] = None,
+    permitir_negativo: Optional[bool] = None,
+) -> Dict[int, CambioStock]:
+    """
+    Suma `delta` al stock de cada producto en una sola sentencia. No commitea.
+
+    Args:
+        deltas: {product_id: delta}. Negativo = salida, positivo = entrada.
+            Si un producto aparece en varias líneas, el llamador suma antes.
+        store_id: si se indica, sólo se tocan productos de esa tienda.
+        permitir_negativo: None → política global (`STOCK_BLOQUEAR_NEGATIVO`).
+
+    Returns:
+        {product_id: CambioStock}. Los productos inexistentes (o de otra
+        tienda) no aparecen.
+
+    Raises:
+        StockInsuficienteError: alguna salida dejaría stock < 0 y la
+            política no lo permite. Las demás filas YA se actualizaron:
+            quien llama debe hacer rollback.
+    """
+    if not deltas:
+        return {}
+    if permitir_negativo is None:
+        permitir_negativo = politica_permite_negativo()
+
+    ids = sorted(deltas)
+    rows = db.execute(_APLICAR_DELTAS_SQL, {
+        "ids": ids,
+        "deltas": [Decimal(str(deltas[pid])) for pid in ids],
+        "sid": store_id,
+        "permitir_negativo": bool(permitir_negativo),
+    }).fetchall()
+
+    cambios = {
+        r.id: CambioStock(
+            product_id=r.id,
+            stock_before=Decimal(str(r.stock_before)),
+            stock_after=Decimal(str(r.stock_after)),
+            cost_price=Decimal(str(r.cost_price or 0)),
+        )
+        for r in rows
+    }
+
+    if not permitir_negativo and len(cambios) < len(ids):
+        _verificar_faltantes(db, [pid for pid in ids if pid not in cambios], store_id)
+
+    return cambios
+
+
+def _verificar_faltantes(db: Session, ids: list, store_id: Optional[int]) -> None:
+    """
+    Distingue "no existe" de "no alcanza" para los ids que el UPDATE no
+    devolvió. Sólo corre en el camino de error, nunca en una venta normal.
+    """
+    rows = db.execute(text("""
+        SELECT id, COALESCE(stock, 0) AS stock
+        FROM products
+        WHERE id = ANY(CAST(:ids AS integer[]))
+          AND (CAST(:sid AS integer) IS NULL OR store_id = :sid)
+    """), {"ids": ids, "sid": store_id}).fetchall()
+
+    faltantes = {r.id: Decimal(str(r.stock)) for r in rows}
+    if faltantes:
+        logger.info(f"[Stock] Salida rechazada por stock insuficiente: {faltantes}")
+        raise StockInsuficienteError(faltantes)
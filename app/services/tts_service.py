@@ -1,30 +1,42 @@
 """
 Servicio de Text-to-Speech usando Google Cloud TTS con fallback a Web Speech API
+
+El SDK de Google (grpc) se importa y el cliente se crea con la primera
+síntesis, no al importar el módulo: pesa más de un segundo de arranque.
 """
+import logging
 import os
 from typing import Optional
-from google.cloud import texttospeech
 import base64
 
+logger = logging.getLogger(__name__)
+
 class TTSService:
     """Servicio de conversión texto a voz"""
     
     def __init__(self):
-        self.use_google = False
         self.client = None
         
-        # Intentar inicializar Google TTS
-        try:
-            credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-            if credentials_path and os.path.exists(credentials_path):
+        credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+        self.use_google = bool(credentials_path and os.path.exists(credentials_path))
+        if not self.use_google:
+            logger.info("[TTS] Google credentials no encontradas, usando Web Speech API")
+    
+    def _google(self):
+        """Módulo texttospeech con el cliente ya creado (None si no se pudo)."""
+        if not self.use_google:
+            return None
+        from google.cloud import texttospeech
+        if self.client is None:
+            try:
                 self.client = texttospeech.TextToSpeechClient()
-                self.use_google = True
-                print("[TTS] Google Cloud TTS inicializado")
-            else:
-                print("[TTS] Google credentials no encontradas, usando Web Speech API")
-        except Exception as e:
-            print(f"[TTS] Error al inicializar Google TTS: {e}")
-            print("[TTS] Fallback a Web Speech API")
+                logger.info("[TTS] Google Cloud TTS inicializado")
+            except Exception as e:
+                logger.warning("[TTS] Error al inicializar Google TTS: %s", e)
+                logger.info("[TTS] Fallback a Web Speech API")
+                self.use_google = False
+                return None
+        return texttospeech
     
     def synthesize_speech(
         self, 
@@ -43,7 +55,8 @@ class TTSService:
         Returns:
             Dict con audio en base64 o instrucciones para Web Speech API
         """
-        if not self.use_google or not self.client:
+        texttospeech = self._google()
+        if texttospeech is None:
             # Fallback: devolver instrucciones para usar Web Speech API en el cliente
             return {
                 "method": "web_speech",
@@ -87,7 +100,7 @@ class TTSService:
             }
             
         except Exception as e:
-            print(f"[TTS] Error en Google TTS: {e}")
+            logger.warning("[TTS] Error en Google TTS: %s", e)
             # Fallback a Web Speech API
             return {
                 "method": "web_speech",
@@ -98,7 +111,8 @@ class TTSService:
     
     def get_available_voices(self) -> list:
         """Obtener lista de voces disponibles"""
-        if not self.use_google or not self.client:
+        texttospeech = self._google()
+        if texttospeech is None:
             return [
                 {"name": "Web Speech API", "language": "es-PE", "gender": "neutral"}
             ]
@@ -118,7 +132,7 @@ class TTSService:
             return voice_list
             
         except Exception as e:
-            print(f"[TTS] Error obteniendo voces: {e}")
+            logger.warning("[TTS] Error obteniendo voces: %s", e)
             return []
 
 # Instancia global
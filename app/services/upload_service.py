@@ -13,7 +13,6 @@ import json
 import logging
 from typing import Optional
 from fastapi import UploadFile, HTTPException, status
-from PIL import Image
 
 from app.core.config import settings
 
@@ -68,6 +67,8 @@ def upload_product_image_gcs(
     - Convierte a JPEG calidad 85.
     - Borra cualquier blob anterior del mismo producto.
     """
+    from PIL import Image  # diferido: sólo lo usan las subidas
+
     img = Image.open(io.BytesIO(file_bytes))
     img.thumbnail((800, 800), Image.Resampling.LANCZOS)
     if img.mode in ('RGBA', 'LA', 'P'):
@@ -188,6 +189,8 @@ class UploadService:
     
     async def _optimize_image(self, file_content: bytes, max_size: tuple = (800, 800)) -> bytes:
         """Optimiza y redimensiona la imagen"""
+        from PIL import Image
+
         try:
             image = Image.open(io.BytesIO(file_content))
             
@@ -7,6 +7,8 @@ from typing import Optional, Dict
 from fastapi import HTTPException, status
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 
 class ApisNetPe:
     """Cliente para APIs.net.pe"""
@@ -16,12 +18,12 @@ class ApisNetPe:
         self._api_url = "https://api.decolecta.com"
         
         if not self._api_token:
-            logging.error("CRITICAL: ApisNetPe Client configured WITHOUT token!")
+            logger.error("CRITICAL: ApisNetPe Client configured WITHOUT token!")
 
     def _get(self, path: str, params: dict) -> Optional[dict]:
         """Método genérico para hacer peticiones GET"""
         if not self._api_token:
-            logging.error("API Token for apis.net.pe is missing.")
+            logger.error("API Token for apis.net.pe is missing.")
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="External API service not configured."
@@ -33,15 +35,8 @@ class ApisNetPe:
             "Referer": "https://quevendi.pro",
         }
 
-        # Después de crear headers
-        print(f"\n=== DEBUG API CALL ===")
-        print(f"URL: {url}")
-        print(f"TOKEN: |{self._api_token}|")
-        print(f"HEADER: {headers}")
-        print(f"PARAMS: {params}")
-        print("=" * 50 + "\n")
-
-        logging.info(f"Calling APIs.net.pe: {url} with params: {params}")
+        # Nunca loguear `headers`: llevan el token
+        logger.debug("Calling APIs.net.pe: %s with params: %s", url, params)
 
         try:
             response = requests.get(url, headers=headers, params=params, timeout=10)
@@ -49,7 +44,7 @@ class ApisNetPe:
             return response.json()
         
         except requests.exceptions.HTTPError as http_err:
-            logging.warning(f"HTTP error from apis.net.pe: {http_err}")
+            logger.warning("HTTP error from apis.net.pe: %s", http_err)
             detail = "Error consulting external service."
             try:
                 error_response = http_err.response.json()
@@ -60,7 +55,7 @@ class ApisNetPe:
             raise HTTPException(status_code=http_err.response.status_code, detail=detail)
         
         except requests.exceptions.RequestException as req_err:
-            logging.error(f"Network error connecting to apis.net.pe: {req_err}")
+            logger.error("Network error connecting to apis.net.pe: %s", req_err)
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE, 
                 detail="Could not connect to external service."
@@ -103,9 +98,7 @@ class ValidationService:
         try:
             person_data = self.api_client.get_person(dni)
 
-            # ========== DEBUG ==========
-            print(f"\n🔍 PERSON_DATA RECIBIDO: {person_data}\n")
-            # ===========================
+            logger.debug("[Validation] PERSON_DATA recibido: %s", person_data)
             
             if not person_data:
                 raise HTTPException(
@@ -133,7 +126,7 @@ class ValidationService:
         except HTTPException:
             raise
         except Exception as e:
-            logging.error(f"Error validating DNI {dni}: {str(e)}")
+            logger.error("Error validating DNI %s: %s", dni, e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error al validar DNI"
@@ -163,9 +156,7 @@ class ValidationService:
         try:
             company_data = self.api_client.get_company(ruc)
 
-            # ========== DEBUG ==========
-            print(f"\n🔍 COMPANY_DATA RECIBIDO: {company_data}\n")
-            # ===========================
+            logger.debug("[Validation] COMPANY_DATA recibido: %s", company_data)
             
             if not company_data:
                 raise HTTPException(
@@ -201,7 +192,7 @@ class ValidationService:
         except HTTPException:
             raise
         except Exception as e:
-            logging.error(f"Error validating RUC {ruc}: {str(e)}")
+            logger.error("Error validating RUC %s: %s", ruc, e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error al validar RUC"
@@ -0,0 +1,232 @@
+"""
+QueVendi — Caché de respuestas del LLM para comandos de voz
+===========================================================
+
+La mayoría de los comandos que llegan a /voice/parse-llm se repiten
+("dos inca kola", "un kilo de arroz"). El LLM sólo extrae nombres y
+cantidades del texto, así que para el mismo texto corregido la respuesta
+sirve para cualquier tienda y no hace falta volver a pagarla.
+
+Clave: salida de `corregir_transcript` normalizada (sin tildes, espacios
+colapsados) + versión del prompt. Si cambia SYSTEM_PROMPT, las entradas
+viejas dejan de coincidir solas.
+
+Dos niveles:
+
+  1. Memoria: LRU con TTL por proceso (VOICE_CACHE_MAX_ENTRADAS).
+  2. VoiceCommandLog (opcional, VOICE_CACHE_PERSISTENTE): cada parseo
+     exitoso del LLM ya se registra ahí con `parsed_result.cache_key`; un
+     worker recién arrancado o que nunca vio el comando lo encuentra por
+     el índice de expresión sobre esa clave y lo sube a memoria.
+
+Cada hit suma en `stats()` la latencia y el costo que tuvo la llamada
+original al LLM: es lo que ese hit se ahorró.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core import schema
+from app.core.config import settings
+from app.services.llm_service import SYSTEM_PROMPT, LLMResult
+from app.services.search_index import normalizar
+
+logger = logging.getLogger(__name__)
+
+PROMPT_VERSION = hashlib.sha1(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:8]
+
+# `api_used` de los comandos servidos desde la caché. Esos registros no
+# se reutilizan como fuente del nivel persistente.
+API_CACHE = "cache"
+
+
+# Índice de expresión del nivel persistente. CONCURRENTLY, por la tarea
+# schema_indices: voice_commands_log crece con cada comando y un build
+# normal frenaría los INSERT del log (y al primer /voice/parse-llm).
+INDICE_CACHE = "idx_voice_log_cache_key"
+schema.registrar_indice(
+    INDICE_CACHE,
+    "ON voice_commands_log ((parsed_result->>'cache_key'), created_at DESC)"
+    " WHERE success = TRUE AND api_used <> 'cache'",
+)
+
+# Hasta que el índice esté válido se vuelve a mirar cada tanto
+TTL_INDICE_SEGUNDOS = 300
+_indice_listo: Tuple[bool, float] = (False, float("-inf"))
+
+
+def _ensure_schema(db: Session) -> bool:
+    """Índice del nivel persistente; sin él el nivel queda deshabilitado."""
+    global _indice_listo
+    if _indice_listo[0]:
+        return True
+    if time.monotonic() - _indice_listo[1] < TTL_INDICE_SEGUNDOS:
+        return False
+    ok = False
+    try:
+        ok = schema.indices_validos([INDICE_CACHE])
+    except Exception as e:
+        logger.warning(f"[VoiceCache] No se pudo verificar el índice: {e}")
+    _indice_listo = (ok, time.monotonic())
+    return ok
+
+
+def cache_key(transcript_corregido: str) -> str:
+    """'Dos  Inca Kola!' → '<prompt>:dos inca kola'."""
+    t = normalizar(transcript_corregido)
+    t = re.sub(r"[¡!¿?.,;:]+", " ", t)
+    t = " ".join(t.split())
+    return f"{PROMPT_VERSION}:{t}"
+
+
+@dataclass
+class CacheHit:
+    """Respuesta servida desde la caché"""
+    products: List[Dict]
+    nivel: str              # 'memoria' | 'bd'
+    provider: str           # LLM que la generó originalmente
+    ms_ahorrados: int       # latencia de esa llamada original
+    usd_ahorrados: float
+    lookup_ms: int
+
+
+@dataclass
+class _Entrada:
+    products: List[Dict]
+    provider: str
+    latency_ms: int
+    cost_usd: float
+    guardado_en: float
+
+
+class VoiceCache:
+    """LRU + TTL en memoria, con respaldo en VoiceCommandLog."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[str, _Entrada]" = OrderedDict()
+        self._stats = {
+            "hits_memoria": 0,
+            "hits_bd": 0,
+            "misses": 0,
+            "ms_ahorrados": 0,
+            "usd_ahorrados": 0.0,
+        }
+
+    @property
+    def ttl_segundos(self) -> int:
+        return settings.VOICE_CACHE_TTL_HORAS * 3600
+
+    def get(self, db: Session, key: str) -> Optional[CacheHit]:
+        """Respuesta cacheada, o None si hay que llamar al LLM."""
+        inicio = time.monotonic()
+        entrada = self._get_memoria(key)
+        nivel = "memoria"
+        if entrada is None and settings.VOICE_CACHE_PERSISTENTE:
+            entrada = self._get_bd(db, key)
+            nivel = "bd"
+            if entrada is not None:
+                self._guardar(key, entrada)
+
+        with self._lock:
+            if entrada is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats[f"hits_{nivel}"] += 1
+            self._stats["ms_ahorrados"] += entrada.latency_ms
+            self._stats["usd_ahorrados"] += entrada.cost_usd
+
+        return CacheHit(
+            products=entrada.products,
+            nivel=nivel,
+            provider=entrada.provider,
+            ms_ahorrados=entrada.latency_ms,
+            usd_ahorrados=entrada.cost_usd,
+            lookup_ms=int((time.monotonic() - inicio) * 1000),
+        )
+
+    def put(self, key: str, llm: LLMResult) -> None:
+        """Guardar una respuesta del LLM (sólo si extrajo algo)."""
+        if not llm.products:
+            return
+        self._guardar(key, _Entrada(
+            products=llm.products,
+            provider=llm.provider,
+            latency_ms=llm.latency_ms,
+            cost_usd=llm.cost_usd,
+            guardado_en=time.monotonic(),
+        ))
+
+    def _guardar(self, key: str, entrada: _Entrada) -> None:
+        with self._lock:
+            self._entradas.pop(key, None)
+            self._entradas[key] = entrada
+            while len(self._entradas) > settings.VOICE_CACHE_MAX_ENTRADAS:
+                self._entradas.popitem(last=False)
+
+    def _get_memoria(self, key: str) -> Optional[_Entrada]:
+        with self._lock:
+            entrada = self._entradas.get(key)
+            if entrada is None:
+                return None
+            if time.monotonic() - entrada.guardado_en > self.ttl_segundos:
+                del self._entradas[key]
+                return None
+            self._entradas.move_to_end(key)
+            return entrada
+
+    def _get_bd(self, db: Session, key: str) -> Optional[_Entrada]:
+        if not _ensure_schema(db):
+            return None
+        try:
+            row = db.execute(text("""
+                SELECT parsed_result, api_used, latency_ms, cost_usd
+                FROM voice_commands_log
+                WHERE parsed_result->>'cache_key' = :key
+                  AND success = TRUE AND api_used <> 'cache'
+                  AND created_at > now() - make_interval(hours => :horas)
+                ORDER BY created_at DESC
+                LIMIT 1
+            """), {"key": key, "horas": settings.VOICE_CACHE_TTL_HORAS}).first()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[VoiceCache] Error leyendo VoiceCommandLog: {e}")
+            return None
+        if row is None:
+            return None
+        parsed = row.parsed_result or {}
+        products = parsed.get("items") or []
+        if not products:
+            return None
+        return _Entrada(
+            products=products,
+            provider=row.api_used,
+            latency_ms=(parsed.get("llm") or {}).get("latency_ms") or row.latency_ms or 0,
+            cost_usd=row.cost_usd or 0.0,
+            guardado_en=time.monotonic(),
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["entradas"] = len(self._entradas)
+        consultas = s["hits_memoria"] + s["hits_bd"] + s["misses"]
+        s["hit_rate"] = round((s["hits_memoria"] + s["hits_bd"]) / consultas, 4) if consultas else 0.0
+        s["usd_ahorrados"] = round(s["usd_ahorrados"], 6)
+        return s
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+
+
+voice_cache = VoiceCache()
@@ -0,0 +1,212 @@
+"""
+QueVendi — Gramática local para comandos de voz
+===============================================
+
+Primer nivel de /voice/parse-llm: antes de pagar una llamada a un LLM se
+intenta parsear el transcript con una gramática determinística para las
+formas simples, que son la mayoría:
+
+    "dos inca kola y un pan"            → [2 inca kola, 1 pan]
+    "medio kilo de arroz"               → [0.5 kg arroz]
+    "uno y medio de azucar, tres panes" → [1.5 azucar, 3 panes]
+    "2 soles de papa" / "papa por 2 soles" → [monto 2 papa]
+
+Devuelve los items en el mismo formato que el LLM ({nombre, cantidad,
+unidad, monto}) y una confianza 0-1. Cualquier cosa fuera de la
+gramática (quitar, cambiar, precios, negaciones, frases largas) baja la
+confianza a 0 y el comando sigue al LLM. El endpoint además exige que
+cada item tenga candidatos en el catálogo de la tienda.
+
+Cantidades, fracciones y palabras de comando salen de VoiceService, así
+que esta gramática y el parser de /sales/voice/parse hablan el mismo
+idioma.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.services.search_index import normalizar
+from app.services.voice_service import VoiceService
+
+SEPARADORES = {"y", "mas", "tambien", "ademas"}
+
+# Al inicio de un item: "dame", "quiero", "ponme" no aportan nada
+RELLENO = {
+    "dame", "deme", "quiero", "queria", "ponme", "poneme", "pon", "vende",
+    "vendeme", "agrega", "agregame", "anade", "anademe", "me", "das", "da", "porfa",
+    "por", "favor",
+}
+ARTICULOS = {"de", "del", "la", "el", "los", "las"}
+
+UNIDADES = {
+    "kilo": "kg", "kilos": "kg", "kg": "kg", "kgs": "kg",
+    "gramo": "g", "gramos": "g", "gr": "g",
+    "litro": "litro", "litros": "litro", "lt": "litro",
+    "unidad": "unidad", "unidades": "unidad", "und": "unidad",
+    "paquete": "paquete", "paquetes": "paquete",
+    "bolsa": "bolsa", "bolsas": "bolsa",
+    "botella": "botella", "botellas": "botella",
+    "lata": "lata", "latas": "lata",
+    "caja": "caja", "cajas": "caja",
+    "docena": "docena", "docenas": "docena",
+}
+
+# Palabras que la gramática no sabe interpretar: el comando va al LLM
+ESCALAR = {
+    "no", "sin", "precio", "cuanto", "cuesta", "vale", "otro", "otra", "otros",
+    "otras", "mejor", "pero", "solo", "menos", "cambia", "cambiar", "quita",
+    "quitar", "saca", "sacar", "borra", "borrar", "elimina", "eliminar",
+    "cancela", "cancelar", "anular", "listo", "total", "confirmar", "cobra",
+}
+
+MAX_PALABRAS_PRODUCTO = 4
+
+# Más largas primero: 'un cuarto' antes que 'cuarto'
+_FRACCIONES = sorted(
+    ((tuple(normalizar(k).split()), v) for k, v in VoiceService.FRACTIONS.items()),
+    key=lambda x: -len(x[0]),
+)
+_NUMEROS = {normalizar(k): v for k, v in VoiceService.NUMBERS.items()}
+
+
+@dataclass
+class ParseLocal:
+    """Resultado de la gramática local"""
+    items: List[Dict] = field(default_factory=list)
+    confianza: float = 0.0
+    motivo: Optional[str] = None      # por qué no alcanzó (para el log)
+
+
+def _tokens(texto: str) -> List[str]:
+    t = normalizar(texto).replace(",", " y ")
+    return re.findall(r"\d+(?:[./]\d+)?[a-z]*|[a-z]+", t)
+
+
+def _numero(token: str) -> Optional[float]:
+    if token in _NUMEROS:
+        return float(_NUMEROS[token])
+    if re.fullmatch(r"\d+(?:\.\d+)?", token):
+        return float(token)
+    m = re.fullmatch(r"(\d+)/(\d+)", token)
+    if m and int(m.group(2)):
+        return int(m.group(1)) / int(m.group(2))
+    return None
+
+
+def _fraccion(tokens: List[str], i: int) -> Tuple[Optional[float], int]:
+    """Fracción que empieza en tokens[i] ('medio', 'tres cuartos') y tokens consumidos."""
+    for palabras, valor in _FRACCIONES:
+        if tuple(tokens[i:i + len(palabras)]) == palabras:
+            return valor, len(palabras)
+    return None, 0
+
+
+def _cantidad(tokens: List[str]) -> Tuple[Optional[float], int]:
+    """Cantidad al inicio del item y tokens consumidos."""
+    fraccion, n = _fraccion(tokens, 0)
+    if fraccion is not None:
+        return fraccion, n
+    if not tokens:
+        return None, 0
+    base = _numero(tokens[0])
+    if base is None:
+        return None, 0
+    # "uno y medio", "dos y cuarto"
+    if len(tokens) > 2 and tokens[1] == "y":
+        fraccion, n = _fraccion(tokens, 2)
+        if fraccion is not None:
+            return base + fraccion, 2 + n
+    # "dos cincuenta" (kilos)
+    if len(tokens) > 1 and tokens[1] == "cincuenta" and base < 20:
+        return base + 0.5, 2
+    return base, 1
+
+
+def _segmentos(tokens: List[str]) -> List[List[str]]:
+    """Separar items por 'y'/'mas', salvo 'uno y medio'."""
+    segmentos, actual = [], []
+    for i, tok in enumerate(tokens):
+        es_fraccion = (
+            tok == "y" and actual and _numero(actual[-1]) is not None
+            and _fraccion(tokens, i + 1)[0] is not None
+        )
+        if tok in SEPARADORES and not es_fraccion:
+            if actual:
+                segmentos.append(actual)
+            actual = []
+        else:
+            actual.append(tok)
+    if actual:
+        segmentos.append(actual)
+    return segmentos
+
+
+def _item(tokens: List[str]) -> Tuple[Optional[Dict], float, Optional[str]]:
+    """Un item: [cantidad] [unidad] [de] producto, o con monto en soles."""
+    while tokens and tokens[0] in RELLENO:
+        tokens = tokens[1:]
+
+    monto = None
+    # "2 soles de papa", "dame 2 soles en papa"
+    if len(tokens) > 2 and _numero(tokens[0]) is not None and tokens[1] in ("sol", "soles") \
+            and tokens[2] in ("de", "en"):
+        monto, tokens = _numero(tokens[0]), tokens[3:]
+    # "papa por 2 soles"
+    elif len(tokens) > 3 and tokens[-1] in ("sol", "soles") and tokens[-3] == "por" \
+            and _numero(tokens[-2]) is not None:
+        monto, tokens = _numero(tokens[-2]), tokens[:-3]
+
+    cantidad, n = (None, 0) if monto is not None else _cantidad(tokens)
+    tokens = tokens[n:]
+    confianza = 1.0 if (cantidad is not None or monto is not None) else 0.9
+
+    unidad = None
+    if tokens and tokens[0] in UNIDADES:
+        unidad = UNIDADES[tokens[0]]
+        tokens = tokens[1:]
+    while tokens and tokens[0] in ARTICULOS:
+        tokens = tokens[1:]
+
+    if not tokens:
+        return None, 0.0, "item sin producto"
+    if any(t in ("sol", "soles") for t in tokens):
+        return None, 0.0, "monto fuera de patrón"
+    if len(tokens) > MAX_PALABRAS_PRODUCTO:
+        return None, 0.0, "producto demasiado largo"
+    if any(_numero(t) is not None and t not in _NUMEROS for t in tokens[1:]):
+        # "arroz 2": la cantidad quedó después del producto
+        confianza -= 0.3
+
+    return {
+        "nombre": " ".join(tokens),
+        "cantidad": None if monto is not None else (cantidad if cantidad is not None else 1.0),
+        "unidad": unidad,
+        "monto": monto,
+    }, confianza, None
+
+
+def parse_local(transcript: str) -> ParseLocal:
+    """
+    Parsear con la gramática local. `confianza` 0 significa que el texto
+    no es de la forma "N producto y M producto" y hay que escalar.
+    """
+    tokens = _tokens(transcript)
+    if not tokens:
+        return ParseLocal(motivo="vacío")
+
+    escalar = ESCALAR.intersection(tokens)
+    if escalar:
+        return ParseLocal(motivo=f"palabras de comando: {sorted(escalar)}")
+
+    resultado = ParseLocal(confianza=1.0)
+    for segmento in _segmentos(tokens):
+        item, confianza, motivo = _item(segmento)
+        if item is None:
+            return ParseLocal(motivo=motivo)
+        resultado.items.append(item)
+        resultado.confianza = min(resultado.confianza, confianza)
+
+    if not resultado.items:
+        return ParseLocal(motivo="sin items")
+    return resultado
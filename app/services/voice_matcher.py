@@ -0,0 +1,203 @@
+"""
+QueVendi — Matching de productos para comandos de voz
+=====================================================
+
+`VoiceService.find_product_fuzzy` y el endpoint /voice/parse-llm
+puntuaban cada producto, cada alias y cada variante singular/plural en
+bucles Python anidados, normalizando el nombre y corriendo
+`SequenceMatcher` en cada vuelta: un "2 cocas y un pan" en una tienda de
+2000 productos eran decenas de miles de comparaciones por comando.
+
+Aquí el catálogo de la tienda se precomputa UNA vez como lista de
+opciones normalizadas (nombres + aliases, con el producto dueño de cada
+una) y para TODAS las variantes de TODOS los items del comando:
+
+  - "contiene": un `str.find` sobre el blob con todas las opciones
+    separadas por salto de línea. Todos los niveles de score (exacto,
+    prefijo, palabra, contiene) implican que la variante está contenida
+    en el nombre o alias, así que fuera de estos candidatos el score es 0.
+  - similitud (errores de transcripción: 'galyeta'): una sola llamada a
+    `rapidfuzz.process.cdist` variantes × nombres, con `score_cutoff`.
+
+Sólo los pares candidatos pasan por la función de score del llamador,
+que conserva sus reglas (y sus umbrales de ambigüedad) intactas.
+
+CACHÉ
+-----
+La lista de opciones se guarda por tienda junto con una huella
+(id, is_active, updated_at) de los productos con que se armó. Si el
+llamador trae otra lista (producto nuevo, editado o desactivado) se
+reconstruye. Los objetos Product no se guardan: el ranking se devuelve
+sobre la lista que pasa el llamador, con stock y precio frescos.
+"""
+
+import bisect
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.services.search_index import normalizar
+
+logger = logging.getLogger(__name__)
+
+# score_fn(variante, opcion, es_alias, similitud) -> score.
+# `similitud` es fuzz.ratio (0-100) contra el nombre, o 0 si no se pidió
+# o no superó el corte.
+ScoreFn = Callable[[str, str, bool, float], float]
+
+
+def _aliases(product) -> List[str]:
+    """Aliases normalizados; el campo puede venir como lista o 'a, b'."""
+    aliases = getattr(product, "aliases", None)
+    if not aliases:
+        return []
+    if isinstance(aliases, str):
+        aliases = aliases.split(",")
+    return [a for a in (normalizar(str(x)) for x in aliases) if a]
+
+
+def _huella(productos: Sequence[Any]) -> Tuple:
+    return tuple(
+        (getattr(p, "id", None), getattr(p, "is_active", True), getattr(p, "updated_at", None))
+        for p in productos
+    )
+
+
+class CatalogoVoz:
+    """Opciones normalizadas (nombres y aliases) de una lista de productos."""
+
+    def __init__(self, productos: Sequence[Any]):
+        self.huella = _huella(productos)
+        self.opciones: List[str] = []
+        self.duenos: List[int] = []          # opción → posición en `productos`
+        self.es_alias: List[bool] = []
+        self._nombres: List[int] = []        # opciones que son nombre
+
+        for i, p in enumerate(productos):
+            if not getattr(p, "is_active", True):
+                continue
+            nombre = normalizar(getattr(p, "name", None))
+            if nombre:
+                self._nombres.append(len(self.opciones))
+                self._agregar(i, nombre, False)
+            for alias in _aliases(p):
+                self._agregar(i, alias, True)
+
+        self._textos_nombre = [self.opciones[j] for j in self._nombres]
+        self._inicios: List[int] = []
+        pos = 0
+        for texto in self.opciones:
+            self._inicios.append(pos)
+            pos += len(texto) + 1
+        self._blob = "\n".join(self.opciones)
+
+    def __len__(self) -> int:
+        return len(self.opciones)
+
+    def _agregar(self, dueno: int, texto: str, es_alias: bool) -> None:
+        self.opciones.append(" ".join(texto.split()))
+        self.duenos.append(dueno)
+        self.es_alias.append(es_alias)
+
+    def _contienen(self, q: str) -> Iterable[int]:
+        """Índices de las opciones que contienen `q` (un barrido del blob)."""
+        inicio = self._blob.find(q)
+        while inicio != -1:
+            j = bisect.bisect_right(self._inicios, inicio) - 1
+            fin_opcion = self._inicios[j] + len(self.opciones[j])
+            if inicio + len(q) <= fin_opcion:
+                yield j
+                siguiente = fin_opcion + 1
+            else:
+                siguiente = inicio + 1
+            inicio = self._blob.find(q, siguiente)
+
+    def candidatos(self, consultas: Sequence[str],
+                   similitud_minima: Optional[float] = None) -> List[Dict[int, float]]:
+        """
+        Para cada consulta, {opción: similitud} de las opciones que la
+        contienen y, con `similitud_minima`, de los nombres con
+        fuzz.ratio >= similitud_minima. Una sola llamada a cdist para
+        todas las consultas.
+        """
+        resultado: List[Dict[int, float]] = [
+            {j: 0.0 for j in self._contienen(q)} if q and "\n" not in q else {}
+            for q in consultas
+        ]
+        if similitud_minima is not None and consultas and self._textos_nombre:
+            # rapidfuzz diferido: importa pandas (~250 ms) y el arranque
+            # no lo necesita; arranque.precalentar lo trae en segundo plano
+            from rapidfuzz import fuzz, process
+
+            matriz = process.cdist(
+                consultas, self._textos_nombre,
+                scorer=fuzz.ratio, processor=None,
+                score_cutoff=similitud_minima,
+            )
+            filas, columnas = matriz.nonzero()
+            for fila, col in zip(filas.tolist(), columnas.tolist()):
+                resultado[fila][self._nombres[col]] = float(matriz[fila, col])
+        return resultado
+
+    def puntuar(self, items: Sequence[Iterable[str]], score_fn: ScoreFn,
+                similitud_minima: Optional[float] = None) -> List[List[Tuple[int, float]]]:
+        """
+        Ranking por item: [(posición del producto, mejor score)] con
+        score > 0, de mayor a menor (empates en el orden de `productos`).
+
+        `items` trae, por item del comando, sus variantes de búsqueda.
+        """
+        variantes_items = [sorted({normalizar(v) for v in vs} - {""}) for vs in items]
+        planas = [v for vs in variantes_items for v in vs]
+        por_variante = self.candidatos(planas, similitud_minima)
+
+        rankings: List[List[Tuple[int, float]]] = []
+        k = 0
+        for vs in variantes_items:
+            mejores: Dict[int, float] = {}
+            for v in vs:
+                for j, similitud in por_variante[k].items():
+                    score = score_fn(v, self.opciones[j], self.es_alias[j], similitud)
+                    if score > 0:
+                        dueno = self.duenos[j]
+                        if score > mejores.get(dueno, 0):
+                            mejores[dueno] = score
+                k += 1
+            rankings.append(sorted(mejores.items(), key=lambda x: (-x[1], x[0])))
+        return rankings
+
+
+_catalogos: Dict[Any, CatalogoVoz] = {}
+_lock = threading.Lock()
+
+
+def obtener_catalogo(productos: Sequence[Any], store_id: Optional[int] = None) -> CatalogoVoz:
+    """Catálogo cacheado por tienda; se reconstruye si la lista cambió."""
+    if store_id is None and productos:
+        store_id = getattr(productos[0], "store_id", None)
+    huella = _huella(productos)
+    catalogo = _catalogos.get(store_id)
+    if catalogo is not None and catalogo.huella == huella:
+        return catalogo
+    catalogo = CatalogoVoz(productos)
+    with _lock:
+        _catalogos[store_id] = catalogo
+    logger.debug(f"[VoiceMatcher] Catálogo tienda {store_id}: {len(catalogo)} opciones")
+    return catalogo
+
+
+def emparejar(productos: Sequence[Any], items: Sequence[Iterable[str]], score_fn: ScoreFn,
+              similitud_minima: Optional[float] = None,
+              store_id: Optional[int] = None) -> List[List[Tuple[Any, float]]]:
+    """
+    Empareja todos los items de un comando contra `productos` de una vez.
+
+    Devuelve, por item, [(producto, score)] de mayor a menor score.
+    """
+    if not productos or not items:
+        return [[] for _ in items]
+    catalogo = obtener_catalogo(productos, store_id)
+    return [
+        [(productos[i], score) for i, score in ranking]
+        for ranking in catalogo.puntuar(items, score_fn, similitud_minima)
+    ]
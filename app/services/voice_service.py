@@ -1,13 +1,104 @@
+import logging
 import re
-from typing import Dict, List, Optional
-from difflib import SequenceMatcher
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
 from app.models.product import Product
+from app.services import voice_matcher
 import unicodedata
 
-class VoiceService:
+logger = logging.getLogger(__name__)
+
+# Cuántas opciones se muestran cuando el producto es ambiguo
+MAX_AMBIGUOUS_OPTIONS = 4
+
+# Tiempo que se recuerda una ambigüedad para resolverla con "el segundo"
+AMBIGUITY_TTL_SECONDS = 120
+AMBIGUITY_MAX_SESSIONS = 5000
+
+
+@dataclass
+class MatchResult:
+    """
+    Resultado de find_product_fuzzy para UNA consulta.
     
-    # Variable de clase para opciones ambiguas
-    _last_ambiguous_options = []
+    - product: el ganador si el match es claro, None si no hay o es ambiguo
+    - ranked: [(producto, score)] con score >= 60, de mayor a menor
+    - ambiguous: más de un producto con score >= 90
+    """
+    query: str
+    product: Optional[Product] = None
+    ranked: List[Tuple[Product, float]] = field(default_factory=list)
+    ambiguous: bool = False
+
+    @property
+    def options(self) -> List[Product]:
+        """Opciones para que el usuario elija (vacío si no es ambiguo)"""
+        if not self.ambiguous:
+            return []
+        return [p for p, _ in self.ranked[:MAX_AMBIGUOUS_OPTIONS]]
+
+    @property
+    def score(self) -> float:
+        return self.ranked[0][1] if self.ranked else 0.0
+
+
+@dataclass
+class PendingAmbiguity:
+    """
+    Comando que quedó esperando que el usuario elija una opción.
+    
+    - parsed: comando parseado original (sólo con los items pendientes)
+    - options: {clave de la consulta: ids en el orden mostrado}
+    - resolved: {clave de la consulta: id elegido}
+    """
+    parsed: Dict
+    options: Dict[str, List[int]]
+    resolved: Dict[str, int] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.monotonic)
+
+    def next_key(self) -> Optional[str]:
+        """Primera consulta todavía sin resolver"""
+        return next(iter(self.options), None)
+
+
+class AmbiguityCache:
+    """
+    Ambigüedades pendientes por sesión de voz, con TTL.
+    
+    La sesión es (store_id, user_id, session_id): nunca se comparten
+    opciones entre tiendas ni entre cajeros. Un "el segundo" resuelve la
+    ambigüedad con los ids guardados, sin volver a puntuar el catálogo.
+    """
+
+    def __init__(self, ttl: float = AMBIGUITY_TTL_SECONDS, max_sessions: int = AMBIGUITY_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, PendingAmbiguity]" = OrderedDict()
+
+    def put(self, session_key: Tuple, pending: PendingAmbiguity) -> None:
+        with self._lock:
+            self._entries.pop(session_key, None)
+            self._entries[session_key] = pending
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def pop(self, session_key: Tuple) -> Optional[PendingAmbiguity]:
+        with self._lock:
+            pending = self._entries.pop(session_key, None)
+        if pending is None or time.monotonic() - pending.created_at > self.ttl:
+            return None
+        return pending
+
+    def discard(self, session_key: Tuple) -> None:
+        with self._lock:
+            self._entries.pop(session_key, None)
+
+
+class VoiceService:
     
     FRACTIONS = {
         'medio': 0.5, 'media': 0.5, 'un medio': 0.5, 'una media': 0.5,
@@ -25,6 +116,16 @@ class VoiceService:
         'veinte': 20, 'treinta': 30, 'cuarenta': 40, 'cincuenta': 50,
     }
     
+    # Respuestas para elegir una opción ambigua ("el segundo", "opción 3")
+    ORDINALS = {
+        'primero': 1, 'primera': 1, 'primer': 1,
+        'segundo': 2, 'segunda': 2,
+        'tercero': 3, 'tercera': 3, 'tercer': 3,
+        'cuarto': 4, 'cuarta': 4,
+        'ultimo': -1, 'ultima': -1,
+    }
+    SELECTION_FILLER = {'el', 'la', 'lo', 'opcion', 'numero', 'nro', 'ese', 'esa', 'este', 'esta'}
+    
     # Comandos especiales
     CANCEL_WORDS = ['cancelar', 'anular', 'borra todo', 'borrar todo', 'elimina todo']
     CONFIRM_WORDS = ['listo', 'total', 'confirmar', 'suma', 'cierra', 'terminar', 'dale', 'ok', 'vale', 'eso es todo']
@@ -38,7 +139,7 @@ class VoiceService:
         """Detectar tipo de comando"""
         text_lower = text.lower()
         
-        print(f"[VoiceService] detect_command_type: '{text_lower}'")
+        logger.debug("[VoiceService] detect_command_type: '%s'", text_lower)
         
         # Consulta de total
         if any(word in text_lower for word in VoiceService.QUERY_WORDS):
@@ -67,11 +168,11 @@ class VoiceService:
         
         # Venta por PRECIO objetivo - MÚLTIPLES PATRONES
         if re.search(r'\d+\s*soles?\s+de\s+', text_lower):
-            print(f"[VoiceService] ✅ Detectado sale_by_price (patrón: X soles de Y)")
+            logger.debug("[VoiceService] Detectado sale_by_price (patrón: X soles de Y)")
             return 'sale_by_price'
         
         if re.search(r'por\s+\d+\s*soles?', text_lower) and not any(word in text_lower for word in VoiceService.CHANGE_WORDS):
-            print(f"[VoiceService] ✅ Detectado sale_by_price (patrón: Y por X soles)")
+            logger.debug("[VoiceService] Detectado sale_by_price (patrón: Y por X soles)")
             return 'sale_by_price'
         
         if re.search(r'(?:dame|quiero)\s+\d+\s*soles?\s+(?:en|de)\s+', text_lower):
@@ -269,10 +370,10 @@ class VoiceService:
         """Parsear comando completo"""
         text = text.lower().strip()
         
-        print(f"[VoiceService] Parseando: '{text}'")
+        logger.debug("[VoiceService] Parseando: '%s'", text)
         
         command_type = VoiceService.detect_command_type(text)
-        print(f"[VoiceService] Tipo detectado: {command_type}")
+        logger.debug("[VoiceService] Tipo detectado: %s", command_type)
         
         if command_type == 'cancel':
             return {'type': 'cancel'}
@@ -286,7 +387,7 @@ class VoiceService:
         if command_type == 'sale_by_price':
             sale_data = VoiceService.parse_sale_by_price(text)
             if sale_data:
-                print(f"[VoiceService] Venta por precio: {sale_data}")
+                logger.debug("[VoiceService] Venta por precio: %s", sale_data)
                 return {
                     'type': 'sale_by_price',
                     **sale_data
@@ -295,7 +396,7 @@ class VoiceService:
         if command_type == 'change_product':
             product_change = VoiceService.parse_product_change(text)
             if product_change:
-                print(f"[VoiceService] Cambio de producto: {product_change}")
+                logger.debug("[VoiceService] Cambio de producto: %s", product_change)
                 return {
                     'type': 'change_product',
                     **product_change
@@ -304,7 +405,7 @@ class VoiceService:
         if command_type == 'change_price':
             price_change = VoiceService.parse_price_change(text)
             if price_change:
-                print(f"[VoiceService] Cambio de precio: {price_change}")
+                logger.debug("[VoiceService] Cambio de precio: %s", price_change)
                 return {
                     'type': 'change_price',
                     **price_change,
@@ -330,7 +431,7 @@ class VoiceService:
         if command_type == 'remove':
             product_query = VoiceService.parse_remove(text)
             if product_query:
-                print(f"[VoiceService] Eliminar: {product_query}")
+                logger.debug("[VoiceService] Eliminar: %s", product_query)
                 return {
                     'type': 'remove',
                     'product_query': product_query
@@ -362,7 +463,7 @@ class VoiceService:
         if not items:
             return None
         
-        print(f"[VoiceService] Items parseados: {len(items)}")
+        logger.debug("[VoiceService] Items parseados: %s", len(items))
         return {
             'type': action,
             'items': items
@@ -392,7 +493,7 @@ class VoiceService:
         if not product_query:
             return None
         
-        print(f"[VoiceService]   - cantidad={quantity}, producto='{product_query}'")
+        logger.debug("[VoiceService]   - cantidad=%s, producto='%s'", quantity, product_query)
         
         return {
             'quantity': quantity,
@@ -400,12 +501,51 @@ class VoiceService:
         }
     
     @staticmethod
-    def find_product_fuzzy(query: str, products: List[Product]) -> Optional[Product]:
+    def _score_opcion(q: str, opcion: str, es_alias: bool, similitud: float) -> float:
+        """
+        Score de una variante contra un nombre o alias ya normalizado
+        """
+        scores = []
+        if es_alias:
+            # ESTRATEGIA 3: Aliases
+            if q == opcion: scores.append(100)
+            elif opcion.startswith(q): scores.append(90)
+            elif q in opcion: scores.append(70)
+            return max(scores) if scores else 0
+        
+        # ESTRATEGIA 1: Palabras individuales (La más efectiva)
+        for word in opcion.split():
+            clean_word = word.strip('.,;:()[]{}')
+            if q == clean_word:
+                scores.append(100)
+            elif clean_word.startswith(q) and len(q) >= 4:
+                scores.append(90)
+        
+        # ESTRATEGIA 2: Frase completa
+        if q == opcion:
+            scores.append(100)
+        elif opcion.startswith(q):
+            scores.append(85)
+        elif q in opcion:
+            scores.append(60)
+        
+        # Similarity (errores de transcripción: galyeta), fuzz.ratio 0-100
+        if similitud > 80:
+            scores.append(similitud)
+        
+        return max(scores) if scores else 0
+    
+    @staticmethod
+    def find_product_fuzzy(query: str, products: List[Product]) -> MatchResult:
         """
         Buscar producto con fuzzy matching mejorado (Plurales y prefijos)
+        
+        Devuelve un MatchResult: ganador, ranking con scores y si hay
+        ambigüedad (en cuyo caso `product` es None y `options` trae el top 4).
         """
+        result = MatchResult(query=query)
         if not products:
-            return None
+            return result
         
         # 1. Normalizar query
         query = VoiceService.normalize_text(query.lower().strip())
@@ -423,94 +563,63 @@ class VoiceService:
         queries = {q for q in queries if len(q) > 2}
         if not queries: queries = {query}
 
-        print(f"[VoiceService] 🔍 Buscando variantes: {queries}")
-        
-        matches = []
-        
-        for product in products:
-            if not product.is_active:
-                continue
-            
-            # Normalizar nombre del producto
-            product_name = VoiceService.normalize_text(product.name.lower())
-            
-            scores = []
-            
-            # ---------------------------------------------------------
-            # ESTRATEGIA 1: Palabras individuales (La más efectiva)
-            # ---------------------------------------------------------
-            words_in_name = product_name.split()
-            
-            for q in queries:
-                for word in words_in_name:
-                    # Limpiar puntuación de la palabra del producto
-                    clean_word = word.strip('.,;:()[]{}')
-                    
-                    # A. Coincidencia Exacta de palabra
-                    if q == clean_word:
-                        scores.append(100)
-                        # print(f"   MATCH EXACTO: {q} == {clean_word}")
-                    
-                    # B. La palabra del producto EMPIEZA con la query (galletas empieza con galleta)
-                    elif clean_word.startswith(q) and len(q) >= 4:
-                        scores.append(90) # Puntaje muy alto, casi seguro es lo que buscas
-                        # print(f"   MATCH INICIO: {clean_word} empieza con {q}")
-            
-            # ---------------------------------------------------------
-            # ESTRATEGIA 2: Frase completa
-            # ---------------------------------------------------------
-            for q in queries:
-                if q == product_name:
-                    scores.append(100)
-                elif product_name.startswith(q):
-                    scores.append(85)
-                elif q in product_name:
-                    scores.append(60) # Contiene, pero no al inicio ni palabra exacta
-                
-                # Similarity (Diferencias por errores de transcripción: galyeta)
-                similarity = SequenceMatcher(None, q, product_name).ratio()
-                if similarity > 0.8: # Solo si es muy parecido
-                    scores.append(similarity * 100)
-
-            # ---------------------------------------------------------
-            # ESTRATEGIA 3: Aliases
-            # ---------------------------------------------------------
-            if hasattr(product, 'aliases') and product.aliases:
-                aliases = []
-                if isinstance(product.aliases, list):
-                    aliases = [VoiceService.normalize_text(str(a).lower()) for a in product.aliases]
-                elif isinstance(product.aliases, str):
-                    aliases = [VoiceService.normalize_text(a.strip().lower()) for a in product.aliases.split(',')]
-                
-                for alias in aliases:
-                    for q in queries:
-                        if q == alias: scores.append(100)
-                        elif alias.startswith(q): scores.append(90)
-                        elif q in alias: scores.append(70)
-
-            # Evaluar mejor puntaje para este producto
-            max_score = max(scores) if scores else 0
-            
-            if max_score >= 60: # Umbral mínimo de confianza
-                matches.append((product, max_score))
+        logger.debug("[VoiceService] Buscando variantes: %s", queries)
+        
+        # Todas las variantes contra el catálogo precomputado de la tienda
+        # (ver voice_matcher); las reglas de score siguen en _score_opcion.
+        matches = voice_matcher.emparejar(
+            products, [queries], VoiceService._score_opcion, similitud_minima=80
+        )[0]
+        result.ranked = [(p, s) for p, s in matches if s >= 60]  # Umbral mínimo de confianza
 
-        # Ordenar resultados
-        matches.sort(key=lambda x: x[1], reverse=True)
-        
-        if matches:
-            best_product, best_score = matches[0]
-            print(f"[VoiceService] ✅ Ganador: '{best_product.name}' (Score: {best_score})")
+        if result.ranked:
+            best_product, best_score = result.ranked[0]
+            logger.debug("[VoiceService] Ganador: '%s' (Score: %s)", best_product.name, best_score)
             
             # Detección de ambigüedad
-            high_scores = [m for m in matches if m[1] >= 90]
+            high_scores = [m for m in result.ranked if m[1] >= 90]
             if len(high_scores) > 1:
-                print(f"[VoiceService] ⚠️ Ambigüedad detectada entre: {[p.name for p,s in high_scores[:3]]}")
-                VoiceService._last_ambiguous_options = [p for p,s in high_scores[:4]]
-                return None
+                logger.debug("[VoiceService] Ambigüedad detectada entre: %s", [p.name for p,s in high_scores[:3]])
+                result.ranked = high_scores
+                result.ambiguous = True
+                return result
                 
-            return best_product
+            result.product = best_product
+            return result
             
-        print(f"[VoiceService] ❌ No encontrado: '{query}'")
+        logger.debug("[VoiceService] No encontrado: '%s'", query)
+        return result
+    
+    @staticmethod
+    def parse_selection(text: str) -> Optional[int]:
+        """
+        Detectar la elección de una opción ambigua
+        'el segundo' → 1, 'opción 3' → 2, 'la última' → -1
+        
+        Devuelve el índice (base 0) o None si el texto no es una elección.
+        """
+        text = VoiceService.normalize_text(text.lower().strip())
+        words = re.findall(r'\w+', text)
+        has_filler = any(w in VoiceService.SELECTION_FILLER for w in words)
+        words = [w for w in words if w not in VoiceService.SELECTION_FILLER]
+        if len(words) != 1:
+            return None
+        
+        word = words[0]
+        if word in VoiceService.ORDINALS:
+            n = VoiceService.ORDINALS[word]
+        elif word.isdigit():
+            n = int(word)
+        elif has_filler and word in VoiceService.NUMBERS:
+            # "la dos" sí; "dos" solo puede ser una cantidad
+            n = VoiceService.NUMBERS[word]
+        else:
+            return None
+        
+        if n == -1:
+            return -1
+        if 1 <= n <= MAX_AMBIGUOUS_OPTIONS:
+            return n - 1
         return None
     
     import unicodedata
@@ -536,4 +645,8 @@ class VoiceService:
         )
         
         # Recomponer caracteres
-        return unicodedata.normalize('NFC', without_accents)
\ No newline at end of file
+        return unicodedata.normalize('NFC', without_accents)
+
+
+# Ambigüedades pendientes de todas las sesiones de voz del proceso
+ambiguity_cache = AmbiguityCache()
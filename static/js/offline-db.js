@@ -122,20 +122,31 @@ const OfflineDB = (() => {
 
         async syncFromServer(token, apiBase) {
             _requireInit();
-            const lastSync = await meta.get('products_last_sync');
-            const since = lastSync ? lastSync.value : null;
+            // Protocolo v2: versión del catálogo (seq) + ETag
+            const lastSeq = await meta.get('products_sync_seq');
+            const lastEtag = await meta.get('products_etag');
+            const sinceSeq = lastSeq ? lastSeq.value : null;
 
-            console.log(`[OfflineDB] Sync productos (emisor ${_emisorId}) desde: ${since || 'inicio'}`);
+            console.log(`[OfflineDB] Sync productos (emisor ${_emisorId}) desde seq: ${sinceSeq ?? 'inicio'}`);
 
-            const url = since
-                ? `${apiBase}/products/catalog?since=${encodeURIComponent(since)}`
+            const url = sinceSeq !== null
+                ? `${apiBase}/products/catalog?since_seq=${encodeURIComponent(sinceSeq)}`
                 : `${apiBase}/products/catalog`;
 
-            const response = await fetch(url, {
-                headers: token
-                    ? { 'Authorization': `Bearer ${token}`, 'Content-Type': 'application/json' }
-                    : { 'Content-Type': 'application/json' }
-            });
+            const headers = token
+                ? { 'Authorization': `Bearer ${token}`, 'Content-Type': 'application/json' }
+                : { 'Content-Type': 'application/json' };
+            if (sinceSeq !== null && lastEtag) headers['If-None-Match'] = lastEtag.value;
+
+            const response = await fetch(url, { headers });
+
+            // Sin cambios desde la última versión
+            if (response.status === 304) {
+                await meta.set('products_last_sync', new Date().toISOString());
+                const total = await this.count();
+                console.log(`[OfflineDB] ✅ Sync: sin cambios, total=${total}`);
+                return { added: 0, updated: 0, removed: 0, total };
+            }
 
             if (!response.ok) throw new Error(`HTTP ${response.status}`);
 
@@ -149,6 +160,11 @@ const OfflineDB = (() => {
             let added = 0, updated = 0, removed = 0;
             const { store, tx } = getStore('products', 'readwrite');
 
+            // Completo: lo que no venga ya no existe en el servidor
+            if (serverData.is_full_sync) {
+                await promisify(store.clear());
+            }
+
             for (const p of productList) {
                 const existing = await promisify(store.get(p.id));
                 store.put({
@@ -176,6 +192,11 @@ const OfflineDB = (() => {
 
             await new Promise((res, rej) => { tx.oncomplete = res; tx.onerror = () => rej(tx.error); });
             await meta.set('products_last_sync', serverTime);
+            if (serverData.seq !== undefined) {
+                await meta.set('products_sync_seq', serverData.seq);
+                const etag = response.headers.get('ETag');
+                if (etag) await meta.set('products_etag', etag);
+            }
 
             const total = await this.count();
             console.log(`[OfflineDB] ✅ Sync: +${added}, ~${updated}, -${removed}, total=${total}`);
@@ -261,6 +282,8 @@ const OfflineDB = (() => {
             const { store } = getStore('products', 'readwrite');
             await promisify(store.clear());
             await meta.delete('products_last_sync');
+            await meta.delete('products_sync_seq');
+            await meta.delete('products_etag');
         }
     };
 
@@ -5,7 +5,7 @@
  * 
  * Estrategias:
  *   App Shell (HTML/CSS/JS)  → Cache First + background update
- *   API /products/catalog    → Network First (sync catálogo)
+ *   API /products/catalog    → Network Only (delta sync v2 → IndexedDB)
  *   API /sales, /billing     → Network Only + queue offline
  *   Estáticos (img/fonts)    → Cache First
  *   Otros HTML               → Stale While Revalidate
@@ -19,7 +19,7 @@
 // VERSIÓN Y CACHE
 // ============================================
 
-const SW_VERSION = 'v2.1.0';
+const SW_VERSION = 'v2.2.0';
 const CACHE_SHELL = `quevendi-shell-${SW_VERSION}`;
 const CACHE_ASSETS = `quevendi-assets-${SW_VERSION}`;
 const CACHE_API = `quevendi-api-${SW_VERSION}`;
@@ -149,7 +149,14 @@ self.addEventListener('fetch', (event) => {
 
     // ── ROUTER ──
 
-    // 1. API de catálogo: Network First (necesitamos datos frescos si hay red)
+    // 1. Catálogo offline: Network Only. Las respuestas son deltas sobre
+    // la versión que tiene IndexedDB; reproducir una cacheada la pisaría.
+    if (url.pathname.endsWith('/api/v1/products/catalog')) {
+        event.respondWith(networkOnly(request));
+        return;
+    }
+
+    // API de productos: Network First (necesitamos datos frescos si hay red)
     if (url.pathname.includes('/api/v1/products/')) {
         event.respondWith(networkFirst(request, CACHE_API));
         return;